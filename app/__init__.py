@@ -1,10 +1,38 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.config import COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_ZSTD_LEVEL, PROFILING_ENABLED
+from app.lifespan import lifespan
+from app.middleware.admission import AdmissionMiddleware
+from app.middleware.compression import CompressionMiddleware
+from app.middleware.profiling import ProfilingMiddleware
+from app.middleware.tracing import TracingMiddleware
+from app.responses import FastJSONResponse
 
 app = FastAPI(
     title="FreeIPA API",
     description="API для управления пользователями FreeIPA",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
+)
+
+# Допуск bulk операций: лимиты на воркер и на оператора, 429 при переполнении очереди
+app.add_middleware(AdmissionMiddleware)
+
+# Профилирование отдельных запросов администратором (X-Profile: 1)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Span на каждый запрос (TRACING_EXPORTER); снаружи допуска и профилирования, но внутри сжатия -
+# в длительность входит ожидание допуска, а сжатие ответа нет
+app.add_middleware(TracingMiddleware)
+
+# Сжатие больших ответов (отчёты, результаты bulk операций)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MIN_SIZE,
+    gzip_level=COMPRESSION_GZIP_LEVEL,
+    zstd_level=COMPRESSION_ZSTD_LEVEL,
 )
 
 # CORS middleware для работы с фронтендом
@@ -19,4 +47,4 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-)
\ No newline at end of file
+)
@@ -1,7 +1,9 @@
+import atexit
 import os
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
+from app.observability.log import setup_logging, shutdown_logging
 
 load_dotenv()
 
@@ -25,13 +27,108 @@ PASSWORD_RESET_EMAIL_TEMPLATE = os.getenv(
     "PASSWORD_RESET_EMAIL_TEMPLATE",
     str(BASE_DIR / "templates" / "password_reset_email.txt"),
 )
+# Шаблоны писем: {action}_email.{locale}.txt в каталоге, изменения подхватываются по mtime
+EMAIL_TEMPLATES_DIR = os.getenv("EMAIL_TEMPLATES_DIR", str(BASE_DIR / "templates"))
+EMAIL_DEFAULT_LOCALE = os.getenv("EMAIL_DEFAULT_LOCALE", "ru")
+EMAIL_TEMPLATE_RELOAD_SECONDS = float(os.getenv("EMAIL_TEMPLATE_RELOAD_SECONDS", "5"))
 SESSION_EXPIRATION_MINUTES = 60
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
+# Режим запуска: development (uvicorn с reload) или production (gunicorn + uvicorn воркеры)
+APP_ENV = os.getenv("APP_ENV", "development")
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+SERVER_LOOP = os.getenv("SERVER_LOOP", "auto")  # auto | uvloop | asyncio
+SERVER_HTTP = os.getenv("SERVER_HTTP", "auto")  # auto | httptools | h11
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))
+SERVER_KEEPALIVE = int(os.getenv("SERVER_KEEPALIVE", "5"))
+# Сколько ждать завершения начатых bulk операций при остановке воркера
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "300"))
+# Потоков в пуле для синхронных обработчиков (по умолчанию в Starlette 40)
+SERVER_THREADPOOL_SIZE = int(os.getenv("SERVER_THREADPOOL_SIZE", "40"))
+
+# Разделяемое состояние (сессии) для нескольких воркеров: sqlite или memory
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", str(BASE_DIR / "data" / "conductor.db"))
+
+# Конвейер массового сброса паролей: потоки на стадию и размер очереди между стадиями
+BULK_PIPELINE_IPA_WORKERS = int(os.getenv("BULK_PIPELINE_IPA_WORKERS", "8"))
+BULK_PIPELINE_YOPASS_WORKERS = int(os.getenv("BULK_PIPELINE_YOPASS_WORKERS", "16"))
+BULK_PIPELINE_SMTP_WORKERS = int(os.getenv("BULK_PIPELINE_SMTP_WORKERS", "4"))
+BULK_PIPELINE_QUEUE_SIZE = int(os.getenv("BULK_PIPELINE_QUEUE_SIZE", "64"))
+
+# Адаптивный лимит параллельных вызовов FreeIPA с воркера (AIMD по задержкам)
+IPA_LIMIT_ENABLED = os.getenv("IPA_LIMIT_ENABLED", "true").lower() == "true"
+IPA_LIMIT_INITIAL = int(os.getenv("IPA_LIMIT_INITIAL", "16"))
+IPA_LIMIT_MIN = int(os.getenv("IPA_LIMIT_MIN", "2"))
+IPA_LIMIT_MAX = int(os.getenv("IPA_LIMIT_MAX", "64"))
+IPA_LIMIT_LATENCY_TOLERANCE = float(os.getenv("IPA_LIMIT_LATENCY_TOLERANCE", "2.0"))
+IPA_LIMIT_BACKOFF = float(os.getenv("IPA_LIMIT_BACKOFF", "0.9"))
+IPA_LIMIT_WAIT_TIMEOUT_SECONDS = float(os.getenv("IPA_LIMIT_WAIT_TIMEOUT_SECONDS", "60"))
+
+# Допуск bulk операций: одновременно и очередь ожидания - на воркер (берегут его пул
+# потоков, на хосте до воркеров x значение), на оператора - на все воркеры.
+# BULK_MAX_CONCURRENT - прежнее имя BULK_MAX_CONCURRENT_PER_WORKER
+BULK_MAX_CONCURRENT_PER_WORKER = int(
+    os.getenv("BULK_MAX_CONCURRENT_PER_WORKER", os.getenv("BULK_MAX_CONCURRENT", "4"))
 )
+BULK_MAX_PER_OPERATOR = int(os.getenv("BULK_MAX_PER_OPERATOR", "2"))
+BULK_QUEUE_SIZE = int(os.getenv("BULK_QUEUE_SIZE", "16"))
+BULK_QUEUE_TIMEOUT_SECONDS = float(os.getenv("BULK_QUEUE_TIMEOUT_SECONDS", "30"))
+
+# Сколько элементов отправлять в FreeIPA одним запросом: команд в batch (поиск пользователей)
+# и участников в group_add_member (массовое создание)
+IPA_BATCH_SIZE = int(os.getenv("IPA_BATCH_SIZE", "100"))
+
+# Сколько живёт план массового создания из validate-excel (plan_token)
+CREATE_PLAN_TTL_SECONDS = int(os.getenv("CREATE_PLAN_TTL_SECONDS", "1800"))
+# Сколько живёт результат превью bulk операций (preview_token)
+BULK_PREVIEW_TTL_SECONDS = int(os.getenv("BULK_PREVIEW_TTL_SECONDS", "600"))
+
+# Контрольные точки bulk операций с Idempotency-Key: файл SQLite, сколько хранить
+# и через сколько секунд без записи операция считается оборвавшейся
+BULK_JOBS_DB_PATH = os.getenv("BULK_JOBS_DB_PATH", str(BASE_DIR / "data" / "bulk_jobs.db"))
+BULK_JOBS_TTL_SECONDS = int(os.getenv("BULK_JOBS_TTL_SECONDS", "86400"))
+BULK_JOBS_LEASE_SECONDS = int(os.getenv("BULK_JOBS_LEASE_SECONDS", "120"))
+
+# Максимум клиентов FreeIPA в памяти воркера (LRU) и период фоновой очистки сессий
+IPA_CLIENT_CACHE_SIZE = int(os.getenv("IPA_CLIENT_CACHE_SIZE", "256"))
+SESSION_REAPER_INTERVAL_SECONDS = int(os.getenv("SESSION_REAPER_INTERVAL_SECONDS", "60"))
+
+# Сжатие ответов API (zstd/gzip по Accept-Encoding)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+# Период обновления gauge-метрик (пул потоков, сессии) для /metrics
+METRICS_SAMPLE_INTERVAL_SECONDS = float(os.getenv("METRICS_SAMPLE_INTERVAL_SECONDS", "5"))
+
+# Группа FreeIPA с правом на служебные функции (профилирование запросов)
+ADMIN_GROUP = os.getenv("ADMIN_GROUP", "admins")
+
+# Профилирование запроса по заголовку X-Profile: 1 или ?profile=1 (только ADMIN_GROUP)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+PROFILING_DIR = os.getenv("PROFILING_DIR", str(BASE_DIR / "data" / "profiles"))
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", "900"))
+# Не чаще одного профилируемого запроса за столько секунд (на все воркеры)
+PROFILING_MIN_INTERVAL_SECONDS = int(os.getenv("PROFILING_MIN_INTERVAL_SECONDS", "60"))
+
+# Трассировка: none | console | file | module:callable (свой экспортёр)
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACING_FILE = os.getenv("TRACING_FILE", str(BASE_DIR / "data" / "traces.jsonl"))
+# Доля запросов, попадающих в трассировку (0..1)
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "1.0"))
+# Соль для хеша username в атрибутах span'ов
+TRACING_HASH_SALT = os.getenv("TRACING_HASH_SALT", "")
+
+# Логирование через очередь: запись в stdout в отдельном потоке (app/observability/log.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Выборка частых INFO строк по логгерам, например "app.bulk=0.1"
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_SAMPLING, LOG_QUEUE_SIZE)
+atexit.register(shutdown_logging)
 logger = logging.getLogger(__name__)
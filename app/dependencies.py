@@ -1,20 +1,91 @@
+import threading
 from fastapi import HTTPException, Request
 from python_freeipa import Client
 from datetime import datetime, timedelta
-from app.services.freeipa import create_freeipa_client
-
-# Хранилище сессий (в продакшене используйте Redis или базу)
-user_sessions = {}
-# Словарь для хранения клиентов FreeIPA по сессии
-ipa_clients = {}
+from app.config import (
+    ADMIN_GROUP,
+    IPA_CLIENT_CACHE_SIZE,
+    SESSION_EXPIRATION_MINUTES,
+    STATE_BACKEND,
+    STATE_DB_PATH,
+)
+from app.services.freeipa import ClientCache, create_freeipa_client, get_session_cookie, restore_freeipa_client
+from app.services.storage import create_store
+from app.observability.metrics import SESSIONS_REAPED
+
+# Хранилище сессий, общее для всех воркеров (SQLite по умолчанию, см. STATE_BACKEND)
+session_store = create_store(STATE_BACKEND, STATE_DB_PATH)
+SESSION_NAMESPACE = "session"
+# Клиенты FreeIPA этого воркера по сессии (LRU); при промахе восстанавливаются из cookie в хранилище
+ipa_clients = ClientCache(IPA_CLIENT_CACHE_SIZE)
+# Счётчик удалённых фоновой очисткой записей (сессии и клиенты); очистка идёт в пуле потоков,
+# а статистику читают другие потоки - поэтому под блокировкой
+reaped_total = {"sessions": 0, "clients": 0}
+_reaped_lock = threading.Lock()
+
+
+def save_session(session_id: str, username: str, client: Client, groups: list[str] | None = None) -> datetime:
+    """Сохраняет сессию вместе с cookie FreeIPA и группами пользователя, возвращает время истечения"""
+    now = datetime.now()
+    expires = now + timedelta(minutes=SESSION_EXPIRATION_MINUTES)
+    session_store.put(
+        SESSION_NAMESPACE,
+        session_id,
+        {
+            "username": username,
+            "created": now.timestamp(),
+            "expires": expires.timestamp(),
+            "ipa_cookie": get_session_cookie(client),
+            "groups": groups or [],
+        },
+        ttl=SESSION_EXPIRATION_MINUTES * 60,
+    )
+    ipa_clients.put(session_id, client)
+    return expires
+
+
+def get_session(session_id: str) -> dict | None:
+    """Данные сессии из хранилища или None, если сессии нет или она истекла"""
+    return session_store.get(SESSION_NAMESPACE, session_id)
 
 
 def cleanup_session(session_id: str) -> None:
     """Удаляет сессию и связанный FreeIPA клиент"""
-    if session_id in user_sessions:
-        del user_sessions[session_id]
-    if session_id in ipa_clients:
-        del ipa_clients[session_id]
+    session_store.delete(SESSION_NAMESPACE, session_id)
+    ipa_clients.pop(session_id)
+
+
+def reap_sessions() -> None:
+    """
+    Фоновая очистка: удаляет просроченные записи хранилища и закрывает
+    клиенты FreeIPA, чьи сессии истекли или удалены (в том числе другим воркером)
+
+    Вызывается периодически из lifespan приложения (SESSION_REAPER_INTERVAL_SECONDS)
+    """
+    purged = session_store.purge_expired()
+    SESSIONS_REAPED.inc(purged)
+    clients = 0
+    for session_id in ipa_clients.session_ids():
+        if get_session(session_id) is None:
+            ipa_clients.pop(session_id)
+            clients += 1
+    with _reaped_lock:
+        reaped_total["sessions"] += purged
+        reaped_total["clients"] += clients
+
+
+def get_session_stats() -> dict:
+    """Количество живых сессий и клиентов FreeIPA этого воркера"""
+    with _reaped_lock:
+        reaped = dict(reaped_total)
+    return {
+        "sessions": session_store.count(SESSION_NAMESPACE),
+        "clients": len(ipa_clients),
+        "clients_capacity": ipa_clients.capacity,
+        "clients_evicted_total": ipa_clients.evicted,
+        "sessions_reaped_total": reaped["sessions"],
+        "clients_reaped_total": reaped["clients"],
+    }
 
 
 def authenticate_user(username: str, password: str) -> Client:
@@ -37,10 +108,27 @@ def get_session_username(request: Request) -> str:
     if not session_id:
         return "unknown"
 
-    session_data = user_sessions.get(session_id, {})
+    session_data = get_session(session_id) or {}
     return session_data.get("username", "unknown")
 
 
+def is_admin_session(session_id: str | None) -> bool:
+    """Входит ли владелец сессии в группу ADMIN_GROUP (группы сохраняются при логине)"""
+    if not session_id:
+        return False
+    session_data = get_session(session_id)
+    if session_data is None or datetime.now().timestamp() > session_data["expires"]:
+        return False
+    return ADMIN_GROUP in session_data.get("groups", [])
+
+
+def require_admin(request: Request) -> None:
+    """Пропускает только администраторов (группа ADMIN_GROUP)"""
+    get_user_client(request)
+    if not is_admin_session(request.cookies.get("ipa_session")):
+        raise HTTPException(status_code=403, detail=f"Доступ запрещён: требуется группа {ADMIN_GROUP}")
+
+
 def get_user_client(request: Request) -> Client:
     """Получает клиент FreeIPA для текущего пользователя из сессии"""
     session_id = request.cookies.get("ipa_session")
@@ -48,17 +136,29 @@ def get_user_client(request: Request) -> Client:
     if not session_id:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
-    if session_id not in user_sessions:
+    session_data = get_session(session_id)
+    if session_data is None:
+        ipa_clients.pop(session_id)
         raise HTTPException(status_code=401, detail="Сессия истекла")
 
-    session_data = user_sessions[session_id]
-
     # Проверяем срок действия сессии
-    if datetime.now() > session_data["expires"]:
+    if datetime.now().timestamp() > session_data["expires"]:
         cleanup_session(session_id)
         raise HTTPException(status_code=401, detail="Сессия истекла")
 
-    if session_id not in ipa_clients:
-        raise HTTPException(status_code=401, detail="Ошибка сессии")
-
-    return ipa_clients[session_id]
\ No newline at end of file
+    client = ipa_clients.get(session_id)
+    if client is None:
+        # Сессия создана другим воркером - поднимаем клиент по cookie FreeIPA
+        if not session_data.get("ipa_cookie"):
+            raise HTTPException(status_code=401, detail="Ошибка сессии")
+        client = restore_freeipa_client(session_data["ipa_cookie"])
+        ipa_clients.put(session_id, client)
+    else:
+        cookie = get_session_cookie(client)
+        if cookie and cookie != session_data.get("ipa_cookie"):
+            # FreeIPA выдала новую cookie - делимся ей с остальными воркерами
+            session_data["ipa_cookie"] = cookie
+            remaining = session_data["expires"] - datetime.now().timestamp()
+            session_store.put(SESSION_NAMESPACE, session_id, session_data, ttl=remaining)
+
+    return client
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+import anyio.to_thread
+from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
+from app.config import (
+    logger,
+    METRICS_SAMPLE_INTERVAL_SECONDS,
+    SESSION_REAPER_INTERVAL_SECONDS,
+    SERVER_GRACEFUL_TIMEOUT,
+    SERVER_THREADPOOL_SIZE,
+)
+from app.dependencies import get_session_stats, reap_sessions
+from app.observability import log, tracing
+from app.observability.metrics import (
+    IPA_CLIENTS_CACHED,
+    IPA_CONCURRENCY_LIMIT,
+    LOG_RECORDS_DROPPED,
+    SESSIONS_LIVE,
+    THREADPOOL_IN_USE,
+    THREADPOOL_SIZE,
+)
+from app.services.checkpoints import checkpoint_store
+from app.services.jobs import jobs
+from app.services.limiter import ipa_limiter
+
+# Когда истекает SERVER_GRACEFUL_TIMEOUT остановки воркера (time.monotonic), None - остановка не начата
+shutdown_deadline: float | None = None
+
+
+def start_shutdown() -> None:
+    """Начало мягкой остановки: с этого момента идёт общий срок SERVER_GRACEFUL_TIMEOUT"""
+    global shutdown_deadline
+    shutdown_deadline = time.monotonic() + SERVER_GRACEFUL_TIMEOUT
+
+
+async def session_reaper() -> None:
+    """
+    Периодически чистит истёкшие сессии и закрывает их клиенты FreeIPA,
+    заодно удаляет старые контрольные точки bulk операций
+    """
+    while True:
+        await asyncio.sleep(SESSION_REAPER_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(reap_sessions)
+            await run_in_threadpool(checkpoint_store.purge_expired)
+        except Exception as e:
+            logger.warning("Session reaper failed: %s", e)
+
+
+async def metrics_sampler() -> None:
+    """Периодически обновляет gauge-метрики: занятость пула потоков, сессии, клиенты и лимит FreeIPA"""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    while True:
+        THREADPOOL_IN_USE.set(limiter.borrowed_tokens)
+        THREADPOOL_SIZE.set(limiter.total_tokens)
+        LOG_RECORDS_DROPPED.set(log.dropped_total)
+        if ipa_limiter is not None:
+            IPA_CONCURRENCY_LIMIT.set(int(ipa_limiter.limit))
+        try:
+            stats = await run_in_threadpool(get_session_stats)
+            SESSIONS_LIVE.set(stats["sessions"])
+            IPA_CLIENTS_CACHED.set(stats["clients"])
+        except Exception as e:
+            logger.warning("Metrics sampler failed: %s", e)
+        await asyncio.sleep(METRICS_SAMPLE_INTERVAL_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Фоновые задачи на время жизни воркера"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = SERVER_THREADPOOL_SIZE
+    tasks = [asyncio.create_task(session_reaper()), asyncio.create_task(metrics_sampler())]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await drain_bulk_jobs()
+        tracing.flush()
+
+
+async def drain_bulk_jobs() -> None:
+    """
+    Дожидается завершения начатых bulk операций перед остановкой воркера
+
+    Ждёт только остаток срока после ожидания соединений uvicorn (start_shutdown);
+    без него (режим разработки) - весь SERVER_GRACEFUL_TIMEOUT.
+    """
+    active = jobs.active()
+    if not active:
+        return
+    timeout = SERVER_GRACEFUL_TIMEOUT
+    if shutdown_deadline is not None:
+        timeout = max(shutdown_deadline - time.monotonic(), 0)
+    logger.info("Shutdown: waiting up to %.0fs for %s bulk jobs: %s", timeout, len(active), ", ".join(job.kind for job in active))
+    if await run_in_threadpool(jobs.wait_idle, timeout):
+        logger.info("Shutdown: all bulk jobs finished")
+    else:
+        logger.warning("Shutdown: %s bulk jobs still running after %.0fs", len(jobs.active()), timeout)
@@ -0,0 +1,61 @@
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import logger
+from app.dependencies import get_session
+from app.responses import FastJSONResponse
+from app.services.admission import AdmissionRejected, admission
+
+# Маршруты, которые обрабатывают списки пользователей целиком
+BULK_PATH_PREFIXES = (
+    "/api/v1/users/bulk-",
+    "/api/v1/users/validate-excel",
+)
+
+REJECT_MESSAGES = {
+    "operator": "Слишком много ваших массовых операций выполняется одновременно",
+    "queue-full": "Очередь массовых операций заполнена",
+    "timeout": "Массовая операция не дождалась очереди",
+}
+
+
+def is_bulk_request(scope: Scope) -> bool:
+    return scope["method"] == "POST" and scope["path"].startswith(BULK_PATH_PREFIXES)
+
+
+def _session_operator(session_id: str | None) -> str:
+    session_data = get_session(session_id) if session_id else None
+    return (session_data or {}).get("username", "unknown")
+
+
+class AdmissionMiddleware:
+    """
+    Пропускает bulk запросы через допуск (app/services/admission.py)
+
+    Отклонённый запрос получает 429 с Retry-After; остальные запросы
+    проходят без ожидания.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not is_bulk_request(scope):
+            await self.app(scope, receive, send)
+            return
+
+        session_id = cookie_parser(Headers(scope=scope).get("cookie", "")).get("ipa_session")
+        operator = await run_in_threadpool(_session_operator, session_id)
+        try:
+            async with admission.bulk(operator):
+                await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            logger.warning("Bulk request rejected (%s): %s %s by %s", e.reason, scope["method"], scope["path"], operator)
+            response = FastJSONResponse(
+                {"detail": REJECT_MESSAGES.get(e.reason, "Массовая операция отклонена"), "reason": e.reason},
+                status_code=429,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
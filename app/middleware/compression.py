@@ -0,0 +1,125 @@
+import zstandard
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Уже сжатые форматы (xlsx - это zip) и потоковые события повторно не сжимаем
+EXCLUDED_CONTENT_TYPES = (
+    "text/event-stream",
+    "application/vnd.openxmlformats",
+    "application/zip",
+    "application/gzip",
+    "image/",
+)
+
+
+class _ExcludedTypesMixin:
+    """Пропускает без сжатия ответы с типами из EXCLUDED_CONTENT_TYPES"""
+
+    async def send_with_compression(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            await super().send_with_compression(message)
+            if content_type.startswith(EXCLUDED_CONTENT_TYPES):
+                self.content_type_is_excluded = True
+            return
+        await super().send_with_compression(message)
+
+
+class _IdentityResponder(_ExcludedTypesMixin, IdentityResponder):
+    pass
+
+
+class _GZipResponder(_ExcludedTypesMixin, GZipResponder):
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if more_body:
+            # Как и у zstd: сбрасываем блок (Z_SYNC_FLUSH), иначе NDJSON копится в буфере gzip
+            self.gzip_file.write(body)
+            self.gzip_file.flush()
+            body = self.gzip_buffer.getvalue()
+            self.gzip_buffer.seek(0)
+            self.gzip_buffer.truncate()
+            return body
+        return super().apply_compression(body, more_body=more_body)
+
+
+class _ZstdResponder(_ExcludedTypesMixin, IdentityResponder):
+    content_encoding = "zstd"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, level: int = 3) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        data = self.compressor.compress(body)
+        if more_body:
+            # Сбрасываем блок, чтобы потоковые ответы доходили до клиента частями
+            return data + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return data + self.compressor.flush()
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """
+    Выбирает кодировку сжатия по заголовку Accept-Encoding
+
+    zstd предпочтительнее gzip: при том же размере жмёт в несколько раз быстрее.
+    Кодировки с q=0 считаются запрещёнными.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+
+    for encoding in ("zstd", "gzip"):
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Сжатие ответов с согласованием кодировки (zstd или gzip)
+
+    Ответы меньше minimum_size отдаются как есть. Логика буферизации и
+    стриминга взята из starlette GZipMiddleware, здесь только выбор кодировки.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        zstd_level: int = 3,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        encoding = choose_encoding(headers.get("Accept-Encoding", ""))
+
+        if encoding == "zstd":
+            responder = _ZstdResponder(self.app, self.minimum_size, level=self.zstd_level)
+        elif encoding == "gzip":
+            responder = _GZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level)
+        else:
+            responder = _IdentityResponder(self.app, self.minimum_size)
+
+        await responder(scope, receive, send)
@@ -0,0 +1,80 @@
+import time
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders, QueryParams
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import logger, PROFILING_MIN_INTERVAL_SECONDS
+from app.dependencies import is_admin_session, session_store
+from app.observability.profiling import create_profiler, new_profile_id, profiling, save_profile
+
+PROFILING_NAMESPACE = "profiling"
+
+
+def profiling_requested(scope: Scope) -> bool:
+    if Headers(scope=scope).get("x-profile", "").lower() in ("1", "true"):
+        return True
+    return QueryParams(scope.get("query_string", b"")).get("profile", "").lower() in ("1", "true")
+
+
+def acquire_profiling_slot() -> bool:
+    """
+    Ограничение частоты: один профилируемый запрос за PROFILING_MIN_INTERVAL_SECONDS
+    на все воркеры (метка с TTL в общем хранилище, ставится атомарно)
+    """
+    return session_store.put_if_absent(
+        PROFILING_NAMESPACE, "last", {"started": time.time()}, ttl=PROFILING_MIN_INTERVAL_SECONDS
+    )
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует запрос с заголовком X-Profile: 1 или параметром ?profile=1
+
+    Только для сессий администраторов и не чаще PROFILING_MIN_INTERVAL_SECONDS.
+    Ответ не меняется: в заголовке X-Profile-Id приходит id профиля, сам профиль
+    отдаёт GET /api/v1/profiles/{id}. Если профилирование не состоялось,
+    причина - в заголовке X-Profile-Status (forbidden, rate-limited).
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        session_id = cookie_parser(Headers(scope=scope).get("cookie", "")).get("ipa_session")
+        if not await run_in_threadpool(is_admin_session, session_id):
+            await self.app(scope, receive, _with_headers(send, {"X-Profile-Status": "forbidden"}))
+            return
+        if not await run_in_threadpool(acquire_profiling_slot):
+            await self.app(scope, receive, _with_headers(send, {"X-Profile-Status": "rate-limited"}))
+            return
+
+        profile_id = new_profile_id()
+        profiler = create_profiler(scope)
+        profiler.start()
+        try:
+            with profiling(profiler):
+                await self.app(scope, receive, _with_headers(send, {"X-Profile-Id": profile_id}))
+        finally:
+            profiler.stop()
+            await run_in_threadpool(save_profile, profile_id, profiler)
+            logger.info(
+                "Profile %s: %s %s, %s samples in %.2fs",
+                profile_id, scope["method"], scope["path"], profiler.samples, profiler.duration,
+            )
+
+
+def _with_headers(send: Send, headers: dict[str, str]) -> Send:
+    async def send_with_headers(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            response_headers = MutableHeaders(scope=message)
+            for key, value in headers.items():
+                response_headers[key] = value
+        await send(message)
+
+    return send_with_headers
@@ -0,0 +1,52 @@
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.observability.tracing import span
+
+
+def parse_traceparent(value: str | None) -> tuple[str | None, str | None]:
+    """trace_id и parent span_id из W3C заголовка traceparent (00-<trace>-<span>-<flags>)"""
+    if not value:
+        return None, None
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+class TracingMiddleware:
+    """
+    Корневой span на каждый HTTP запрос
+
+    Продолжает внешнюю трассу из traceparent и возвращает trace id
+    в заголовке X-Trace-Id, чтобы по нему найти трассу запроса.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id = parse_traceparent(Headers(scope=scope).get("traceparent"))
+        with span(
+            "http.request",
+            trace_id=trace_id,
+            parent_id=parent_id,
+            method=scope["method"],
+            path=scope["path"],
+        ) as request_span:
+
+            async def send_with_trace_id(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    request_span.set("status_code", message["status"])
+                    if request_span.trace_id:
+                        MutableHeaders(scope=message)["X-Trace-Id"] = request_span.trace_id
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace_id)
+            route = scope.get("route")
+            if route is not None:
+                request_span.set("route", route.path)
@@ -1,5 +1,6 @@
+from dataclasses import dataclass, field
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 class UserCreate(BaseModel):
     first_name: str
@@ -7,4 +8,79 @@ class UserCreate(BaseModel):
     email: EmailStr
     title: str = None
     phone: str = None
-    groups: list[str] = []
\ No newline at end of file
+    groups: list[str] = []
+
+
+def _first(value: Any, default: Any = "") -> Any:
+    """Первое значение атрибута FreeIPA (атрибуты приходят списками, иногда скаляром)"""
+    if value.__class__ is list:
+        return value[0] if value else default
+    return default if value is None else value
+
+
+def _is_locked(value: Any) -> bool:
+    """nsaccountlock приходит как bool, как [bool] или строкой 'TRUE' у старых версий"""
+    value = _first(value, False)
+    if value.__class__ is str:
+        return value.upper() == "TRUE"
+    return bool(value)
+
+
+@dataclass(slots=True)
+class UserRecord:
+    """
+    Компактная запись пользователя FreeIPA
+
+    Разбирается один раз из ответа user_show/user_find/user_mod и дальше
+    используется роутерами вместо индексации сырых словарей (u['uid'][0] и т.п.)
+    """
+    username: str
+    first_name: str = ""
+    last_name: str = ""
+    email: str = ""
+    phone: str = ""
+    title: str = ""
+    disabled: bool = False
+    groups: List[str] = field(default_factory=list)
+    password_expiration: Any = None
+
+    @classmethod
+    def from_ipa(cls, raw: Dict[str, Any]) -> "UserRecord":
+        get = raw.get
+        return cls(
+            _first(raw["uid"]),
+            _first(get("givenname")),
+            _first(get("sn")),
+            _first(get("mail")),
+            _first(get("telephonenumber")),
+            _first(get("title")),
+            _is_locked(get("nsaccountlock")),
+            get("memberof_group") or [],
+            _first(get("krbpasswordexpiration"), None),
+        )
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.first_name} {self.last_name}".strip()
+
+    @property
+    def status(self) -> str:
+        return "disabled" if self.disabled else "active"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Представление для списков пользователей (поиск)"""
+        return {
+            "username": self.username,
+            "full_name": self.full_name,
+            "email": self.email,
+            "phone": self.phone,
+            "title": self.title,
+            "status": self.status,
+            "groups": self.groups,
+        }
+
+
+def decode_users(raw_users: Optional[List[Dict[str, Any]]]) -> List[UserRecord]:
+    """Разбирает список пользователей из ответа user_find"""
+    from_ipa = UserRecord.from_ipa
+    return [from_ipa(u) for u in raw_users or []]
@@ -0,0 +1,186 @@
+"""
+Неблокирующее логирование
+
+Обработчики запросов только кладут запись в очередь (QueueHandler), а
+форматирование и запись в stdout делает отдельный поток (QueueListener) -
+медленный stdout контейнера не тормозит запросы. Сообщения форматируются
+лениво: logger.info("... %s", value) собирает строку уже в потоке записи,
+а отброшенные выборкой записи не форматируются вовсе.
+
+Структурные поля передаются через extra (см. fields()): operator, action,
+target, duration_ms - в JSON формате они становятся отдельными ключами.
+"""
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict
+
+import orjson
+
+# Поля записи, которые JSON форматтер выносит в отдельные ключи
+STRUCTURED_FIELDS = ("operator", "action", "target", "duration_ms", "count", "outcome", "trace_id")
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Сколько записей отброшено из-за переполнения очереди (очередь не должна блокировать запросы)
+dropped_total = 0
+
+
+def fields(
+    action: str,
+    operator: str | None = None,
+    target: Any = None,
+    duration: float | None = None,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """Структурные поля для extra= (duration в секундах пишется как duration_ms)"""
+    result: Dict[str, Any] = {"action": action, **extra}
+    if operator is not None:
+        result["operator"] = operator
+    if target is not None:
+        result["target"] = target
+    if duration is not None:
+        result["duration_ms"] = round(duration * 1000, 1)
+    return result
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+            + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in STRUCTURED_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                data[name] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(data, default=str).decode()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю записей уровня ниже WARNING от выбранных логгеров
+
+    rates: {"app.bulk": 0.1} - 10% записей app.bulk и его дочерних логгеров.
+    Предупреждения и ошибки не отбрасываются никогда.
+    """
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name = record.name
+        while True:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return random.random() < rate
+            if "." not in name:
+                return True
+            name = name.rsplit(".", 1)[0]
+
+
+class TraceContextFilter(logging.Filter):
+    """Добавляет trace id текущего запроса (запоминается в потоке запроса, до очереди)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        tracing = sys.modules.get("app.observability.tracing")
+        if tracing is not None and getattr(record, "trace_id", None) is None:
+            record.trace_id = tracing.current_trace_id()
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler без форматирования в потоке запроса
+
+    Стандартный prepare() собирает сообщение сразу; здесь запись уходит
+    в очередь как есть, а при переполнении очереди отбрасывается.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global dropped_total
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_total += 1
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """'app.bulk=0.1,app.jobs=0.5' -> {"app.bulk": 0.1, "app.jobs": 0.5}"""
+    rates = {}
+    for part in spec.split(","):
+        if "=" in part:
+            name, rate = part.split("=", 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+class _Pipeline:
+    def __init__(self, handler: NonBlockingQueueHandler, target: logging.Handler, queue_size: int) -> None:
+        self.handler = handler
+        self.target = target
+        self.queue_size = queue_size
+        self.listener: QueueListener | None = None
+
+    def start(self) -> None:
+        self.handler.queue = queue.Queue(self.queue_size)
+        self.listener = QueueListener(self.handler.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self) -> None:
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+_pipeline: _Pipeline | None = None
+
+
+def setup_logging(level: str = "INFO", fmt: str = "json", sampling: str = "", queue_size: int = 10000) -> None:
+    """
+    Настраивает корневой логгер: очередь + поток записи в stdout
+
+    После fork (воркеры gunicorn) поток записи в дочернем процессе
+    запускается заново со своей очередью.
+    """
+    global _pipeline
+    if _pipeline is not None:
+        return
+
+    target = logging.StreamHandler(sys.stdout)
+    target.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+    handler.addFilter(SamplingFilter(parse_sampling(sampling)))
+    handler.addFilter(TraceContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    _pipeline = _Pipeline(handler, target, queue_size)
+    _pipeline.start()
+    os.register_at_fork(after_in_child=_pipeline.start)
+
+
+def shutdown_logging() -> None:
+    """Дописывает оставшиеся в очереди записи (при остановке воркера)"""
+    if _pipeline is not None:
+        _pipeline.stop()
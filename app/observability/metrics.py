@@ -0,0 +1,192 @@
+"""
+Метрики Prometheus
+
+Отдаются на GET /metrics (app/routers/metrics.py). При нескольких воркерах
+gunicorn нужно задать PROMETHEUS_MULTIPROC_DIR (пустой каталог) - тогда
+значения всех воркеров суммируются при отдаче.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Границы для вызовов внешних сервисов: от единиц миллисекунд до десятков секунд
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+JOB_SIZE_BUCKETS = (1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+JOB_DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+IPA_REQUEST_SECONDS = Histogram(
+    "conductor_ipa_request_seconds",
+    "Длительность JSON-RPC вызовов FreeIPA",
+    ["method", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+IPA_CONCURRENCY_LIMIT = Gauge(
+    "conductor_ipa_concurrency_limit",
+    "Текущий адаптивный лимит параллельных вызовов FreeIPA",
+    multiprocess_mode="livesum",
+)
+IPA_INFLIGHT = Gauge(
+    "conductor_ipa_inflight",
+    "Выполняющиеся вызовы FreeIPA",
+    multiprocess_mode="livesum",
+)
+IPA_LIMITER_WAIT_SECONDS = Histogram(
+    "conductor_ipa_limiter_wait_seconds",
+    "Ожидание места в лимите вызовов FreeIPA",
+    buckets=LATENCY_BUCKETS,
+)
+YOPASS_LINK_SECONDS = Histogram(
+    "conductor_yopass_link_seconds",
+    "Длительность создания Yopass ссылки",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+SMTP_SEND_SECONDS = Histogram(
+    "conductor_smtp_send_seconds",
+    "Длительность отправки письма через SMTP",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+EXCEL_PARSE_SECONDS = Histogram(
+    "conductor_excel_parse_seconds",
+    "Длительность разбора Excel файла",
+    ["kind"],
+    buckets=LATENCY_BUCKETS,
+)
+BULK_JOB_SIZE = Histogram(
+    "conductor_bulk_job_size",
+    "Количество элементов в bulk операции",
+    ["route"],
+    buckets=JOB_SIZE_BUCKETS,
+)
+BULK_JOB_SECONDS = Histogram(
+    "conductor_bulk_job_seconds",
+    "Длительность bulk операции",
+    ["route"],
+    buckets=JOB_DURATION_BUCKETS,
+)
+BULK_ITEMS = Counter(
+    "conductor_bulk_items_total",
+    "Результаты по элементам bulk операций",
+    ["route", "outcome"],
+)
+PIPELINE_STAGE_SECONDS = Histogram(
+    "conductor_pipeline_stage_seconds",
+    "Длительность обработки элемента на стадии bulk конвейера",
+    ["route", "stage", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+PIPELINE_QUEUE_DEPTH = Gauge(
+    "conductor_pipeline_queue_depth",
+    "Элементы, ожидающие стадию bulk конвейера",
+    ["stage"],
+    multiprocess_mode="livesum",
+)
+PIPELINE_STAGE_BUSY = Gauge(
+    "conductor_pipeline_stage_busy",
+    "Занятые потоки стадии bulk конвейера",
+    ["stage"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_REJECTED = Counter(
+    "conductor_admission_rejected_total",
+    "Bulk операции, отклонённые допуском (429)",
+    ["reason"],
+)
+ADMISSION_QUEUED = Gauge(
+    "conductor_admission_queued",
+    "Bulk операции, ожидающие допуска",
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "conductor_admission_wait_seconds",
+    "Ожидание допуска bulk операцией",
+    buckets=LATENCY_BUCKETS,
+)
+BULK_JOBS_ACTIVE = Gauge(
+    "conductor_bulk_jobs_active",
+    "Выполняющиеся bulk операции",
+    multiprocess_mode="livesum",
+)
+THREADPOOL_IN_USE = Gauge(
+    "conductor_threadpool_in_use",
+    "Занятые потоки пула для синхронных обработчиков",
+    multiprocess_mode="livesum",
+)
+THREADPOOL_SIZE = Gauge(
+    "conductor_threadpool_size",
+    "Размер пула потоков для синхронных обработчиков",
+    multiprocess_mode="livesum",
+)
+SESSIONS_LIVE = Gauge(
+    "conductor_sessions_live",
+    "Живые сессии операторов (общие для всех воркеров)",
+    multiprocess_mode="max",
+)
+IPA_CLIENTS_CACHED = Gauge(
+    "conductor_ipa_clients_cached",
+    "Клиенты FreeIPA в памяти воркеров",
+    multiprocess_mode="livesum",
+)
+IPA_CLIENTS_EVICTED = Counter(
+    "conductor_ipa_clients_evicted_total",
+    "Клиенты FreeIPA, вытесненные из LRU кеша",
+)
+LOG_RECORDS_DROPPED = Gauge(
+    "conductor_log_records_dropped",
+    "Записи лога, отброшенные из-за переполнения очереди логирования",
+    multiprocess_mode="livesum",
+)
+SESSIONS_REAPED = Counter(
+    "conductor_sessions_reaped_total",
+    "Истёкшие сессии, удалённые фоновой очисткой",
+)
+
+
+@contextmanager
+def observe(histogram: Histogram, **labels: str) -> Iterator[None]:
+    """
+    Замеряет длительность блока в histogram
+
+    Если у гистограммы есть метка outcome, она выставляется в ok/error по результату
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        if "outcome" in histogram._labelnames:
+            labels["outcome"] = outcome
+        histogram.labels(**labels).observe(time.perf_counter() - started)
+
+
+def record_bulk_outcomes(route: str, results: Dict[str, Any]) -> None:
+    """Считает элементы bulk операции по результатам (success/failed/already)"""
+    for outcome, items in results.items():
+        if isinstance(items, list):
+            BULK_ITEMS.labels(route=route, outcome=outcome).inc(len(items))
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Текст метрик в формате Prometheus и его content-type"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,167 @@
+"""
+Профилирование отдельного запроса по требованию
+
+Сэмплирующий профайлер без внешних зависимостей: фоновый поток раз в
+PROFILING_INTERVAL_MS снимает стеки всех потоков (sys._current_frames) и
+оставляет только те, что обслуживают профилируемый запрос: в стеке есть
+кадр с его ASGI scope или объектом Request (поток event loop или поток из
+пула для синхронного обработчика) либо поток помечен request_thread() -
+так помечаются потоки, которые запрос запускает сам (стадии конвейера bulk
+операций). Профилировщик запроса передаётся в такие потоки через contextvar.
+
+Результат сохраняется в формате collapsed stacks ("a;b;c 42") - его
+понимают flamegraph.pl, inferno и speedscope.
+"""
+import os
+import re
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Iterator
+
+from app.config import PROFILING_DIR, PROFILING_INTERVAL_MS, PROFILING_MAX_SECONDS
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# Префиксы путей, которые отрезаем в именах кадров: site-packages, stdlib, корень проекта
+_PATH_PREFIXES = sorted(
+    {
+        sysconfig.get_paths()["purelib"],
+        sysconfig.get_paths()["platlib"],
+        sysconfig.get_paths()["stdlib"],
+        str(Path(__file__).resolve().parents[2]),
+    },
+    key=len,
+    reverse=True,
+)
+
+
+def _short_path(filename: str) -> str:
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            return filename[len(prefix):].lstrip(os.sep)
+    return filename
+
+
+class SamplingProfiler:
+    """Снимает стеки потоков, обслуживающих один запрос (по его ASGI scope)"""
+
+    def __init__(self, scope: dict, interval: float, max_seconds: float) -> None:
+        self.scope = scope
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.samples = 0
+        self.stacks: Counter[str] = Counter()
+        # Потоки, помеченные request_thread(), - их стеки берутся целиком
+        self.threads: set[int] = set()
+        self._labels: dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self.started = time.monotonic()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.monotonic() - self.started
+
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.max_seconds
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self._sample(frame, thread_id in self.threads)
+
+    def _belongs_to_request(self, frame) -> bool:
+        local_vars = frame.f_locals
+        if local_vars.get("scope") is self.scope:
+            return True
+        request = local_vars.get("request")
+        return getattr(request, "scope", None) is self.scope
+
+    def _sample(self, frame, matched: bool) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f"{code.co_qualname} ({_short_path(code.co_filename)})"
+            stack.append(label)
+            if not matched and self._belongs_to_request(frame):
+                matched = True
+            frame = frame.f_back
+        if matched:
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def to_collapsed(self) -> str:
+        """Стеки в формате collapsed stacks для flamegraph"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# Профилировщик запроса, который выполняется в текущем контексте
+_current_profiler: ContextVar[SamplingProfiler | None] = ContextVar("current_profiler", default=None)
+
+
+@contextmanager
+def profiling(profiler: SamplingProfiler) -> Iterator[None]:
+    """Делает профилировщик текущим для запроса (и потоков, получивших копию контекста)"""
+    token = _current_profiler.set(profiler)
+    try:
+        yield
+    finally:
+        _current_profiler.reset(token)
+
+
+@contextmanager
+def request_thread() -> Iterator[None]:
+    """Помечает текущий поток как работающий на запрос, если запрос профилируется"""
+    profiler = _current_profiler.get()
+    if profiler is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    profiler.threads.add(thread_id)
+    try:
+        yield
+    finally:
+        profiler.threads.discard(thread_id)
+
+
+def new_profile_id() -> str:
+    return uuid.uuid4().hex
+
+
+def profile_path(profile_id: str) -> Path:
+    return Path(PROFILING_DIR) / f"{profile_id}.folded"
+
+
+def save_profile(profile_id: str, profiler: SamplingProfiler) -> Path:
+    path = profile_path(profile_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(profiler.to_collapsed(), encoding="utf-8")
+    return path
+
+
+def load_profile(profile_id: str) -> str | None:
+    """Профиль по id или None; id проверяется, чтобы не выйти за пределы PROFILING_DIR"""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = profile_path(profile_id)
+    if not path.is_file():
+        return None
+    return path.read_text(encoding="utf-8")
+
+
+def create_profiler(scope: dict) -> SamplingProfiler:
+    return SamplingProfiler(scope, PROFILING_INTERVAL_MS / 1000, PROFILING_MAX_SECONDS)
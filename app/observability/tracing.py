@@ -0,0 +1,260 @@
+"""
+Трассировка запросов
+
+Лёгкая замена OpenTelemetry: span на HTTP запрос (app/middleware/tracing.py),
+на каждый идентификатор bulk операции, на каждый вызов FreeIPA, Yopass и SMTP.
+Текущий span хранится в contextvar, поэтому синхронные обработчики в пуле
+потоков (run_in_threadpool копирует контекст) видят span своего запроса.
+
+Законченные span'ы уходят в экспортёр (TRACING_EXPORTER):
+
+- none - трассировка выключена, span() ничего не стоит
+- console - JSON строки в stderr
+- file - JSON строки в TRACING_FILE (для офлайн анализа)
+- module:callable - свой экспортёр, callable возвращает объект с методом export(span)
+"""
+import hashlib
+import importlib
+import os
+import random
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import orjson
+
+from app.config import (
+    TRACING_EXPORTER,
+    TRACING_FILE,
+    TRACING_HASH_SALT,
+    TRACING_SAMPLE_RATE,
+)
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    start: float = field(default_factory=time.time)
+    duration_ms: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "pid": os.getpid(),
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Заглушка, когда трассировка выключена или трасса не попала в выборку"""
+
+    trace_id = None
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+# Текущий span; NOOP_SPAN - трасса не попала в выборку, дочерние span'ы не пишем
+_current: ContextVar[Span | _NoopSpan | None] = ContextVar("conductor_span", default=None)
+
+
+class SpanExporter(ABC):
+    """Базовый экспортёр: получает каждый законченный span"""
+
+    @abstractmethod
+    def export(self, span: Span) -> None:
+        ...
+
+    def flush(self) -> None:
+        """Дописывает накопленное (конец запроса, остановка воркера)"""
+
+
+class StreamExporter(SpanExporter):
+    """
+    Пишет span'ы JSON строками в бинарный поток
+
+    Строки копятся в буфере и записываются одним write по flush() (конец
+    запроса) или при заполнении буфера - так строки разных воркеров
+    не перемешиваются в общем файле.
+    """
+
+    BUFFER_SIZE = 512
+
+    def __init__(self, stream) -> None:
+        self._stream = stream
+        self._buffer: List[bytes] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = orjson.dumps(span.to_dict(), default=str) + b"\n"
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.BUFFER_SIZE:
+                self._write_buffer()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._write_buffer()
+
+    def _write_buffer(self) -> None:
+        if self._buffer:
+            self._get_stream().write(b"".join(self._buffer))
+            self._buffer.clear()
+
+    def _get_stream(self):
+        return self._stream
+
+
+class FileExporter(StreamExporter):
+    """Дописывает span'ы в JSONL файл; каждый процесс открывает файл сам (после fork)"""
+
+    def __init__(self, path: str) -> None:
+        super().__init__(None)
+        self.path = path
+        self._pid = None
+
+    def _get_stream(self):
+        if self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._stream = open(self.path, "ab", buffering=0)
+            self._pid = os.getpid()
+        return self._stream
+
+
+def create_exporter(name: str, path: str) -> SpanExporter | None:
+    """Экспортёр по значению TRACING_EXPORTER, None - трассировка выключена"""
+    if name in ("", "none"):
+        return None
+    if name == "console":
+        return StreamExporter(sys.stderr.buffer)
+    if name == "file":
+        return FileExporter(path)
+    if ":" in name:
+        module_name, attr = name.split(":", 1)
+        return getattr(importlib.import_module(module_name), attr)()
+    raise ValueError(f"Неизвестный TRACING_EXPORTER: {name}")
+
+
+_exporter: SpanExporter | None = create_exporter(TRACING_EXPORTER, TRACING_FILE)
+
+
+def set_exporter(exporter: SpanExporter | None) -> None:
+    """Подменяет экспортёр (None - выключить трассировку)"""
+    global _exporter
+    _exporter = exporter
+
+
+def flush() -> None:
+    if _exporter is not None:
+        _exporter.flush()
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def hash_username(username: str | None) -> str | None:
+    """Короткий хеш username, чтобы в трассах не было персональных данных"""
+    if not username:
+        return None
+    digest = hashlib.sha256(f"{TRACING_HASH_SALT}{username.lower()}".encode()).hexdigest()
+    return digest[:16]
+
+
+def current_trace_id() -> str | None:
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+@contextmanager
+def span(
+    name: str,
+    trace_id: str | None = None,
+    parent_id: str | None = None,
+    **attributes: Any,
+) -> Iterator[Span | _NoopSpan]:
+    """
+    Открывает span - дочерний для текущего или корневой, если текущего нет
+
+    trace_id/parent_id задают продолжение внешней трассы (заголовок traceparent).
+    По выходу ставит атрибут outcome (ok/error), если его не выставили явно.
+    """
+    parent = _current.get()
+    exporter = _exporter
+    if exporter is None or parent is NOOP_SPAN:
+        yield NOOP_SPAN
+        return
+
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    elif trace_id is None and random.random() >= TRACING_SAMPLE_RATE:
+        token = _current.set(NOOP_SPAN)
+        try:
+            yield NOOP_SPAN
+        finally:
+            _current.reset(token)
+        return
+
+    current = Span(
+        name=name,
+        trace_id=trace_id or _new_id(128),
+        span_id=_new_id(64),
+        parent_id=parent_id,
+        attributes={key: value for key, value in attributes.items() if value is not None},
+    )
+    token = _current.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes.setdefault("outcome", "error")
+        current.attributes.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        current.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+        current.attributes.setdefault("outcome", "ok")
+        exporter.export(current)
+        if parent is None:
+            exporter.flush()
+
+
+def traced_items(
+    route: str,
+    identifiers: Iterable[str],
+    results: Optional[Dict[str, Any]] = None,
+) -> Iterator[str]:
+    """
+    Оборачивает цикл bulk операции: тело цикла для каждого идентификатора
+    выполняется внутри своего span'а
+
+    outcome берётся из того, в какой список results (success/failed/already)
+    тело цикла добавило запись.
+    """
+    for identifier in identifiers:
+        with span("bulk.item", route=route, user=hash_username(identifier)) as item:
+            before = {key: len(value) for key, value in (results or {}).items()}
+            yield identifier
+            for key, count in before.items():
+                if len(results[key]) > count:
+                    item.set("outcome", key)
+                    break
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Request, Form, HTTPException
 from fastapi.responses import JSONResponse
-from datetime import datetime, timedelta
 from app.config import logger, SESSION_EXPIRATION_MINUTES
-from app.dependencies import authenticate_user, user_sessions, ipa_clients, cleanup_session
+from app.observability.log import fields
+from app.dependencies import authenticate_user, save_session, cleanup_session, get_session_stats, get_user_client
+from typing import Dict
 import uuid
 
 
@@ -15,7 +16,7 @@ def login(request: Request,
                 ) -> JSONResponse:
     """Аутентификация пользователя в FreeIPA"""
     try:
-        logger.info(f"Login attempt: {username}")
+        logger.info("Login attempt: %s", username, extra=fields("login", username))
         # Аутентифицируем пользователя в FreeIPA
         client = authenticate_user(username, password)
 
@@ -29,19 +30,10 @@ def login(request: Request,
                 detail="Доступ запрещён: требуется группа helpdesk или admins"
             )
 
-        # Создаём сессию
+        # Создаём сессию и сохраняем её вместе с cookie FreeIPA,
+        # чтобы клиент можно было восстановить на любом воркере
         session_id = str(uuid.uuid4())
-        expires = datetime.now() + timedelta(minutes=SESSION_EXPIRATION_MINUTES)
-
-        # Сохраняем данные сессии
-        user_sessions[session_id] = {
-            "username": username,
-            "created": datetime.now(),
-            "expires": expires
-        }
-
-        # Сохраняем клиент FreeIPA
-        ipa_clients[session_id] = client
+        save_session(session_id, username, client, groups)
 
         # Создаём ответ с кукой
         response = JSONResponse(
@@ -61,13 +53,13 @@ def login(request: Request,
             samesite="lax"  # Работает для same-site запросов
         )
 
-        logger.info(f"Login successful: {username}")
+        logger.info("Login successful: %s", username, extra=fields("login", username, outcome="success"))
         return response
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.warning(f"Login failed: {username} - {str(e)}")
+        logger.warning("Login failed: %s - %s", username, e, extra=fields("login", username, outcome="failed"))
         raise HTTPException(status_code=401, detail=f"Ошибка авторизации: {str(e)}")
 
 
@@ -83,3 +75,14 @@ def logout(request: Request) -> JSONResponse:
     response = JSONResponse(content={"status": "logged out"})
     response.delete_cookie("ipa_session", path="/")
     return response
+
+
+@router.get("/api/v1/session/stats")
+def session_stats(request: Request) -> Dict[str, int]:
+    """
+    Статистика сессий и клиентов FreeIPA
+
+    sessions - живые сессии (общие для всех воркеров), clients - клиенты в памяти этого воркера
+    """
+    get_user_client(request)
+    return get_session_stats()
@@ -1,142 +1,236 @@
-from app.dependencies import get_user_client
-from app.services.email import send_password_reset_email
-from app.services.freeipa import resolve_username, get_ipa_domain
-from app.services.yopass import create_yopass_link
+from app.dependencies import get_session_username, get_user_client
+from app.services.checkpoints import Checkpoint, checkpoint_store, open_checkpoint
+from app.services.identifiers import duplicate_entries, normalize_identifiers, resolve_unique
+from app.services.job_export import export_rows, iter_csv, iter_file, write_xlsx
+from app.services.jobs import jobs
+from app.services.password_reset import reset_passwords
+from app.services.freeipa import resolve_users
+from app.services.preview import load_preview, load_preview_state, preview_response
 from app.utils.excel import parse_identifiers_column
-from fastapi import APIRouter, Request, UploadFile, File
-from typing import Dict, List, Any
+from app.observability.log import fields
+from app.observability.tracing import span, traced_items
+from app.config import logger
+from python_freeipa.exceptions import AlreadyActive, AlreadyInactive
+from fastapi import APIRouter, HTTPException, Query, Request, UploadFile, File
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, List, Any, Literal, Optional, Tuple
+import re
+import tempfile
+from urllib.parse import quote
 
 
 router = APIRouter()
 
+
+def resolve_into(
+    client,
+    route: str,
+    identifiers: List[str],
+    results: Dict[str, List[Dict[str, Any]]],
+    checkpoint: Checkpoint,
+    resolved: Dict[str, str] | None = None,
+    with_state: bool = False,
+) -> Tuple[Dict[str, str], Dict[str, bool]]:
+    """
+    Резолвит и схлопывает идентификаторы, ненайденные и повторы дописывает в results
+
+    Возвращает identifier -> username (по одному идентификатору на пользователя)
+    и username -> заблокирован ли. Идентификаторы, чей итог уже есть в
+    контрольной точке, не резолвятся, а их пользователи считаются занятыми -
+    другой идентификатор того же пользователя при повторе попадает в merged.
+    """
+    identifiers, duplicates = normalize_identifiers(identifiers)
+    resolution = resolve_unique(
+        client, route, checkpoint.unfinished(identifiers), resolved, with_state, checkpoint.claimed(identifiers)
+    )
+    for entry in resolution["not_found"]:
+        checkpoint.add(results, "failed", entry)
+    for entry in resolution["merged"]:
+        checkpoint.add(results, "merged", entry)
+    # username повторов: найденные сейчас или в прошлой попытке операции
+    usernames = {entry["identifier"]: entry["username"] for entry in resolution["found"] + resolution["merged"]}
+    for identifier in identifiers:
+        saved = checkpoint.saved(identifier)
+        if saved is not None and saved[1].get("username"):
+            usernames.setdefault(identifier, saved[1]["username"])
+    results["merged"].extend(duplicate_entries(duplicates, usernames))
+    return {entry["identifier"]: entry["username"] for entry in resolution["found"]}, resolution["disabled"]
+
+
+def change_state(
+    client,
+    route: str,
+    identifiers: List[str],
+    results: Dict[str, List[Dict[str, Any]]],
+    resolved: Dict[str, str],
+    disable: bool,
+    error_label: str,
+    checkpoint: Checkpoint,
+    state: Dict[str, bool] | None = None,
+) -> None:
+    """
+    Блокирует или разблокирует пользователей
+
+    Состояние (nsaccountlock) приходит вместе с поиском, поэтому пользователи,
+    уже находящиеся в нужном состоянии, попадают в already без вызова FreeIPA.
+
+    state - состояние из превью (username -> заблокирован ли). С ним состояние
+    заново читается (одним batch) только у тех, кого превью показало уже в
+    нужном состоянии или не видело: остальным команда уходит сразу, а если их
+    состояние успели изменить после превью, FreeIPA отвечает AlreadyInactive /
+    AlreadyActive - такие тоже попадают в already.
+    """
+    usernames, disabled = resolve_into(
+        client, route, identifiers, results, checkpoint, resolved, with_state=not state
+    )
+    if state:
+        recheck = [
+            username for username in dict.fromkeys(usernames.values())
+            if username not in disabled and state.get(username, disable) == disable
+        ]
+        if recheck:
+            with span("bulk.recheck", route=route, count=len(recheck)):
+                records = resolve_users(client, recheck)
+            # Не прочитанные (ошибка batch) остаются без состояния - решит ответ команды
+            disabled.update(
+                (username, record.disabled) for username, record in records.items()
+                if not isinstance(record, Exception)
+            )
+    command = "user_disable" if disable else "user_enable"
+    already = AlreadyInactive if disable else AlreadyActive
+    note = "Уже заблокирован" if disable else "Уже разблокирован"
+    for identifier in traced_items(route, usernames, results):
+        if checkpoint.cancelled():
+            results.setdefault("cancelled", []).append({"identifier": identifier})
+            continue
+        username = usernames[identifier]
+        if disabled.get(username) == disable:
+            checkpoint.add(results, "already", {"identifier": identifier, "username": username, "note": note})
+            continue
+        try:
+            client._request(command, args=[username], params={})
+            checkpoint.add(results, "success", {"identifier": identifier, "username": username})
+        except already:
+            checkpoint.add(results, "already", {"identifier": identifier, "username": username, "note": note})
+        except Exception as e:
+            checkpoint.add(results, "failed", {"identifier": identifier, "error": f"{error_label}: {str(e)}"})
+
+
 @router.post("/api/v1/users/bulk-delete")
 def bulk_delete_users(identifiers: List[str], request: Request) -> Dict[str, List[Dict[str, Any]]]:
     """
     Массовое удаление пользователей
     
-    Принимает username или email
+    Принимает username или email; повторы одного пользователя попадают в merged
 
     ["ivan.ivanov", "petr@test.com", "petya.petrov"]
     """
-    results = {"success": [], "failed": []}
+    results = {"success": [], "failed": [], "merged": []}
     client = get_user_client(request)
-
-    for identifier in identifiers:
-        try:
-            # Находим username (по email или напрямую)
-            username = resolve_username(client, identifier)
-            
-            # Удаляем пользователя
-            client._request("user_del", args=[username], params={})
+    operator = get_session_username(request)
+    checkpoint = open_checkpoint(request, operator, "bulk-delete", identifiers)
+
+    with jobs.track("bulk-delete", len(identifiers), operator, results=results), checkpoint:
+        checkpoint.replay(results)
+        # Находим username (по email или напрямую), повторы схлопываем
+        usernames, _ = resolve_into(client, "bulk-delete", identifiers, results, checkpoint)
+        for identifier in traced_items("bulk-delete", usernames, results):
+            if checkpoint.cancelled():
+                results.setdefault("cancelled", []).append({"identifier": identifier})
+                continue
+            username = usernames[identifier]
+            try:
+                # Удаляем пользователя
+                client._request("user_del", args=[username], params={})
             
-            # Добавляем в успешные
-            results["success"].append({
-                "identifier": identifier,
-                "username": username
-            })
+                # Добавляем в успешные
+                checkpoint.add(results, "success", {
+                    "identifier": identifier,
+                    "username": username
+                })
             
-        except ValueError as e:
-            # Пользователь не найден
-            results["failed"].append({
-                "identifier": identifier,
-                "error": str(e)
-            })
-        except Exception as e:
-            # Любая другая ошибка (FreeIPA, сеть и т.д.)
-            results["failed"].append({
-                "identifier": identifier,
-                "error": f"Ошибка удаления: {str(e)}"
-            })
+            except Exception as e:
+                # Любая ошибка FreeIPA, сети и т.д.
+                checkpoint.add(results, "failed", {
+                    "identifier": identifier,
+                    "error": f"Ошибка удаления: {str(e)}"
+                })
 
     return results
 
 
 @router.post("/api/v1/users/bulk-disable")
-def bulk_disable_users(identifiers: List[str], request: Request) -> Dict[str, List[Dict[str, Any]]]:
+def bulk_disable_users(
+    identifiers: List[str],
+    request: Request,
+    preview_token: Optional[str] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
     """
     Массовое отключение пользователей
 
-    Принимает username или email
+    Принимает username или email; повторы одного пользователя попадают в merged
 
     ["ivan.ivanov", "petr@test.com", "petya.petrov"]
+
+    Уже заблокированные попадают в already без вызова FreeIPA. preview_token из
+    bulk-disable-preview(-list) - username и состояние берутся из превью, заново
+    читается только состояние тех, кого превью показало уже в нужном состоянии
     """
-    results = {"success": [], "failed": [], "already": []}
+    results = {"success": [], "failed": [], "already": [], "merged": []}
     client = get_user_client(request)
+    operator = get_session_username(request)
+    resolved, state = load_preview_state(preview_token, operator)
+    checkpoint = open_checkpoint(request, operator, "bulk-disable", identifiers)
 
-    for identifier in identifiers:
-        username = None
-        try:
-            username = resolve_username(client, identifier)
-            client._request("user_disable", args=[username], params={})
-            results["success"].append({
-                "identifier": identifier,
-                "username": username
-            })
-        except ValueError as e:
-            results["failed"].append({
-                "identifier": identifier,
-                "error": str(e)
-            })
-        except Exception as e:
-            if "already disabled" in str(e).lower():
-                results["already"].append({
-                    "identifier": identifier,
-                    "username": username or identifier,
-                    "note": "Уже заблокирован"
-                })
-            else:
-                results["failed"].append({
-                    "identifier": identifier,
-                    "error": f"Ошибка отключения: {str(e)}"
-                })
+    with jobs.track("bulk-disable", len(identifiers), operator, results=results), checkpoint:
+        checkpoint.replay(results)
+        change_state(
+            client, "bulk-disable", identifiers, results, resolved, True, "Ошибка отключения", checkpoint, state
+        )
 
     return results
 
 
 @router.post("/api/v1/users/bulk-enable")
-def bulk_enable_users(identifiers: List[str], request: Request) -> Dict[str, List[Dict[str, Any]]]:
+def bulk_enable_users(
+    identifiers: List[str],
+    request: Request,
+    preview_token: Optional[str] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
     """
     Массовое включение пользователей
 
-    Принимает username или email
+    Принимает username или email; повторы одного пользователя попадают в merged
 
     ["ivan.ivanov", "petr@test.com", "petya.petrov"]
+
+    Уже разблокированные попадают в already без вызова FreeIPA. preview_token из
+    bulk-disable-preview(-list) - username и состояние берутся из превью, заново
+    читается только состояние тех, кого превью показало уже в нужном состоянии
     """
-    results = {"success": [], "failed": [], "already": []}
+    results = {"success": [], "failed": [], "already": [], "merged": []}
     client = get_user_client(request)
+    operator = get_session_username(request)
+    resolved, state = load_preview_state(preview_token, operator)
+    checkpoint = open_checkpoint(request, operator, "bulk-enable", identifiers)
 
-    for identifier in identifiers:
-        username = None
-        try:
-            username = resolve_username(client, identifier)
-            client._request("user_enable", args=[username], params={})
-            results["success"].append({
-                "identifier": identifier,
-                "username": username
-            })
-        except ValueError as e:
-            results["failed"].append({
-                "identifier": identifier,
-                "error": str(e)
-            })
-        except Exception as e:
-            if "already enabled" in str(e).lower():
-                results["already"].append({
-                    "identifier": identifier,
-                    "username": username or identifier,
-                    "note": "Уже разблокирован"
-                })
-            else:
-                results["failed"].append({
-                    "identifier": identifier,
-                    "error": f"Ошибка включения: {str(e)}"
-                })
+    with jobs.track("bulk-enable", len(identifiers), operator, results=results), checkpoint:
+        checkpoint.replay(results)
+        change_state(
+            client, "bulk-enable", identifiers, results, resolved, False, "Ошибка включения", checkpoint, state
+        )
 
     return results
 
 
 @router.post("/api/v1/users/bulk-reset-password")
-def bulk_reset_password(identifiers: List[str], request: Request, send_email: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+def bulk_reset_password(
+    identifiers: List[str],
+    request: Request,
+    send_email: bool = False,
+    preview_token: Optional[str] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
     """
     Массовый сброс паролей пользователей
 
@@ -145,123 +239,47 @@ def bulk_reset_password(identifiers: List[str], request: Request, send_email: bo
     """
     results = {
         "success": [],
-        "failed": []
+        "failed": [],
+        "merged": []
     }
 
     client = get_user_client(request)
-    domain = get_ipa_domain(client)
-
-    for identifier in identifiers:
-        try:
-            # Находим username (вся логика внутри функции)
-            username = resolve_username(client, identifier)  # ← ВОТ И ВСЁ!
-
-            # Сбрасываем пароль
-            reset_result = client._request(
-                "user_mod",
-                args=[username],
-                params={"random": True}
-            )
-
-            password = reset_result['result']['randompassword']
-            email_list = reset_result['result'].get('mail', [])
-            email = email_list[0] if email_list else ""
-            login = f"{username}@{domain}" if domain else username
-            yopass_link = create_yopass_link(login, password) if send_email else ""
-            expiration = reset_result['result'].get('krbpasswordexpiration', [None])[0]
-            lock_val = reset_result['result'].get('nsaccountlock', False)
-            if isinstance(lock_val, list):
-                lock_val = lock_val[0] if lock_val else False
-
-            email_sent = False
-            email_error = None
-            if send_email:
-                if not email:
-                    email_error = "У пользователя не указан email"
-                else:
-                    try:
-                        send_password_reset_email(
-                            recipient=email,
-                            username=login,
-                            yopass_link=yopass_link,
-                            expiration=expiration,
-                        )
-                        email_sent = True
-                    except Exception as e:
-                        email_error = str(e)
-
-            results["success"].append({
-                "identifier": identifier,
-                "username": username,
-                "email": email,
-                "password": password,
-                "status": "disabled" if lock_val else "active",
-                "email_sent": email_sent,
-                "email_error": email_error
-            })
+    operator = get_session_username(request)
+    resolved = load_preview(preview_token, operator)
+    checkpoint = open_checkpoint(request, operator, "bulk-reset-password", identifiers, send_email)
 
-        except Exception as e:
-            results["failed"].append({
-                "identifier": identifier,
-                "error": str(e)
-            })
+    with jobs.track("bulk-reset-password", len(identifiers), operator, results=results), checkpoint:
+        reset_passwords(
+            client, identifiers, "bulk-reset-password", results,
+            send_email=send_email, with_links=False, resolved=resolved, checkpoint=checkpoint,
+        )
 
     return results
 
 
 @router.post("/api/v1/users/bulk-reset-password-with-yopass")
-def bulk_reset_password_with_yopass(identifiers: List[str], request: Request, send_email: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+def bulk_reset_password_with_yopass(
+    identifiers: List[str],
+    request: Request,
+    send_email: bool = False,
+    preview_token: Optional[str] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
     """
     Массовый сброс паролей из JSON списка с Yopass ссылками
 
     Принимает username или email:
     ["ivan.ivanov", "petr@test.com"]
     """
-    results = {"success": [], "failed": []}
+    results = {"success": [], "failed": [], "merged": []}
     client = get_user_client(request)
-    domain = get_ipa_domain(client)
-    for identifier in identifiers:
-        try:
-            username = resolve_username(client, identifier)
-            reset_result = client._request("user_mod", args=[username], params={"random": True})
-            password = reset_result['result']['randompassword']
-            login = f"{username}@{domain}" if domain else username
-            yopass_link = create_yopass_link(login, password)
-            email_list = reset_result['result'].get('mail', [])
-            email = email_list[0] if email_list else ""
-            expiration = reset_result['result'].get('krbpasswordexpiration', [None])[0]
-            lock_val = reset_result['result'].get('nsaccountlock', False)
-            if isinstance(lock_val, list):
-                lock_val = lock_val[0] if lock_val else False
-
-            email_sent = False
-            email_error = None
-            if send_email:
-                if not email:
-                    email_error = "У пользователя не указан email"
-                else:
-                    try:
-                        send_password_reset_email(
-                            recipient=email,
-                            username=login,
-                            yopass_link=yopass_link,
-                            expiration=expiration,
-                        )
-                        email_sent = True
-                    except Exception as e:
-                        email_error = str(e)
-            results["success"].append({
-                "identifier": identifier,
-                "username": username,
-                "email": email,
-                "password": password,
-                "yopass_link": yopass_link,
-                "status": "disabled" if lock_val else "active",
-                "email_sent": email_sent,
-                "email_error": email_error
-            })
-        except Exception as e:
-            results["failed"].append({"identifier": identifier, "error": str(e)})
+    operator = get_session_username(request)
+    resolved = load_preview(preview_token, operator)
+    checkpoint = open_checkpoint(request, operator, "bulk-reset-password-with-yopass", identifiers, send_email)
+    with jobs.track("bulk-reset-password-with-yopass", len(identifiers), operator, results=results), checkpoint:
+        reset_passwords(
+            client, identifiers, "bulk-reset-password-with-yopass", results,
+            send_email=send_email, resolved=resolved, checkpoint=checkpoint,
+        )
 
     return results
 
@@ -273,27 +291,13 @@ def bulk_disable_preview_list(identifiers: List[str], request: Request) -> Dict[
 
     Принимает username или email:
     ["ivan.ivanov", "petr@test.com"]
+
+    preview_token в ответе передаётся в bulk-disable / bulk-enable / bulk-reset-password*,
+    чтобы не искать пользователей второй раз
     """
-    found = []
-    not_found = []
     client = get_user_client(request)
-
-    for identifier in identifiers:
-        try:
-            username = resolve_username(client, identifier)
-            found.append({"identifier": identifier, "username": username})
-        except ValueError as e:
-            not_found.append({"identifier": identifier, "error": str(e)})
-        except Exception as e:
-            not_found.append({"identifier": identifier, "error": str(e)})
-
-    return {
-        "found": found,
-        "not_found": not_found,
-        "total": len(identifiers),
-        "found_count": len(found),
-        "not_found_count": len(not_found)
-    }
+    resolution = resolve_unique(client, "bulk-disable-preview-list", identifiers)
+    return preview_response(get_session_username(request), identifiers, resolution)
 
 
 @router.post("/api/v1/users/bulk-reset-password-from-excel")
@@ -301,6 +305,7 @@ async def bulk_reset_password_from_excel(
     request: Request,
     file: UploadFile = File(...),
     send_email: bool = False,
+    preview_token: Optional[str] = None,
 ) -> Dict[str, List[Dict[str, Any]]]:
     """
     Массовый сброс паролей из Excel файла
@@ -309,62 +314,24 @@ async def bulk_reset_password_from_excel(
 
     Возвращает Yopass ссылки для каждого пользователя
     """
-    results = {"success": [], "failed": []}
+    results = {"success": [], "failed": [], "merged": []}
     client = get_user_client(request)
-    domain = get_ipa_domain(client)
+
+    operator = get_session_username(request)
+    resolved = await run_in_threadpool(load_preview, preview_token, operator)
 
     contents = await file.read()
     identifiers = parse_identifiers_column(contents)
+    checkpoint = await run_in_threadpool(
+        open_checkpoint, request, operator, "bulk-reset-password-from-excel", contents, send_email
+    )
 
-    for identifier in identifiers:
-        try:
-            username = resolve_username(client, identifier)
-
-            reset_result = client._request("user_mod", args=[username], params={"random": True})
-            password = reset_result['result']['randompassword']
-
-            login = f"{username}@{domain}" if domain else username
-            yopass_link = create_yopass_link(login, password)
-            email_list = reset_result['result'].get('mail', [])
-            email = email_list[0] if email_list else ""
-            expiration = reset_result['result'].get('krbpasswordexpiration', [None])[0]
-            lock_val = reset_result['result'].get('nsaccountlock', False)
-            if isinstance(lock_val, list):
-                lock_val = lock_val[0] if lock_val else False
-
-            email_sent = False
-            email_error = None
-            if send_email:
-                if not email:
-                    email_error = "У пользователя не указан email"
-                else:
-                    try:
-                        send_password_reset_email(
-                            recipient=email,
-                            username=login,
-                            yopass_link=yopass_link,
-                            expiration=expiration,
-                        )
-                        email_sent = True
-                    except Exception as e:
-                        email_error = str(e)
-
-            results["success"].append({
-                "identifier": identifier,
-                "username": username,
-                "email": email,
-                "password": password,
-                "yopass_link": yopass_link,
-                "status": "disabled" if lock_val else "active",
-                "email_sent": email_sent,
-                "email_error": email_error
-            })
-
-        except Exception as e:
-            results["failed"].append({
-                "identifier": identifier,
-                "error": str(e)
-            })
+    with jobs.track("bulk-reset-password-from-excel", len(identifiers), operator, results=results), checkpoint:
+        # Конвейер блокирующий - запускаем в пуле потоков, чтобы не держать event loop
+        await run_in_threadpool(
+            reset_passwords, client, identifiers, "bulk-reset-password-from-excel", results,
+            send_email=send_email, resolved=resolved, checkpoint=checkpoint,
+        )
 
     return results
 
@@ -375,56 +342,118 @@ async def bulk_disable_preview(request: Request, file: UploadFile = File(...)) -
     Dry-run: резолвит пользователей из Excel, ничего не делает в FreeIPA
 
     Колонка A: username или email (строка 1 — заголовок, пропускается)
+
+    preview_token в ответе передаётся в bulk-disable-from-excel и другие операции,
+    чтобы не искать пользователей второй раз
     """
-    found = []
-    not_found = []
     client = get_user_client(request)
 
     contents = await file.read()
     identifiers = parse_identifiers_column(contents)
 
-    for identifier in identifiers:
-        try:
-            username = resolve_username(client, identifier)
-            found.append({"identifier": identifier, "username": username})
-        except ValueError as e:
-            not_found.append({"identifier": identifier, "error": str(e)})
-        except Exception as e:
-            not_found.append({"identifier": identifier, "error": str(e)})
-
-    return {
-        "found": found,
-        "not_found": not_found,
-        "total": len(identifiers),
-        "found_count": len(found),
-        "not_found_count": len(not_found)
-    }
+    resolution = await run_in_threadpool(resolve_unique, client, "bulk-disable-preview", identifiers)
+    return preview_response(get_session_username(request), identifiers, resolution)
 
 
 @router.post("/api/v1/users/bulk-disable-from-excel")
-async def bulk_disable_from_excel(request: Request, file: UploadFile = File(...)) -> Dict[str, List[Dict[str, Any]]]:
+async def bulk_disable_from_excel(
+    request: Request,
+    file: UploadFile = File(...),
+    preview_token: Optional[str] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
     """
     Массовая блокировка пользователей из Excel файла
 
-    Колонка A: username или email (строка 1 — заголовок, пропускается)
+    Колонка A: username или email (строка 1 — заголовок, пропускается);
+    повторы одного пользователя попадают в merged, уже заблокированные - в already
+
+    preview_token из bulk-disable-preview - username и состояние берутся из превью,
+    заново читается только состояние тех, кого превью показало уже заблокированными
     """
-    results = {"success": [], "failed": []}
+    results = {"success": [], "failed": [], "already": [], "merged": []}
     client = get_user_client(request)
+    operator = get_session_username(request)
+    resolved, state = await run_in_threadpool(load_preview_state, preview_token, operator)
 
     contents = await file.read()
     identifiers = parse_identifiers_column(contents)
+    checkpoint = await run_in_threadpool(open_checkpoint, request, operator, "bulk-disable-from-excel", contents)
 
-    for identifier in identifiers:
-        try:
-            username = resolve_username(client, identifier)
-            client._request("user_disable", args=[username], params={})
-            results["success"].append({"identifier": identifier, "username": username})
-        except ValueError as e:
-            results["failed"].append({"identifier": identifier, "error": str(e)})
-        except Exception as e:
-            results["failed"].append({
-                "identifier": identifier,
-                "error": f"Ошибка блокировки: {str(e)}"
-            })
+    with jobs.track("bulk-disable-from-excel", len(identifiers), operator, results=results), checkpoint:
+        checkpoint.replay(results)
+        await run_in_threadpool(
+            change_state, client, "bulk-disable-from-excel", identifiers, results, resolved, True, "Ошибка блокировки",
+            checkpoint, state,
+        )
 
     return results
+
+
+@router.post("/api/v1/bulk-jobs/{job_key}/cancel")
+def cancel_bulk_job(job_key: str, request: Request) -> Dict[str, str]:
+    """
+    Отмена выполняющейся bulk операции по её Idempotency-Key
+
+    Операция (на любом воркере) перестаёт брать новые элементы, начатые
+    вызовы доделываются; ответ самой операции - частичный результат со
+    списком cancelled. Продолжить отменённую операцию можно повтором
+    запроса с тем же ключом.
+    """
+    # Проверка авторизации: отменить можно только свою операцию
+    get_user_client(request)
+    operator = get_session_username(request)
+    if not checkpoint_store.cancel(operator, job_key):
+        raise HTTPException(status_code=404, detail="Операция с этим ключом не выполняется")
+    logger.info("BULK_CANCEL by %s: key %s", operator, job_key[:16], extra=fields("bulk_cancel", operator))
+    return {"job": job_key, "status": "cancelling"}
+
+
+def content_disposition(filename: str) -> str:
+    """
+    Content-Disposition для скачивания файла
+
+    Имя включает Idempotency-Key, а его задаёт клиент: в filename остаются только
+    безопасные ASCII символы, полное имя (если отличается) - в filename* (RFC 6266)
+    """
+    fallback = re.sub(r"[^A-Za-z0-9._-]", "_", filename)
+    if fallback == filename:
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+@router.get("/api/v1/bulk-jobs/{job_key}/export")
+def export_bulk_job(
+    job_key: str,
+    request: Request,
+    export_format: Literal["xlsx", "csv"] = Query("xlsx", alias="format"),
+) -> StreamingResponse:
+    """
+    Результаты bulk операции по её Idempotency-Key файлом XLSX или CSV (?format=csv)
+
+    Строки берутся из контрольной точки операции (в том числе незавершённой
+    или отменённой), память не растёт с числом строк: XLSX пишется write-only
+    книгой во временный файл, CSV отдаётся по мере чтения
+    """
+    get_user_client(request)
+    operator = get_session_username(request)
+    job = checkpoint_store.job(operator, job_key)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Результаты операции с этим ключом не найдены")
+
+    rows = export_rows(checkpoint_store.iter_items(operator, job_key))
+    filename = f"{job['kind']}-{job_key[:8]}.{export_format}"
+    headers = {"Content-Disposition": content_disposition(filename)}
+    if export_format == "csv":
+        return StreamingResponse(iter_csv(rows), media_type="text/csv; charset=utf-8", headers=headers)
+
+    file = tempfile.TemporaryFile()
+    try:
+        write_xlsx(rows, file, job["kind"][:31])
+    except BaseException:
+        file.close()
+        raise
+    return StreamingResponse(
+        iter_file(file),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers=headers,
+    )
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from app.dependencies import require_admin
+from app.observability.profiling import load_profile
+
+router = APIRouter()
+
+
+@router.get("/api/v1/profiles/{profile_id}", response_class=PlainTextResponse)
+def get_profile(profile_id: str, request: Request) -> PlainTextResponse:
+    """
+    Профиль запроса в формате collapsed stacks (id из заголовка X-Profile-Id)
+
+    Построить flamegraph: flamegraph.pl profile.folded > profile.svg
+    или открыть файл в https://www.speedscope.app
+    """
+    require_admin(request)
+    profile = load_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return PlainTextResponse(
+        profile,
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'},
+    )
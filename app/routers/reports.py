@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import StreamingResponse
 from app.dependencies import get_user_client
+from app.models.user import decode_users
+from app.responses import FastJSONResponse
 from typing import List, Dict, Any
 
 router = APIRouter()
@@ -93,24 +95,11 @@ def fullusersgroupsinfo(request: Request) -> StreamingResponse:
         client = get_user_client(request)
         result = client._request("user_find", args=[], params={"all":True})
 
-        user_data = []
         csv_lines = ["username,email,groups"]
 
-        for user in result['result']:
-            username = user['uid'][0]
-            email = user.get('mail', [None])[0]
-            groups = user.get('memberof_group', [])
-
-            user_info = {
-                "username": username,
-                "email": email,
-                "groups": groups
-            }
-            user_data.append(user_info)
-
-            email_str = email or ''
-            groups_str = ';'.join(groups)
-            csv_lines.append(f"{username},{email_str},{groups_str}")
+        for user in decode_users(result['result']):
+            groups_str = ';'.join(user.groups)
+            csv_lines.append(f"{user.username},{user.email},{groups_str}")
 
         csv_content = '\n'.join(csv_lines)
         return StreamingResponse(
@@ -134,7 +123,8 @@ def full_info(request: Request) -> Dict[str, Any]:
         client = get_user_client(request)
         result = client._request("user_find", args=[], params={"all":True})
 
-        return result
+        # Отдаём ответ FreeIPA как есть, без повторной валидации десятков тысяч записей
+        return FastJSONResponse(result)
 
     except Exception as e:
         raise HTTPException(
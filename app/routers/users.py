@@ -1,16 +1,29 @@
 from fastapi import APIRouter, Request, Form, HTTPException, UploadFile, File
-from app.config import logger
-from app.dependencies import user_sessions, get_user_client
+from starlette.concurrency import run_in_threadpool
+from app.config import CREATE_PLAN_TTL_SECONDS, logger
+from app.observability.log import fields
+from app.dependencies import get_session_username, get_user_client
 from app.utils.transliteration import transliterate
-from app.utils.validation import is_valid_email
-from app.utils.excel import parse_excel_row, parse_fio, parse_groups
+from app.utils.excel import load_workbook
 from app.services.email import send_password_reset_email
 from app.services.yopass import create_yopass_link
 from app.services.freeipa import resolve_username, get_ipa_domain
-from app.models.user import UserCreate
+from app.services.checkpoints import open_checkpoint
+from app.services.jobs import jobs
+from app.services.user_import import (
+    RowChecker,
+    check_rows,
+    create_users,
+    excel_rows,
+    load_plan,
+    recheck_plan,
+    save_plan,
+    stream_create_users,
+)
+from app.responses import NDJSONStreamingResponse
+from app.utils.jsonstream import JsonArrayDecoder, NdjsonDecoder
+from app.models.user import UserCreate, UserRecord, decode_users
 from typing import Optional, Dict, Any
-import openpyxl
-from io import BytesIO
 
 
 router = APIRouter()
@@ -46,40 +59,17 @@ def search_users(q: str, request: Request) -> Dict[str, Any]:
 
         # Поиск по uid/имени/фамилии
         by_name = client._request("user_find", args=[q], params={"all": False})
-        raw = {u['uid'][0]: u for u in by_name.get('result', [])}
+        found = {u.username: u for u in decode_users(by_name.get('result'))}
 
         # Дополнительный поиск по email (FreeIPA не включает mail в стандартный criteria)
         try:
             by_mail = client._request("user_find", args=[], params={"mail": q, "all": False})
-            for u in by_mail.get('result', []):
-                uid = u['uid'][0]
-                if uid not in raw:
-                    raw[uid] = u
+            for u in decode_users(by_mail.get('result')):
+                found.setdefault(u.username, u)
         except Exception:
             pass
 
-        def parse_user(u: dict) -> dict:
-            disabled = u.get('nsaccountlock', False)
-            if isinstance(disabled, list):
-                disabled = disabled[0] if disabled else False
-            mail = u.get('mail', [])
-            phone_list = u.get('telephonenumber', [])
-            title_list = u.get('title', [])
-            givenname = u.get('givenname', [])
-            sn = u.get('sn', [])
-            first = givenname[0] if givenname else ""
-            last = sn[0] if sn else ""
-            return {
-                "username": u['uid'][0],
-                "full_name": f"{first} {last}".strip(),
-                "email": mail[0] if mail else "",
-                "phone": phone_list[0] if phone_list else "",
-                "title": title_list[0] if title_list else "",
-                "status": "disabled" if disabled else "active",
-                "groups": u.get('memberof_group', [])
-            }
-
-        users = [parse_user(u) for u in raw.values()]
+        users = [u.to_dict() for u in found.values()]
         return {"users": users, "count": len(users)}
 
     except HTTPException:
@@ -142,14 +132,13 @@ def delete_user(username: str, request: Request) -> Dict[str, str]:
     Использовать с умом т.к безвозвратно удаляет пользователя в FreeIPA
     """
     try:
-        session_id = request.cookies.get("ipa_session")
-        admin = user_sessions.get(session_id, {}).get("username", "unknown")
-        logger.warning(f"USER_DELETE: {username} by {admin}")
+        admin = get_session_username(request)
+        logger.warning("USER_DELETE: %s by %s", username, admin, extra=fields("user_delete", admin, username))
 
         client = get_user_client(request)
         result = client._request("user_del", args=[username], params={})
         
-        logger.info(f"USER_DELETE SUCCESS: {username}")
+        logger.info("USER_DELETE SUCCESS: %s", username, extra=fields("user_delete", admin, username, outcome="success"))
         return {
             "username": username,
             "message": f"Пользователь {username} успешно удалён",
@@ -157,7 +146,7 @@ def delete_user(username: str, request: Request) -> Dict[str, str]:
         }
 
     except Exception as e:
-        logger.error(f"USER_DELETE FAILED: {username} - {str(e)}")
+        logger.error("USER_DELETE FAILED: %s - %s", username, e, extra=fields("user_delete", target=username, outcome="failed"))
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка удаления пользователя: {str(e)}"
@@ -221,22 +210,21 @@ def reset_password(username: str, request: Request, send_email: bool = False) ->
     Вводим только логин УЗ
     """
     try:
-        session_id = request.cookies.get("ipa_session")
-        admin = user_sessions.get(session_id, {}).get("username", "unknown")
-        logger.warning(f"PASSWORD_RESET: {username} by {admin}")
+        admin = get_session_username(request)
+        logger.warning("PASSWORD_RESET: %s by %s", username, admin, extra=fields("password_reset", admin, username))
 
         client = get_user_client(request)
         username = resolve_username(client, username)
         result = client._request("user_mod", args=[username], params={"random": True})
 
         password = result['result']['randompassword']
-        email_list = result['result'].get('mail', [])
-        email = email_list[0] if email_list else ""
+        user = UserRecord.from_ipa(result['result'])
+        email = user.email
 
         domain = get_ipa_domain(client)
         login = f"{username}@{domain}" if domain else username
         yopass_link = create_yopass_link(login, password)
-        expiration = result['result'].get('krbpasswordexpiration', [None])[0]
+        expiration = user.password_expiration
 
         email_sent = False
         email_error = None
@@ -266,11 +254,11 @@ def reset_password(username: str, request: Request, send_email: bool = False) ->
             "message": f"Пароль пользователя {username} успешно сброшен"
         }
 
-        logger.info(f"PASSWORD_RESET SUCCESS: {username}")
+        logger.info("PASSWORD_RESET SUCCESS: %s", username, extra=fields("password_reset", admin, username, outcome="success"))
         return response
 
     except Exception as e:
-        logger.error(f"PASSWORD_RESET FAILED: {username} - {str(e)}")
+        logger.error("PASSWORD_RESET FAILED: %s - %s", username, e, extra=fields("password_reset", target=username, outcome="failed"))
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка сброса пароля: {str(e)}"
@@ -301,9 +289,8 @@ def create_user(user: UserCreate, request: Request) -> Dict[str, Any]:
         username = f"{first_name_en}.{last_name_en}"
         full_name = f"{user.first_name} {user.last_name}"
 
-        session_id = request.cookies.get("ipa_session")
-        admin = user_sessions.get(session_id, {}).get("username", "unknown")
-        logger.info(f"USER_CREATE: {username} ({user.email}) by {admin}")
+        admin = get_session_username(request)
+        logger.info("USER_CREATE: %s (%s) by %s", username, user.email, admin, extra=fields("user_create", admin, username))
 
         client = get_user_client(request)
 
@@ -353,7 +340,7 @@ def create_user(user: UserCreate, request: Request) -> Dict[str, Any]:
                 try:
                     client._request("user_del", args=[username], params={})
                 except Exception as e:
-                    logger.warning(f"Failed to delete user {username} during rollback: {e}")
+                    logger.warning("Failed to delete user %s during rollback: %s", username, e, extra=fields("user_delete", target=username, outcome="failed"))
 
                 raise HTTPException(
                     status_code=500,
@@ -366,13 +353,13 @@ def create_user(user: UserCreate, request: Request) -> Dict[str, Any]:
                 "failed": failed_groups
             }
 
-        logger.info(f"USER_CREATE SUCCESS: {username} with groups {added_groups}")
+        logger.info("USER_CREATE SUCCESS: %s with groups %s", username, added_groups, extra=fields("user_create", admin, username, outcome="success"))
         return response
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"USER_CREATE FAILED: {username} - {str(e)}")
+        logger.error("USER_CREATE FAILED: %s - %s", username, e, extra=fields("user_create", target=username, outcome="failed"))
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/api/v1/users/create-form")
@@ -447,7 +434,7 @@ def create_user_form(
                 try:
                     client._request("user_del", args=[username], params={})
                 except Exception as e:
-                    logger.warning(f"Failed to delete user {username} during rollback: {e}")
+                    logger.warning("Failed to delete user %s during rollback: %s", username, e, extra=fields("user_delete", target=username, outcome="failed"))
                 raise HTTPException(
                     status_code=500,
                     detail=f"Пользователь создан, но не удалось добавить ни в одну группу. Пользователь удален. Ошибки: {failed_groups}"
@@ -537,183 +524,29 @@ async def validate_excel(request: Request, file: UploadFile = File(...)):
     - Существование групп
     - Корректность ФИО (минимум 2 слова)
 
-    Возвращает детальный отчёт БЕЗ создания пользователей
+    Возвращает детальный отчёт БЕЗ создания пользователей и plan_token -
+    его можно передать в bulk-create-from-excel вместе с тем же файлом,
+    чтобы не проверять строки заново
     """
     try:
         # Проверяем авторизацию
         client = get_user_client(request)
 
-        session_id = request.cookies.get("ipa_session")
-        admin = user_sessions.get(session_id, {}).get("username", "unknown")
-        logger.info(f"VALIDATE_EXCEL: Started by {admin}")
+        admin = get_session_username(request)
+        logger.info("VALIDATE_EXCEL: Started by %s", admin, extra=fields("validate_excel", admin))
 
         # Читаем Excel файл
         contents = await file.read()
-        workbook = openpyxl.load_workbook(BytesIO(contents))
-        sheet = workbook.active
-
-        conflicts = []
-        warnings = []
-        would_create = 0
-        emails_in_file = {}  # Для отслеживания дубликатов внутри файла
-
-        # Получаем список всех существующих пользователей из FreeIPA
-        existing_users = client._request("user_find", args=[], params={"all": True})
-        existing_usernames = {u['uid'][0] for u in existing_users['result']}
-
-        # Собираем существующие email (безопасно)
-        existing_emails = set()
-        for u in existing_users['result']:
-            mail = u.get('mail')
-            if mail and isinstance(mail, list) and len(mail) > 0 and mail[0]:
-                existing_emails.add(mail[0].lower())
-
-        # Кэш для проверки групп (чтобы не проверять одну группу несколько раз)
-        groups_cache = {}
-
-        # Проходим по строкам
-        for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            # Пропускаем пустые строки
-            if not row or not row[0]:
-                continue
+        sheet = load_workbook(contents).active
 
-            try:
-                # Извлекаем данные
-                fio = str(row[0]).strip() if row[0] else ""
-                email = str(row[1]).strip() if len(row) > 1 and row[1] else ""
-                phone = str(row[2]).strip() if len(row) > 2 and row[2] else None
-                title = str(row[3]).strip() if len(row) > 3 and row[3] else None
-                groups_str = str(row[4]).strip() if len(row) > 4 and row[4] else ""
-
-                # Проверка 1: ФИО заполнено
-                if not fio:
-                    conflicts.append({
-                        "row": row_num,
-                        "error": "ФИО не заполнено"
-                    })
-                    continue
-
-                # Проверка 2: Email заполнен
-                if not email:
-                    conflicts.append({
-                        "row": row_num,
-                        "fio": fio,
-                        "error": "Email не заполнен"
-                    })
-                    continue
-
-                # Проверка 3: Email валидный
-                if not is_valid_email(email):
-                    conflicts.append({
-                        "row": row_num,
-                        "fio": fio,
-                        "error": f"Невалидный email: {email}"
-                    })
-                    continue
-
-                # Проверка 4: Email дубликат внутри файла
-                email_lower = email.lower()
-                if email_lower in emails_in_file:
-                    conflicts.append({
-                        "row": row_num,
-                        "fio": fio,
-                        "error": f"Дубликат email {email} (уже в строке {emails_in_file[email_lower]})"
-                    })
-                    continue
-                emails_in_file[email_lower] = row_num
-
-                # Парсим ФИО
-                fio_parts = fio.split()
-                if len(fio_parts) < 2:
-                    conflicts.append({
-                        "row": row_num,
-                        "fio": fio,
-                        "error": "ФИО должно содержать минимум Фамилию и Имя"
-                    })
-                    continue
-
-                last_name = fio_parts[0]
-                first_name = fio_parts[1]
-
-                # Генерируем username
-                last_name_en = transliterate(last_name).lower()
-                first_name_en = transliterate(first_name).lower()
-                username = f"{first_name_en}.{last_name_en}"
-
-                # Проверка 5 и 6: Собираем все конфликты для этой строки
-                row_errors = []
-
-                # Проверка 5: Username уже существует в FreeIPA
-                if username in existing_usernames:
-                    row_errors.append(f"Username '{username}' уже существует в FreeIPA")
-
-                # Проверка 6: Email уже существует в FreeIPA
-                if email_lower in existing_emails:
-                    row_errors.append(f"Email '{email}' уже существует в FreeIPA")
-
-                # Если есть конфликты - добавляем и пропускаем строку
-                if row_errors:
-                    conflicts.append({
-                        "row": row_num,
-                        "fio": fio,
-                        "username": username,
-                        "email": email,
-                        "error": "; ".join(row_errors)
-                    })
-                    continue
-
-                # Проверка 7: Существование групп
-                if groups_str:
-                    groups_list = [g.strip() for g in groups_str.split(',') if g.strip()]
-                    non_existing_groups = []
-
-                    for group in groups_list:
-                        # Проверяем кэш
-                        if group not in groups_cache:
-                            try:
-                                client._request("group_show", args=[group])
-                                groups_cache[group] = True
-                            except Exception:
-                                groups_cache[group] = False
-
-                        if not groups_cache[group]:
-                            non_existing_groups.append(group)
-
-                    if non_existing_groups:
-                        conflicts.append({
-                            "row": row_num,
-                            "fio": fio,
-                            "username": username,
-                            "error": f"Группы не существуют: {', '.join(non_existing_groups)}"
-                        })
-                        continue
-
-                # Предупреждения (не блокируют создание)
-                if not phone:
-                    warnings.append({
-                        "row": row_num,
-                        "fio": fio,
-                        "username": username,
-                        "message": "Телефон не заполнен"
-                    })
-
-                if not title:
-                    warnings.append({
-                        "row": row_num,
-                        "fio": fio,
-                        "username": username,
-                        "message": "Должность не заполнена"
-                    })
-
-                # Если всё ок - считаем как валидного
-                would_create += 1
+        checked = await run_in_threadpool(check_rows, client, excel_rows(sheet))
+        conflicts = checked["conflicts"]
+        warnings = checked["warnings"]
+        would_create = len(checked["plan"])
 
-            except Exception as e:
-                conflicts.append({
-                    "row": row_num,
-                    "fio": fio if 'fio' in locals() else "unknown",
-                    "error": f"Неожиданная ошибка: {str(e)}"
-                })
+        plan_token = None
+        if checked["plan"]:
+            plan_token = await run_in_threadpool(save_plan, admin, contents, checked["plan"], conflicts)
 
         # Формируем результат
         total_rows = sheet.max_row - 1  # Минус заголовок
@@ -726,201 +559,165 @@ async def validate_excel(request: Request, file: UploadFile = File(...)):
             "conflicts_count": len(conflicts),
             "warnings_count": len(warnings),
             "conflicts": conflicts,
-            "warnings": warnings
+            "warnings": warnings,
+            "plan_token": plan_token,
+            "plan_expires_in": CREATE_PLAN_TTL_SECONDS if plan_token else None,
         }
 
-        logger.info(f"VALIDATE_EXCEL: Completed by {admin} - Valid: {valid}, Would create: {would_create}, Conflicts: {len(conflicts)}")
+        logger.info(
+            "VALIDATE_EXCEL: Completed by %s - Valid: %s, Would create: %s, Conflicts: %s",
+            admin, valid, would_create, len(conflicts),
+            extra=fields("validate_excel", admin, count=would_create, outcome="valid" if valid else "invalid"),
+        )
         return result
 
     except Exception as e:
-        logger.error(f"VALIDATE_EXCEL: Critical error - {str(e)}")
+        logger.error("VALIDATE_EXCEL: Critical error - %s", e, extra=fields("validate_excel", outcome="failed"))
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка валидации Excel файла: {str(e)}"
         )
 
 @router.post("/api/v1/users/bulk-create-from-excel")
-async def bulk_create_from_excel(request: Request, file: UploadFile = File(...)) -> Dict[str, Any]:
+async def bulk_create_from_excel(
+    request: Request,
+    file: UploadFile = File(...),
+    plan_token: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     Парсинг excel и создание пользователя
+
+    plan_token из validate-excel для того же файла: строки берутся из плана,
+    с FreeIPA сверяются одним запросом, а не построчно
+
+    С заголовком Idempotency-Key повтор запроса с тем же файлом продолжает
+    прерванную операцию: уже обработанные строки не проверяются и не создаются
+    заново, их итоги возвращаются из контрольной точки
     """
     try:
         # Сначала проверяем авторизацию (до чтения файла!)
         client = get_user_client(request)
 
-        session_id = request.cookies.get("ipa_session")
-        admin = user_sessions.get(session_id, {}).get("username", "unknown")
-        logger.info(f"BULK_CREATE_EXCEL: Started by {admin}")
+        admin = get_session_username(request)
+        logger.info("BULK_CREATE_EXCEL: Started by %s", admin, extra=fields("bulk_create_excel", admin))
 
         # Читаем Excel файл (только если авторизован)
         contents = await file.read()
-        workbook = openpyxl.load_workbook(BytesIO(contents)) # превращаем биты в читаемый файл
-        sheet = workbook.active # Активный листы
 
         # Проверяем доступность Yopass ДО начала создания пользователей
         try:
             test_link = create_yopass_link("test", "test123")
-            logger.info(f"BULK_CREATE_EXCEL: Yopass check OK - {test_link}")
+            logger.info("BULK_CREATE_EXCEL: Yopass check OK - %s", test_link)
         except Exception as e:
-            logger.error(f"BULK_CREATE_EXCEL: Yopass unavailable - {str(e)}")
+            logger.error("BULK_CREATE_EXCEL: Yopass unavailable - %s", e, extra=fields("bulk_create_excel", admin, outcome="failed"))
             raise HTTPException(
                 status_code=503,
                 detail=f"Yopass недоступен: {str(e)}. Создание пользователей отменено."
             )
 
-        results = {"success": [], "failed": []}
-
-        # Проходим по строкам (пропускаем первую - заголовки)
-        for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            # Пропускаем пустые строки
-            if not row or not row[0]:
-                continue
-
-            try:
-                # Парсим строку Excel
-                data = parse_excel_row(row)
-                fio = data["fio"]
-                email = data["email"]
-
-                # Валидация обязательных полей
-                if not fio:
-                    results["failed"].append({"row": row_num, "error": "ФИО не заполнено"})
-                    continue
-
-                if not email:
-                    results["failed"].append({"row": row_num, "fio": fio, "error": "Email не заполнен"})
-                    continue
+        checkpoint = await run_in_threadpool(open_checkpoint, request, admin, "bulk-create-from-excel", contents)
+        # Исключение на любом шаге помечает операцию прерванной - её можно сразу повторить
+        with checkpoint:
+            results = {"success": [], "failed": []}
+            checkpoint.replay(results)
+            # Созданные прошлой попыткой строки (им осталось назначить группы) не проверяются:
+            # username и email уже заняты ими самими
+            resumed = [saved["row"] for saved in checkpoint.pending_items()]
+            skipped = {str(row["row"]) for row in resumed}
+
+            def fresh(row_num: int) -> bool:
+                key = str(row_num)
+                return key not in skipped and not checkpoint.finished(key)
+
+            # План валидации годится, только если файл тот же (хеш сохранён в плане) и оператор тот же
+            plan = None
+            if plan_token:
+                plan = await run_in_threadpool(load_plan, plan_token, admin, contents)
+                if plan is None:
+                    logger.warning("BULK_CREATE_EXCEL: Plan %s not usable, validating file again", plan_token[:12])
+
+            if plan is not None:
+                rows, changed = await run_in_threadpool(
+                    recheck_plan, client, [row for row in plan["rows"] if fresh(row["row"])]
+                )
+                failed = [entry for entry in plan["conflicts"] if fresh(entry["row"])] + changed
+                logger.info(
+                    "BULK_CREATE_EXCEL: Using validation plan - %s rows, %s changed since validation",
+                    len(plan["rows"]), len(changed),
+                )
+            else:
+                sheet = load_workbook(contents).active  # превращаем биты в читаемый файл
+                checked = await run_in_threadpool(
+                    check_rows, client, ((row_num, data) for row_num, data in excel_rows(sheet) if fresh(row_num))
+                )
+                rows = checked["plan"]
+                failed = checked["conflicts"]
+
+            rows = resumed + rows
+            total = len(results["success"]) + len(results["failed"]) + len(rows) + len(failed)
+
+            def create() -> None:
+                for entry in failed:
+                    checkpoint.add(results, "failed", entry)
+                create_users(client, rows, results, admin, checkpoint)
+
+            with jobs.track("bulk-create-from-excel", total, admin, results=results):
+                await run_in_threadpool(create)
+        results["success"].sort(key=lambda entry: entry["row"])
+        results["failed"].sort(key=lambda entry: entry["row"])
+        results["plan_used"] = plan is not None
+
+        logger.info(
+            "BULK_CREATE_EXCEL: Completed by %s - Success: %s, Failed: %s",
+            admin, len(results["success"]), len(results["failed"]),
+            extra=fields("bulk_create_excel", admin, count=len(results["success"]), outcome="completed"),
+        )
 
-                if not is_valid_email(email):
-                    results["failed"].append({"row": row_num, "fio": fio, "error": f"Невалидный email: {email}"})
-                    continue
+        return results
 
-                # Парсим ФИО
-                fio_parsed = parse_fio(fio)
-                if not fio_parsed:
-                    results["failed"].append({"row": row_num, "fio": fio, "error": "ФИО должно содержать минимум Фамилию и Имя"})
-                    continue
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("BULK_CREATE_EXCEL: Critical error - %s", e, extra=fields("bulk_create_excel", outcome="failed"))
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка обработки Excel файла: {str(e)}"
+        )
 
-                last_name, first_name, username = fio_parsed
 
-                # Собираем все ошибки валидации для этой строки
-                row_errors = []
+# Content-Type тела bulk-create с записью на строку; остальное разбирается как JSON массив
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
 
-                # Проверка: Username уже существует в FreeIPA
-                try:
-                    client._request("user_show", args=[username])
-                    # Если не упало - значит пользователь существует
-                    row_errors.append(f"Username '{username}' уже существует в FreeIPA")
-                except Exception:
-                    # Пользователь не найден - можно создавать
-                    pass
-
-                # Проверка: Email уже существует в FreeIPA
-                try:
-                    # Ищем пользователей с таким email
-                    email_check = client._request("user_find", args=[], params={"mail": email})
-                    if email_check['result']:
-                        # Найден пользователь с таким email
-                        existing_username = email_check['result'][0]['uid'][0]
-                        row_errors.append(f"Email '{email}' уже используется пользователем {existing_username}")
-                except Exception:
-                    # Ошибка поиска - игнорируем и продолжаем
-                    pass
-
-                # Парсим группы
-                groups_list = parse_groups(data["groups_str"])
-
-                # Проверка: Существование всех групп
-                if groups_list:
-                    non_existing_groups = []
-                    for group in groups_list:
-                        try:
-                            client._request("group_show", args=[group])
-                        except Exception:
-                            non_existing_groups.append(group)
-
-                    if non_existing_groups:
-                        row_errors.append(f"Группы не существуют: {', '.join(non_existing_groups)}")
-
-                # Если есть любые ошибки валидации - не создаём пользователя
-                if row_errors:
-                    results["failed"].append({
-                        "row": row_num,
-                        "fio": fio,
-                        "username": username,
-                        "email": email,
-                        "error": "; ".join(row_errors)
-                    })
-                    continue
-
-                # Создаём пользователя в FreeIPA
-                result = client._request(
-                    "user_add",
-                    args=[username],
-                    params={
-                        "givenname": first_name,
-                        "sn": last_name,
-                        "cn": fio,
-                        "mail": email,
-                        "title": data["title"],
-                        "telephonenumber": data["phone"],
-                        "random": True,
-                    }
-                )
 
-                password = result['result']['randompassword']
-
-                yopass_link = create_yopass_link(username, password)
-
-                # Добавляем в группы
-                added_groups = []
-                failed_groups = []
-
-                for group in groups_list:
-                    try:
-                        client._request(
-                            "group_add_member",
-                            args=[group],
-                            params={"user": username}
-                        )
-                        added_groups.append(group)
-                    except Exception as e:
-                        failed_groups.append({"group": group, "error": str(e)})
-
-                # Если валидация прошла успесното добавляем сюда
-                success_entry = {
-                    "row": row_num,
-                    "fio": fio,
-                    "username": username,
-                    "email": email,
-                    "password": password,
-                    "yopass_link": yopass_link
-                }
-
-                if groups_list:
-                    success_entry["groups"] = {
-                        "added": added_groups,
-                        "failed": failed_groups
-                    }
-
-                results["success"].append(success_entry)
-                logger.info(f"BULK_CREATE_EXCEL: Created {username} from row {row_num}")
+@router.post("/api/v1/users/bulk-create")
+async def bulk_create(request: Request) -> NDJSONStreamingResponse:
+    """
+    Массовое создание пользователей из JSON массива или NDJSON потока
 
-            except Exception as e:
-                results["failed"].append({
-                    "row": row_num,
-                    "fio": fio if 'fio' in locals() else "unknown",
-                    "error": str(e)
-                })
-                logger.error(f"BULK_CREATE_EXCEL: Failed row {row_num} - {str(e)}")
+    Записи в формате create (first_name, last_name, email, title, phone, groups).
+    С Content-Type: application/x-ndjson - по записи на строку, иначе JSON массив:
 
-        logger.info(f"BULK_CREATE_EXCEL: Completed by {admin} - Success: {len(results['success'])}, Failed: {len(results['failed'])}")
+    [{"first_name": "Иван", "last_name": "Иванов", "email": "ivan@test.com", "groups": ["developers"]}]
 
-        return results
+    Тело не буферизуется: записи проверяются (как в validate-excel) и создаются
+    пачками по мере прихода, ответ - NDJSON с итогом по каждой записи (row -
+    номер записи с 1, status - success/failed) и строкой {"status": "summary"} в конце.
+    """
+    client = get_user_client(request)
+    admin = get_session_username(request)
+    logger.info("BULK_CREATE: Started by %s", admin, extra=fields("bulk_create", admin))
 
+    # Проверяем доступность Yopass ДО начала создания пользователей
+    try:
+        await run_in_threadpool(create_yopass_link, "test", "test123")
     except Exception as e:
-        logger.error(f"BULK_CREATE_EXCEL: Critical error - {str(e)}")
+        logger.error("BULK_CREATE: Yopass unavailable - %s", e, extra=fields("bulk_create", admin, outcome="failed"))
         raise HTTPException(
-            status_code=500,
-            detail=f"Ошибка обработки Excel файла: {str(e)}"
+            status_code=503,
+            detail=f"Yopass недоступен: {str(e)}. Создание пользователей отменено."
         )
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    decoder = NdjsonDecoder() if content_type in NDJSON_CONTENT_TYPES else JsonArrayDecoder()
+    checker = await run_in_threadpool(RowChecker, client)
+    return NDJSONStreamingResponse(stream_create_users(request.stream(), decoder, client, checker, admin))
@@ -2,6 +2,8 @@ from fastapi import APIRouter, Form, HTTPException
 from fastapi.responses import PlainTextResponse
 import subprocess
 from app.config import logger, YOPASS, YOPASS_URL
+from app.observability.metrics import YOPASS_LINK_SECONDS, observe
+from app.observability.tracing import span
 
 router = APIRouter()
 
@@ -9,31 +11,32 @@ router = APIRouter()
 def generate_yopass_link(data: str = Form()):
     """Генерирует Yopass ссылку через форму"""
     try:
-        result = subprocess.run(
-            [
-                YOPASS,
-                "--api", YOPASS_URL,
-                "--url", YOPASS_URL,
-                "--expiration=1w",
-                "--one-time=true"
-            ],
-            input=data,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        logger.info(f"Ссылка успешно сгенерирована")
+        with span("yopass.create_link"), observe(YOPASS_LINK_SECONDS):
+            result = subprocess.run(
+                [
+                    YOPASS,
+                    "--api", YOPASS_URL,
+                    "--url", YOPASS_URL,
+                    "--expiration=1w",
+                    "--one-time=true"
+                ],
+                input=data,
+                capture_output=True,
+                text=True,
+                check=True
+            )
+        logger.info("Ссылка успешно сгенерирована")
         return result.stdout.strip()
 
         
     except subprocess.CalledProcessError as e:
-        logger.error(f"Ошибка - {str(e)}")
+        logger.error("Ошибка - %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка {e.stderr}"
         )
     except FileNotFoundError:
-        logger.error(f"Yopass binary не найден. Проверьте путь - {str(e)}")
+        logger.error("Yopass binary не найден. Проверьте путь - %s", YOPASS)
         raise HTTPException(
             status_code=500,
             detail="Yopass binary не найден. Проверьте путь"
@@ -1,5 +1,5 @@
 from fastapi import FastAPI
-from app.routers import auth, users, bulk, reports, yopass, templates
+from app.routers import auth, users, bulk, reports, yopass, templates, metrics, profiles
 
 def setup_routes(app: FastAPI) -> None:
     app.include_router(auth.router, tags=["Authentication"])
@@ -7,4 +7,6 @@ def setup_routes(app: FastAPI) -> None:
     app.include_router(bulk.router, tags=["Users - Bulk"])
     app.include_router(reports.router, tags=["Analytics"])
     app.include_router(yopass.router, tags=["Yopass"])
-    app.include_router(templates.router, tags=["Template"])
\ No newline at end of file
+    app.include_router(templates.router, tags=["Template"])
+    app.include_router(metrics.router, tags=["Metrics"])
+    app.include_router(profiles.router, tags=["Profiling"])
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Продакшен запуск: gunicorn мастер + uvicorn воркеры
+
+Мастер заранее импортирует приложение (preload_app) - ошибки конфигурации
+видны сразу, а воркеры стартуют быстрее. Остановка (SIGTERM) мягкая: воркер
+перестаёт принимать запросы и ждёт до SERVER_GRACEFUL_TIMEOUT секунд, пока
+завершатся начатые запросы и bulk операции - срок общий для обеих фаз, поэтому
+мастер не убивает воркер посреди ожидания bulk операций.
+
+Если задан PROMETHEUS_MULTIPROC_DIR, метрики воркеров пишутся в этот каталог:
+при старте мастер очищает его, а при выходе воркера помечает его метрики мёртвыми.
+"""
+import os
+import socket
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+from gunicorn.app.base import BaseApplication
+from gunicorn.arbiter import Arbiter
+from prometheus_client import multiprocess
+from uvicorn.server import Server
+from uvicorn_worker import UvicornWorker
+
+from app.config import (
+    logger,
+    SERVER_BACKLOG,
+    SERVER_GRACEFUL_TIMEOUT,
+    SERVER_HOST,
+    SERVER_HTTP,
+    SERVER_KEEPALIVE,
+    SERVER_LOOP,
+    SERVER_PORT,
+    SERVER_WORKERS,
+)
+from app.lifespan import start_shutdown
+
+
+class ConductorServer(Server):
+    async def shutdown(self, sockets: list[socket.socket] | None = None) -> None:
+        # Срок мягкой остановки отсчитывается отсюда: ожидание соединений и bulk операций - из одного бюджета
+        start_shutdown()
+        await super().shutdown(sockets)
+
+
+class ConductorWorker(UvicornWorker):
+    """uvicorn воркер с выбранными event loop и HTTP парсером"""
+
+    CONFIG_KWARGS = {
+        "loop": SERVER_LOOP,
+        "http": SERVER_HTTP,
+        "lifespan": "on",
+        "timeout_graceful_shutdown": SERVER_GRACEFUL_TIMEOUT,
+    }
+
+    async def _serve(self) -> None:
+        # Как в UvicornWorker, но с ConductorServer
+        self.config.app = self.wsgi
+        server = ConductorServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+
+class ProductionServer(BaseApplication):
+    def __init__(self, app: FastAPI, options: dict) -> None:
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self) -> FastAPI:
+        return self.application
+
+
+def clear_metrics_dir(server) -> None:
+    """Удаляет метрики прошлого запуска (хук gunicorn on_starting)"""
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        for path in Path(metrics_dir).glob("*.db"):
+            path.unlink(missing_ok=True)
+
+
+def mark_worker_dead(server, worker) -> None:
+    """Исключает gauge-метрики завершившегося воркера (хук gunicorn child_exit)"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def run(app: FastAPI) -> None:
+    """Запускает уже собранное приложение (preload: мастер импортирует его до fork воркеров)"""
+    options = {
+        "bind": f"{SERVER_HOST}:{SERVER_PORT}",
+        "workers": SERVER_WORKERS,
+        "worker_class": "app.server.ConductorWorker",
+        "preload_app": True,
+        "backlog": SERVER_BACKLOG,
+        "keepalive": SERVER_KEEPALIVE,
+        # Мастер убивает воркер только после того, как истечёт общий срок мягкой остановки
+        "graceful_timeout": SERVER_GRACEFUL_TIMEOUT + 10,
+        "on_starting": clear_metrics_dir,
+        "child_exit": mark_worker_dead,
+    }
+    logger.info(
+        "Starting production server on %s: %s workers, loop=%s, http=%s",
+        options["bind"], SERVER_WORKERS, SERVER_LOOP, SERVER_HTTP,
+    )
+    ProductionServer(app, options).run()
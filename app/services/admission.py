@@ -0,0 +1,198 @@
+"""
+Допуск bulk операций
+
+Bulk операция занимает поток пула Starlette на всё время выполнения и
+нагружает FreeIPA, поэтому их число ограничено:
+
+- не больше BULK_MAX_CONCURRENT_PER_WORKER одновременно на воркер - предел
+  защищает пул потоков воркера, а не FreeIPA, поэтому общий на хост не
+  нужен: всего на хосте выполняется до числа воркеров x этого значения
+  (нагрузку на FreeIPA держат предел вызовов IPA_LIMIT_* и места операторов);
+- не больше BULK_MAX_PER_OPERATOR выполняющихся и ожидающих от одного
+  оператора на все воркеры - места оператора лежат в общем хранилище
+  (session_store) и продлеваются, пока операция идёт; места упавшего
+  воркера освобождаются сами через OPERATOR_SLOT_LEASE_SECONDS;
+- ожидающих не больше BULK_QUEUE_SIZE на воркер, очередь обслуживается по
+  кругу между операторами - большой пакет одного не задерживает остальных;
+- если места нет, операция отклоняется (429 с Retry-After) сразу, а не висит.
+
+Одиночные операции через допуск не проходят: потоки пула сверх
+BULK_MAX_CONCURRENT_PER_WORKER всегда остаются им.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import (
+    BULK_MAX_CONCURRENT_PER_WORKER,
+    BULK_MAX_PER_OPERATOR,
+    BULK_QUEUE_SIZE,
+    BULK_QUEUE_TIMEOUT_SECONDS,
+    logger,
+)
+from app.dependencies import session_store
+from app.observability.metrics import ADMISSION_QUEUED, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+from app.services.storage import StateStore
+
+# Оценка длительности bulk операции до первых замеров (для Retry-After)
+INITIAL_JOB_SECONDS = 30.0
+
+OPERATOR_SLOTS_NAMESPACE = "bulk_operator_slots"
+# Сколько место оператора живёт без продления (продлевается каждую треть срока)
+OPERATOR_SLOT_LEASE_SECONDS = 60
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Счётчики и очередь допуска; используется только из event loop воркера
+
+    Места операторов - в store, общем для воркеров; остальное - в памяти воркера.
+    """
+
+    def __init__(
+        self,
+        store: StateStore,
+        max_running_per_worker: int,
+        max_per_operator: int,
+        max_queued: int,
+        queue_timeout: float,
+    ) -> None:
+        self.store = store
+        self.max_running_per_worker = max_running_per_worker
+        self.max_per_operator = max_per_operator
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self._waiting: OrderedDict[str, Deque[asyncio.Future]] = OrderedDict()
+        self._queued = 0
+        self._average_seconds = INITIAL_JOB_SECONDS
+
+    def retry_after(self) -> int:
+        """Сколько подождать до повтора: средняя длительность операции на длину очереди"""
+        rounds = (self._queued + 1) / max(self.max_running_per_worker, 1)
+        return max(1, math.ceil(self._average_seconds * rounds))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        ADMISSION_REJECTED.labels(reason=reason).inc()
+        return AdmissionRejected(reason, self.retry_after())
+
+    @asynccontextmanager
+    async def bulk(self, operator: str) -> AsyncIterator[None]:
+        """Допускает bulk операцию оператора на время блока или бросает AdmissionRejected"""
+        # Место оператора занимают и выполняющиеся, и ожидающие операции
+        slot = await run_in_threadpool(self._take_slot, operator)
+        if slot is None:
+            raise self._reject("operator")
+        keeper = asyncio.create_task(self._keep_slot(slot))
+        try:
+            if self.running < self.max_running_per_worker and not self._queued:
+                self.running += 1
+            elif self._queued >= self.max_queued:
+                raise self._reject("queue-full")
+            else:
+                await self._wait(operator)
+        except BaseException:
+            await self._free_slot(slot, keeper)
+            raise
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._average_seconds = 0.8 * self._average_seconds + 0.2 * (time.monotonic() - started)
+            self._release()
+            await self._free_slot(slot, keeper)
+
+    def _take_slot(self, operator: str) -> str | None:
+        """Занимает свободное место оператора (атомарно для всех воркеров), None - мест нет"""
+        for index in range(self.max_per_operator):
+            key = f"{operator}:{index}"
+            if self.store.put_if_absent(OPERATOR_SLOTS_NAMESPACE, key, {"pid": os.getpid()}, OPERATOR_SLOT_LEASE_SECONDS):
+                return key
+        return None
+
+    async def _keep_slot(self, key: str) -> None:
+        while True:
+            await asyncio.sleep(OPERATOR_SLOT_LEASE_SECONDS / 3)
+            try:
+                await run_in_threadpool(
+                    self.store.put, OPERATOR_SLOTS_NAMESPACE, key, {"pid": os.getpid()}, OPERATOR_SLOT_LEASE_SECONDS
+                )
+            except Exception as e:
+                logger.warning("Admission slot %s not renewed: %s", key, e)
+
+    async def _free_slot(self, key: str, keeper: asyncio.Task) -> None:
+        keeper.cancel()
+        try:
+            await run_in_threadpool(self.store.delete, OPERATOR_SLOTS_NAMESPACE, key)
+        except Exception as e:
+            # Не освобождённое место истечёт само через OPERATOR_SLOT_LEASE_SECONDS
+            logger.warning("Admission slot %s not freed: %s", key, e)
+
+    async def _wait(self, operator: str) -> None:
+        """Ждёт, пока освободившая место операция передаст его (running не меняется)"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(operator, deque()).append(future)
+        self._queued += 1
+        ADMISSION_QUEUED.inc()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Место выдали одновременно с таймаутом - передаём его следующему
+                self._release()
+            else:
+                future.cancel()
+                self._forget(operator, future)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject("timeout") from None
+        finally:
+            ADMISSION_QUEUED.dec()
+            ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started)
+
+    def _forget(self, operator: str, future: asyncio.Future) -> None:
+        waiters = self._waiting.get(operator)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self._queued -= 1
+            if not waiters:
+                del self._waiting[operator]
+
+    def _release(self) -> None:
+        """Отдаёт место следующему ожидающему: операторы обслуживаются по кругу"""
+        while self._waiting:
+            operator, waiters = next(iter(self._waiting.items()))
+            future = waiters.popleft()
+            self._queued -= 1
+            del self._waiting[operator]
+            if waiters:
+                # Остальные заявки оператора - в конец круга
+                self._waiting[operator] = waiters
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+
+admission = AdmissionController(
+    session_store,
+    BULK_MAX_CONCURRENT_PER_WORKER,
+    BULK_MAX_PER_OPERATOR,
+    BULK_QUEUE_SIZE,
+    BULK_QUEUE_TIMEOUT_SECONDS,
+)
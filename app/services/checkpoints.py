@@ -0,0 +1,430 @@
+"""
+Контрольные точки bulk операций и ключ идемпотентности
+
+Клиент передаёт заголовок Idempotency-Key. Итог каждого элемента операции
+(success/failed/already/merged) сразу пишется в SQLite файл на локальном
+диске (BULK_JOBS_DB_PATH), поэтому после падения воркера или обрыва
+соединения повтор запроса с тем же ключом не выполняет элементы заново:
+их итоги берутся из контрольной точки, а FreeIPA получает только то, до чего
+операция не дошла. Повтор завершённой операции просто возвращает её результат.
+
+Элемент, изменение которого в FreeIPA уже сделано, но операция над ним не
+закончена (пароль сброшен, а ссылка Yopass и письмо ещё нет; пользователь
+создан, а группы ещё не назначены), сохраняется как pending со своими
+данными - при повторе операция продолжает его с того же места.
+
+Пароли на диск не пишутся (поля SECRET_FIELDS сохраняются как null): pending
+с готовой ссылкой Yopass продолжается без пароля, а без ссылки пароль
+сбрасывается заново - прежний ещё никому не выдан. Поэтому сброс, пароль
+которого выдан только в ответе (без ссылки и письма), законченным не
+считается и остаётся pending: повтор сбрасывает пароль заново, а не
+возвращает успех с password: null.
+
+Ключ привязан к оператору, типу операции и входным данным (хеш файла или
+списка): тот же ключ с другими данными или повтор, пока операция ещё
+выполняется, - 409. Пока операция идёт, фоновый поток обновляет её heartbeat,
+поэтому долгая проверка или резолв без записей итогов не отдают операцию
+повтору; heartbeat перестаёт обновляться, только если воркер упал. Контрольные точки хранятся BULK_JOBS_TTL_SECONDS.
+
+По ключу же операцию можно отменить (POST /api/v1/bulk-jobs/{key}/cancel):
+статус в файле общий для всех воркеров, операция проверяет его между
+элементами, перестаёт брать новые, доделывает начатые и возвращает
+частичный результат. Отменённую операцию можно продолжить тем же ключом.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import orjson
+from fastapi import HTTPException, Request
+
+from app.config import BULK_JOBS_DB_PATH, BULK_JOBS_LEASE_SECONDS, BULK_JOBS_TTL_SECONDS, logger
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 128
+
+# Итог элемента, после которого операция над ним продолжается
+PENDING = "pending"
+# Статусы операции, которая ещё выполняется
+ACTIVE_STATUSES = ("running", "cancelling")
+# Как часто выполняющаяся операция перечитывает свой статус (отмену)
+CANCEL_POLL_SECONDS = 0.5
+# Поля итогов, которые не сохраняются в контрольной точке
+SECRET_FIELDS = ("password",)
+# Как часто выполняющаяся операция подтверждает, что жива (heartbeat)
+HEARTBEAT_SECONDS = max(BULK_JOBS_LEASE_SECONDS / 4, 1)
+# Сколько итогов читать за раз при выгрузке
+READ_PAGE_SIZE = 500
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def fingerprint(*parts: Any) -> str:
+    """Хеш входных данных операции: bytes файла или JSON-совместимые значения"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else orjson.dumps(part))
+    return digest.hexdigest()
+
+
+def _at_rest(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Копия итога без паролей, в том числе во вложенной записи pending создания"""
+    stored = dict(entry)
+    for name in SECRET_FIELDS:
+        if name in stored:
+            stored[name] = None
+    if isinstance(stored.get("entry"), dict):
+        stored["entry"] = _at_rest(stored["entry"])
+    return stored
+
+
+class CheckpointStore:
+    """
+    Контрольные точки в SQLite файле, общем для всех воркеров на хосте
+
+    Как и SQLiteStore: WAL, соединение своё у каждого потока. Запись итога
+    элемента - одна короткая транзакция, без переписывания всей операции.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        os.register_at_fork(after_in_child=self._reset_connections)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " operator TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " fingerprint TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " heartbeat REAL NOT NULL,"
+            " PRIMARY KEY (operator, key))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_items ("
+            " operator TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " item TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " outcome TEXT NOT NULL,"
+            " entry BLOB NOT NULL,"
+            " PRIMARY KEY (operator, key, item))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created)")
+        conn.execute("CREATE INDEX IF NOT EXISTS job_items_seq ON job_items (operator, key, seq)")
+        # Паролей в файле нет, но ссылки Yopass в итогах одноразовые - доступ только владельцу
+        os.chmod(path, 0o600)
+
+    def _reset_connections(self) -> None:
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def begin(self, operator: str, key: str, kind: str, fingerprint: str) -> List[tuple]:
+        """
+        Начинает или возобновляет операцию, возвращает сохранённые итоги
+        элементов (item, seq, outcome, entry) в порядке записи
+
+        IdempotencyConflict - ключ уже использован для другой операции или
+        операция с ним ещё выполняется (heartbeat свежее BULK_JOBS_LEASE_SECONDS).
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT kind, fingerprint, status, heartbeat FROM jobs WHERE operator = ? AND key = ?",
+                (operator, key),
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO jobs (operator, key, kind, fingerprint, status, created, heartbeat)"
+                    " VALUES (?, ?, ?, ?, 'running', ?, ?)",
+                    (operator, key, kind, fingerprint, now, now),
+                )
+            else:
+                stored_kind, stored_fingerprint, status, heartbeat = row
+                if (stored_kind, stored_fingerprint) != (kind, fingerprint):
+                    raise IdempotencyConflict("Ключ идемпотентности уже использован для другой операции или других данных")
+                if status in ACTIVE_STATUSES and now - heartbeat < BULK_JOBS_LEASE_SECONDS:
+                    raise IdempotencyConflict("Операция с этим ключом идемпотентности ещё выполняется")
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', heartbeat = ? WHERE operator = ? AND key = ?",
+                    (now, operator, key),
+                )
+            items = conn.execute(
+                "SELECT item, seq, outcome, entry FROM job_items WHERE operator = ? AND key = ? ORDER BY seq",
+                (operator, key),
+            ).fetchall()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [(item, seq, outcome, orjson.loads(entry)) for item, seq, outcome, entry in items]
+
+    def record(self, operator: str, key: str, item: str, seq: int, outcome: str, entry: Dict[str, Any]) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_items (operator, key, item, seq, outcome, entry) VALUES (?, ?, ?, ?, ?, ?)",
+                (operator, key, item, seq, outcome, orjson.dumps(entry)),
+            )
+            conn.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE operator = ? AND key = ?",
+                (time.time(), operator, key),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def touch(self, operator: str, key: str) -> None:
+        """Обновляет heartbeat выполняющейся операции"""
+        self._conn().execute(
+            "UPDATE jobs SET heartbeat = ? WHERE operator = ? AND key = ? AND status IN ('running', 'cancelling')",
+            (time.time(), operator, key),
+        )
+
+    def cancel(self, operator: str, key: str) -> bool:
+        """Помечает выполняющуюся операцию отменённой, False - такой операции нет или она закончилась"""
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'cancelling' WHERE operator = ? AND key = ? AND status = 'running'",
+            (operator, key),
+        )
+        return cursor.rowcount > 0
+
+    def status(self, operator: str, key: str) -> str | None:
+        row = self._conn().execute(
+            "SELECT status FROM jobs WHERE operator = ? AND key = ?", (operator, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def job(self, operator: str, key: str) -> Dict[str, Any] | None:
+        row = self._conn().execute(
+            "SELECT kind, status, created FROM jobs WHERE operator = ? AND key = ?", (operator, key)
+        ).fetchone()
+        return {"kind": row[0], "status": row[1], "created": row[2]} if row else None
+
+    def iter_items(self, operator: str, key: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Итоги элементов (outcome, entry) в порядке записи, страницами по READ_PAGE_SIZE
+
+        Каждая страница - отдельный запрос в соединении текущего потока: генератор
+        можно продолжать из другого потока (потоковый ответ Starlette).
+        """
+        seq = -1
+        while True:
+            rows = self._conn().execute(
+                "SELECT seq, outcome, entry FROM job_items WHERE operator = ? AND key = ? AND seq > ?"
+                " ORDER BY seq LIMIT ?",
+                (operator, key, seq, READ_PAGE_SIZE),
+            ).fetchall()
+            for seq, outcome, entry in rows:
+                yield outcome, orjson.loads(entry)
+            if len(rows) < READ_PAGE_SIZE:
+                return
+
+    def finish(self, operator: str, key: str, status: str) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, heartbeat = ? WHERE operator = ? AND key = ?",
+            (status, time.time(), operator, key),
+        )
+
+    def purge_expired(self) -> int:
+        """Удаляет операции старше BULK_JOBS_TTL_SECONDS вместе с итогами элементов"""
+        conn = self._conn()
+        before = time.time() - BULK_JOBS_TTL_SECONDS
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Операция, упавшая вместе с воркером, остаётся running - удаляется по последней записи
+            expired = "created <= ? AND (status NOT IN ('running', 'cancelling') OR heartbeat <= ?)"
+            conn.execute(
+                f"DELETE FROM job_items WHERE (operator, key) IN (SELECT operator, key FROM jobs WHERE {expired})",
+                (before, before),
+            )
+            cursor = conn.execute(f"DELETE FROM jobs WHERE {expired}", (before, before))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+
+class Checkpoint:
+    """
+    Контрольная точка одной операции
+
+    Без ключа идемпотентности (store=None) ничего не сохраняет - код операций
+    одинаков в обоих случаях. Методы потокобезопасны: итоги пишутся и из
+    потоков стадий конвейера. Используется как контекстный менеджер на время
+    выполнения: внутри фоновый поток обновляет heartbeat, по выходу операция
+    помечается завершённой или прерванной.
+    """
+
+    def __init__(
+        self,
+        store: CheckpointStore | None = None,
+        operator: str = "",
+        key: str | None = None,
+        saved: List[tuple] | None = None,
+    ) -> None:
+        self.store = store
+        self.operator = operator
+        self.key = key
+        saved = saved or []
+        self._items: Dict[str, tuple] = {item: (outcome, entry) for item, _, outcome, entry in saved}
+        self._seq = max((seq for _, seq, _, _ in saved), default=0)
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._polled = 0.0
+        self._alive = threading.Event()
+        self._heartbeat: threading.Thread | None = None
+        # Сколько итогов взято из контрольной точки, а не выполнено заново
+        self.resumed = sum(1 for outcome, _ in self._items.values() if outcome != PENDING)
+
+    def finished(self, item: str) -> bool:
+        saved = self._items.get(item)
+        return saved is not None and saved[0] != PENDING
+
+    def saved(self, item: str) -> tuple | None:
+        """Сохранённый итог элемента (outcome, entry), если он закончен"""
+        return self._items[item] if self.finished(item) else None
+
+    def pending(self, item: str) -> Dict[str, Any] | None:
+        """Сохранённые данные элемента, изменение которого в FreeIPA уже сделано"""
+        saved = self._items.get(item)
+        return saved[1] if saved is not None and saved[0] == PENDING else None
+
+    def pending_items(self) -> List[Dict[str, Any]]:
+        return [entry for outcome, entry in self._items.values() if outcome == PENDING]
+
+    def claimed(self, items: Iterable[str]) -> Dict[str, str]:
+        """
+        identifier -> username элементов, уже занявших пользователя в прошлых
+        попытках (закончены или pending, кроме merged) - повтор того же
+        пользователя под другим идентификатором не выполняется второй раз
+        """
+        claimed = {}
+        for item in items:
+            saved = self._items.get(item)
+            if saved is not None and saved[0] != "merged" and saved[1].get("username"):
+                claimed[item] = saved[1]["username"]
+        return claimed
+
+    def unfinished(self, items: Iterable[str]) -> List[str]:
+        return [item for item in items if not self.finished(item)]
+
+    def replay(self, results: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Дописывает в results итоги, сохранённые прошлыми попытками"""
+        for outcome, entry in self._items.values():
+            if outcome != PENDING:
+                results.setdefault(outcome, []).append(entry)
+
+    def record(self, item: str, outcome: str, entry: Dict[str, Any]) -> None:
+        if self.store is None:
+            return
+        entry = _at_rest(entry)
+        with self._lock:
+            self._items[item] = (outcome, entry)
+            self._seq += 1
+            seq = self._seq
+        try:
+            self.store.record(self.operator, self.key, item, seq, outcome, entry)
+        except sqlite3.Error as e:
+            # Операция важнее контрольной точки: при повторе этот элемент просто выполнится заново
+            logger.warning("Checkpoint write failed for key %s: %s", self.key[:16], e)
+
+    def add(self, results: Dict[str, List[Dict[str, Any]]], outcome: str, entry: Dict[str, Any]) -> None:
+        """Итог элемента: в results и в контрольную точку (элемент - identifier или row)"""
+        results[outcome].append(entry)
+        item = entry["identifier"] if "identifier" in entry else str(entry["row"])
+        self.record(item, outcome, entry)
+
+    def cancelled(self) -> bool:
+        """Оператор отменил операцию; статус перечитывается не чаще раза в CANCEL_POLL_SECONDS"""
+        if self.store is None or self._cancelled:
+            return self._cancelled
+        now = time.monotonic()
+        with self._lock:
+            if now - self._polled < CANCEL_POLL_SECONDS:
+                return False
+            self._polled = now
+        try:
+            self._cancelled = self.store.status(self.operator, self.key) == "cancelling"
+        except sqlite3.Error as e:
+            logger.warning("Checkpoint status read failed for key %s: %s", self.key[:16], e)
+        return self._cancelled
+
+    def _beat(self) -> None:
+        while not self._alive.wait(HEARTBEAT_SECONDS):
+            try:
+                self.store.touch(self.operator, self.key)
+            except sqlite3.Error as e:
+                logger.warning("Checkpoint heartbeat failed for key %s: %s", self.key[:16], e)
+
+    def __enter__(self) -> "Checkpoint":
+        if self.store is not None:
+            self._heartbeat = threading.Thread(
+                target=self._beat, name=f"checkpoint-{self.key[:16]}", daemon=True
+            )
+            self._heartbeat.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # Прерванную исключением операцию можно повторить сразу, не дожидаясь BULK_JOBS_LEASE_SECONDS
+        if self.store is None:
+            return
+        self._alive.set()
+        self._heartbeat.join()
+        if exc_type is not None:
+            status = "interrupted"
+        else:
+            status = "cancelled" if self._cancelled else "completed"
+        self.store.finish(self.operator, self.key, status)
+
+
+checkpoint_store = CheckpointStore(BULK_JOBS_DB_PATH)
+
+
+def open_checkpoint(request: Request, operator: str, kind: str, *payload: Any) -> Checkpoint:
+    """
+    Контрольная точка операции по заголовку Idempotency-Key
+
+    Без заголовка - пустая контрольная точка (ничего не сохраняется).
+    payload - входные данные операции, по их хешу повтор отличается от
+    другой операции с тем же ключом.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER, "").strip()
+    if not key:
+        return Checkpoint()
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} длиннее {MAX_KEY_LENGTH} символов")
+    try:
+        saved = checkpoint_store.begin(operator, key, kind, fingerprint(kind, *payload))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    checkpoint = Checkpoint(checkpoint_store, operator, key, saved)
+    if saved:
+        logger.info(
+            "BULK_RESUME %s by %s: key %s, %s items done, %s pending",
+            kind, operator, key[:16], checkpoint.resumed, len(saved) - checkpoint.resumed,
+        )
+    return checkpoint
@@ -1,9 +1,11 @@
 import smtplib
 from email.message import EmailMessage
-from pathlib import Path
 
 from app.config import (
     APP_NAME,
+    EMAIL_DEFAULT_LOCALE,
+    EMAIL_TEMPLATE_RELOAD_SECONDS,
+    EMAIL_TEMPLATES_DIR,
     HELPDESK_EMAIL,
     PASSWORD_RESET_EMAIL_TEMPLATE,
     SMTP_FROM,
@@ -16,6 +18,9 @@ from app.config import (
     SMTP_USE_SSL,
     SMTP_USE_TLS,
 )
+from app.observability.metrics import SMTP_SEND_SECONDS, observe
+from app.observability.tracing import hash_username, span
+from app.services.email_templates import EmailTemplates
 
 
 DEFAULT_TEMPLATE = """Здравствуйте!
@@ -37,29 +42,55 @@ def is_smtp_configured() -> bool:
     return bool(SMTP_HOST and SMTP_PORT and SMTP_FROM)
 
 
-def load_email_template() -> str:
-    template_path = Path(PASSWORD_RESET_EMAIL_TEMPLATE)
-    if template_path.is_file():
-        return template_path.read_text(encoding="utf-8")
-    return DEFAULT_TEMPLATE
+PASSWORD_RESET_FIELDS = (
+    "app_name",
+    "username",
+    "yopass_link",
+    "expiration",
+    "expiration_block",
+    "helpdesk_email",
+)
+
+templates = EmailTemplates(
+    EMAIL_TEMPLATES_DIR,
+    default_locale=EMAIL_DEFAULT_LOCALE,
+    reload_seconds=EMAIL_TEMPLATE_RELOAD_SECONDS,
+    fields={"password_reset": PASSWORD_RESET_FIELDS},
+    defaults={"password_reset": DEFAULT_TEMPLATE},
+    overrides={"password_reset": PASSWORD_RESET_EMAIL_TEMPLATE},
+)
+
+
+def load_email_template(locale: str | None = None) -> str:
+    return templates.get("password_reset", locale)
+
+
+def _common_fields() -> dict:
+    return {"app_name": APP_NAME, "helpdesk_email": HELPDESK_EMAIL or SMTP_FROM or "helpdesk"}
+
+
+def _reset_fields(username: str, yopass_link: str, expiration: str | None) -> dict:
+    return {
+        "username": username,
+        "yopass_link": yopass_link,
+        "expiration": expiration or "",
+        "expiration_block": f"Срок действия временного пароля: {expiration}\n" if expiration else "",
+    }
 
 
 def render_password_reset_email(
     username: str,
     yopass_link: str,
     expiration: str | None = None,
+    locale: str | None = None,
 ) -> str:
-    template = load_email_template()
-    expiration_block = f"Срок действия временного пароля: {expiration}\n" if expiration else ""
-    helpdesk_email = HELPDESK_EMAIL or SMTP_FROM or "helpdesk"
-    return template.format(
-        app_name=APP_NAME,
-        username=username,
-        yopass_link=yopass_link,
-        expiration=expiration or "",
-        expiration_block=expiration_block,
-        helpdesk_email=helpdesk_email,
-    ).strip() + "\n"
+    body = templates.render(
+        "password_reset",
+        locale,
+        **_common_fields(),
+        **_reset_fields(username, yopass_link, expiration),
+    )
+    return body.strip() + "\n"
 
 
 def send_password_reset_email(
@@ -67,6 +98,7 @@ def send_password_reset_email(
     username: str,
     yopass_link: str,
     expiration: str | None = None,
+    locale: str | None = None,
 ) -> None:
     if not is_smtp_configured():
         raise RuntimeError("SMTP не настроен")
@@ -80,11 +112,16 @@ def send_password_reset_email(
             username=username,
             yopass_link=yopass_link,
             expiration=expiration,
+            locale=locale,
         )
     )
 
     smtp_class = smtplib.SMTP_SSL if SMTP_USE_SSL else smtplib.SMTP
-    with smtp_class(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as server:
+    with (
+        span("smtp.send", user=hash_username(username)),
+        observe(SMTP_SEND_SECONDS),
+        smtp_class(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as server,
+    ):
         if not SMTP_USE_SSL and SMTP_USE_TLS:
             server.starttls()
         if SMTP_USERNAME:
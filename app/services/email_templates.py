@@ -0,0 +1,137 @@
+"""
+Шаблоны писем
+
+Шаблон читается с диска и проверяется один раз, дальше берётся из памяти.
+Изменения на диске подхватываются без перезапуска: не чаще раза в
+EMAIL_TEMPLATE_RELOAD_SECONDS сверяется mtime файла. Шаблон с ошибкой
+(незакрытая скобка, неизвестная переменная) не заменяет рабочий - в лог
+пишется ошибка, письма продолжают уходить по предыдущей версии.
+
+Шаблоны ищутся в EMAIL_TEMPLATES_DIR по действию и языку:
+    {action}_email.{locale}.txt, затем {action}_email.txt
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from string import Formatter
+from typing import Dict, Iterable, List, Mapping
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateError(ValueError):
+    pass
+
+
+@dataclass
+class _Entry:
+    path: Path | None
+    mtime: float | None
+    text: str
+    checked_at: float
+
+
+def validate_template(text: str, allowed: Iterable[str]) -> str:
+    """Проверяет синтаксис и переменные шаблона, возвращает текст или бросает TemplateError"""
+    allowed = set(allowed)
+    try:
+        names = {field for _, field, _, _ in Formatter().parse(text) if field is not None}
+    except ValueError as e:
+        raise TemplateError(f"Ошибка синтаксиса шаблона: {e}") from e
+    for name in names:
+        root = name.split(".", 1)[0].split("[", 1)[0]
+        if not root or root.isdigit():
+            raise TemplateError("Позиционные переменные {} в шаблоне не поддерживаются")
+        if root not in allowed:
+            raise TemplateError(f"Неизвестная переменная шаблона: {{{root}}}")
+    try:
+        text.format(**{name: "" for name in allowed})
+    except (ValueError, KeyError, IndexError, AttributeError) as e:
+        raise TemplateError(f"Ошибка форматирования шаблона: {e}") from e
+    return text
+
+
+class EmailTemplates:
+    """
+    Кэш шаблонов писем по (action, locale)
+
+    fields - допустимые переменные для каждого действия,
+    defaults - встроенный текст на случай, если файла нет,
+    overrides - явный путь к шаблону действия (для языка по умолчанию).
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        default_locale: str,
+        reload_seconds: float,
+        fields: Mapping[str, Iterable[str]],
+        defaults: Mapping[str, str] | None = None,
+        overrides: Mapping[str, str | Path] | None = None,
+    ) -> None:
+        self.directory = Path(directory)
+        self.default_locale = default_locale
+        self.reload_seconds = reload_seconds
+        self.fields = {action: tuple(names) for action, names in fields.items()}
+        self.defaults = dict(defaults or {})
+        self.overrides = {action: Path(path) for action, path in (overrides or {}).items()}
+        self._entries: Dict[tuple, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def _candidates(self, action: str, locale: str) -> List[Path]:
+        candidates = [self.directory / f"{action}_email.{locale}.txt"]
+        if locale == self.default_locale and action in self.overrides:
+            candidates.append(self.overrides[action])
+        candidates.append(self.directory / f"{action}_email.txt")
+        return candidates
+
+    def _locate(self, action: str, locale: str) -> tuple[Path | None, float | None]:
+        for path in self._candidates(action, locale):
+            try:
+                return path, path.stat().st_mtime
+            except OSError:
+                continue
+        return None, None
+
+    def _load(self, action: str, path: Path | None) -> str:
+        if path is None:
+            if action not in self.defaults:
+                raise TemplateError(f"Шаблон письма '{action}' не найден")
+            return self.defaults[action]
+        return validate_template(path.read_text(encoding="utf-8"), self.fields.get(action, ()))
+
+    def get(self, action: str, locale: str | None = None) -> str:
+        """Текст шаблона; диск проверяется не чаще раза в reload_seconds"""
+        key = (action, locale or self.default_locale)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry.checked_at < self.reload_seconds:
+            return entry.text
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.checked_at < self.reload_seconds:
+                return entry.text
+            path, mtime = self._locate(*key)
+            if entry is not None and entry.path == path and entry.mtime == mtime:
+                entry.checked_at = now
+                return entry.text
+            try:
+                text = self._load(action, path)
+            except (OSError, TemplateError) as e:
+                fallback = entry.text if entry is not None else self.defaults.get(action)
+                if fallback is None:
+                    raise
+                logger.error("Шаблон письма %s не загружен, используется прежний: %s", path, e)
+                # Запоминаем mtime битого файла, чтобы не перечитывать его до следующего изменения
+                self._entries[key] = _Entry(path, mtime, fallback, now)
+                return fallback
+            if entry is not None:
+                logger.info("Шаблон письма %s перезагружен: %s", action, path or "встроенный")
+            self._entries[key] = _Entry(path, mtime, text, now)
+            return text
+
+    def render(self, action: str, locale: str | None = None, **values: str) -> str:
+        return self.get(action, locale).format(**values)
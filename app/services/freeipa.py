@@ -1,6 +1,14 @@
 from python_freeipa import Client
+from collections import OrderedDict
+import threading
 import urllib3
-from app.config import IPA_HOST
+from requests.adapters import HTTPAdapter
+from typing import Dict, List
+from app.config import BULK_PIPELINE_IPA_WORKERS, IPA_BATCH_SIZE, IPA_HOST
+from app.models.user import UserRecord
+from app.observability.metrics import IPA_CLIENTS_EVICTED, IPA_REQUEST_SECONDS, observe
+from app.observability.tracing import hash_username, span
+from app.services.limiter import ipa_limiter
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -20,13 +28,109 @@ def get_ipa_domain(client: Client) -> str:
     return _cached_domain
 
 
+class InstrumentedClient(Client):
+    """
+    Клиент FreeIPA, замеряющий и трассирующий каждый JSON-RPC вызов по имени команды
+
+    Вызовы проходят через адаптивный лимит параллельности (app/services/limiter.py)
+    """
+
+    def _request(self, method, args=None, params=None):
+        # Первый аргумент user_* команд - username, в трассу пишем только его хеш
+        user = hash_username(args[0]) if method.startswith("user_") and args and isinstance(args[0], str) else None
+        with span("ipa.request", command=method, user=user):
+            if ipa_limiter is None:
+                with observe(IPA_REQUEST_SECONDS, method=method):
+                    return super()._request(method, args, params)
+            with ipa_limiter.acquire(method), observe(IPA_REQUEST_SECONDS, method=method):
+                return super()._request(method, args, params)
+
+
 def create_freeipa_client(host: str = None) -> Client:
     """Создаёт клиент FreeIPA без авторизации"""
     host = host or IPA_HOST
     if not host:
         raise Exception("Не задан IPA_HOST в .env файле")
     
-    return Client(host=host, verify_ssl=False)
+    client = InstrumentedClient(host=host, verify_ssl=False)
+    # Стадии resolve и user_mod bulk конвейера ходят в FreeIPA параллельно,
+    # стандартного пула requests на 10 соединений им не хватает
+    client._session.mount("https://", HTTPAdapter(pool_maxsize=2 * BULK_PIPELINE_IPA_WORKERS))
+    return client
+
+
+def get_session_cookie(client: Client) -> str | None:
+    """Возвращает cookie сессии FreeIPA (ipa_session) залогиненного клиента"""
+    return client._session.cookies.get("ipa_session")
+
+
+def restore_freeipa_client(session_cookie: str, host: str = None) -> Client:
+    """
+    Восстанавливает клиент FreeIPA по сохранённой cookie сессии без повторного логина
+
+    Нужен, чтобы любой воркер мог обслужить сессию, созданную на другом воркере
+    """
+    client = create_freeipa_client(host)
+    # login() выставляет текущий хост сам, здесь делаем это вручную
+    client._current_host = client._host
+    client._session.cookies.set("ipa_session", session_cookie)
+    return client
+
+
+def close_freeipa_client(client: Client) -> None:
+    """Закрывает пул соединений клиента (без logout - cookie может использоваться другими воркерами)"""
+    client._session.close()
+
+
+class ClientCache:
+    """
+    LRU кеш клиентов FreeIPA по id сессии с ограничением размера
+
+    Каждый клиент держит свой пул соединений, поэтому при вытеснении
+    или удалении клиент закрывается. Вытесненный клиент при следующем
+    запросе восстанавливается по cookie из хранилища сессий.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.evicted = 0
+        self._clients: OrderedDict[str, Client] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Client | None:
+        with self._lock:
+            client = self._clients.get(session_id)
+            if client is not None:
+                self._clients.move_to_end(session_id)
+            return client
+
+    def put(self, session_id: str, client: Client) -> None:
+        evicted = []
+        with self._lock:
+            previous = self._clients.pop(session_id, None)
+            if previous is not None and previous is not client:
+                evicted.append(previous)
+            self._clients[session_id] = client
+            while len(self._clients) > self.capacity:
+                _, oldest = self._clients.popitem(last=False)
+                evicted.append(oldest)
+                self.evicted += 1
+                IPA_CLIENTS_EVICTED.inc()
+        for old_client in evicted:
+            close_freeipa_client(old_client)
+
+    def pop(self, session_id: str) -> None:
+        with self._lock:
+            client = self._clients.pop(session_id, None)
+        if client is not None:
+            close_freeipa_client(client)
+
+    def session_ids(self) -> list[str]:
+        with self._lock:
+            return list(self._clients)
+
+    def __len__(self) -> int:
+        return len(self._clients)
 
 
 def resolve_username(client: Client, identifier: str) -> str:
@@ -66,4 +170,47 @@ def resolve_username(client: Client, identifier: str) -> str:
     if not users_list:
         raise ValueError(f"Пользователь с email '{identifier}' не найден")
     
-    return users_list[0]['uid'][0]
\ No newline at end of file
+    return users_list[0]['uid'][0]
+
+
+def _resolve_call(identifier: str) -> Dict:
+    """Вызов для batch: user_show по username или user_find по email"""
+    if "@" not in identifier:
+        return {"method": "user_show", "params": [[identifier], {}]}
+    return {"method": "user_find", "params": [[], {"mail": identifier.lower()}]}
+
+
+def _resolve_result(identifier: str, result: Dict) -> UserRecord | Exception:
+    if "@" not in identifier:
+        if result.get("error"):
+            return ValueError(f"Пользователь '{identifier}' не найден")
+        return UserRecord.from_ipa(result["result"])
+    if result.get("error"):
+        return Exception(result["error"])
+    users_list = result.get("result") or []
+    if not users_list:
+        return ValueError(f"Пользователь с email '{identifier}' не найден")
+    return UserRecord.from_ipa(users_list[0])
+
+
+def resolve_users(client: Client, identifiers: List[str]) -> Dict[str, UserRecord | Exception]:
+    """
+    То же, что resolve_username для списка, но пачками по IPA_BATCH_SIZE
+    через команду batch - один запрос к FreeIPA на пачку
+
+    Возвращает identifier -> UserRecord (вместе с nsaccountlock) или исключение:
+    ValueError, если пользователь не найден, или ошибку вызова FreeIPA -
+    тогда она стоит у всех идентификаторов пачки.
+    """
+    resolved: Dict[str, UserRecord | Exception] = {}
+    for start in range(0, len(identifiers), IPA_BATCH_SIZE):
+        chunk = identifiers[start:start + IPA_BATCH_SIZE]
+        try:
+            response = client._request("batch", args=[_resolve_call(i) for i in chunk], params={})
+        except Exception as e:
+            for identifier in chunk:
+                resolved[identifier] = e
+            continue
+        for identifier, result in zip(chunk, response["results"]):
+            resolved[identifier] = _resolve_result(identifier, result)
+    return resolved
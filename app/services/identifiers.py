@@ -0,0 +1,134 @@
+"""
+Нормализация и дедупликация идентификаторов bulk операций
+
+Списки из заявок часто содержат одного человека дважды - как username и как
+email или в разном регистре. До выполнения операции идентификаторы
+нормализуются (пробелы по краям, email в нижнем регистре), а после резолва
+повторы одного username схлопываются: изменение в FreeIPA выполняется один
+раз, остальные копии попадают в merged с указанием, с чем объединены.
+Запись merged одна для обоих случаев (merged_entry): identifier, username и
+merged_into.
+
+Поиск идёт пачками через batch (resolve_users), заодно приходит состояние
+учётной записи (nsaccountlock) - блокировка и разблокировка по нему
+пропускают пользователей, которые уже в нужном состоянии.
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Mapping, Tuple
+
+from python_freeipa import Client
+
+from app.observability.tracing import span
+from app.services.freeipa import resolve_users
+
+
+def normalize_identifier(identifier: str) -> str:
+    identifier = identifier.strip()
+    # Email в FreeIPA регистронезависим, username оставляем как ввели
+    return identifier.casefold() if "@" in identifier else identifier
+
+
+def normalize_identifiers(identifiers: Iterable[str]) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """
+    Нормализованные идентификаторы без пустых и повторов (порядок сохраняется)
+    и повторы (исходный идентификатор, нормализованный) - merged записи для
+    них строит duplicate_entries, когда username уже найдены
+    """
+    unique: List[str] = []
+    seen = set()
+    duplicates = []
+    for raw in identifiers:
+        identifier = normalize_identifier(raw)
+        if not identifier:
+            continue
+        if identifier in seen:
+            duplicates.append((raw, identifier))
+            continue
+        seen.add(identifier)
+        unique.append(identifier)
+    return unique, duplicates
+
+
+class UsernameClaims:
+    """Какой идентификатор первым получил username; потокобезопасно для стадий конвейера"""
+
+    def __init__(self, claimed: Mapping[str, str] | None = None) -> None:
+        # claimed - identifier -> username, занятые заранее (прошлыми попытками операции)
+        self._owners: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        for identifier, username in (claimed or {}).items():
+            self._owners.setdefault(username.casefold(), identifier)
+
+    def claim(self, identifier: str, username: str) -> str | None:
+        """None, если username достался identifier, иначе идентификатор-владелец"""
+        key = username.casefold()
+        with self._lock:
+            owner = self._owners.setdefault(key, identifier)
+        return None if owner == identifier else owner
+
+
+def merged_entry(identifier: str, username: str | None, owner: str) -> Dict[str, str | None]:
+    return {"identifier": identifier, "username": username, "merged_into": owner}
+
+
+def duplicate_entries(duplicates: List[Tuple[str, str]], usernames: Mapping[str, str]) -> List[Dict[str, str | None]]:
+    """merged записи текстовых повторов; username - найденный для нормализованного идентификатора (None - не найден)"""
+    return [merged_entry(raw, usernames.get(identifier), identifier) for raw, identifier in duplicates]
+
+
+def resolve_unique(
+    client: Client,
+    route: str,
+    identifiers: Iterable[str],
+    resolved: Dict[str, str] | None = None,
+    with_state: bool = False,
+    claimed: Mapping[str, str] | None = None,
+) -> Dict[str, Any]:
+    """
+    Нормализует, резолвит и схлопывает идентификаторы
+
+    Возвращает found (identifier, username - по одному на пользователя),
+    not_found (identifier, error), merged и disabled (username -> заблокирован
+    ли, для пользователей, прочитанных из FreeIPA). resolved - username, уже
+    найденные превью; они не ищутся повторно. with_state - нужно текущее
+    состояние всех пользователей: найденные превью перечитываются по username.
+    claimed - identifier -> username, уже обработанные прошлыми попытками
+    операции: новые идентификаторы тех же пользователей попадают в merged.
+    """
+    identifiers, duplicates = normalize_identifiers(identifiers)
+    resolved = resolved or {}
+    # Что спрашивать у FreeIPA: сам идентификатор или username из превью
+    lookups = {}
+    for identifier in identifiers:
+        username = resolved.get(identifier)
+        if username is None:
+            lookups[identifier] = identifier
+        elif with_state:
+            lookups[identifier] = username
+
+    with span("bulk.resolve", route=route, count=len(lookups)):
+        records = resolve_users(client, list(dict.fromkeys(lookups.values()))) if lookups else {}
+
+    claims = UsernameClaims(claimed)
+    found = []
+    not_found = []
+    merged = []
+    disabled = {}
+    for identifier in identifiers:
+        if identifier in lookups:
+            record = records[lookups[identifier]]
+            if isinstance(record, Exception):
+                not_found.append({"identifier": identifier, "error": str(record)})
+                continue
+            username = record.username
+            disabled[username] = record.disabled
+        else:
+            username = resolved[identifier]
+        owner = claims.claim(identifier, username)
+        if owner is None:
+            found.append({"identifier": identifier, "username": username})
+        else:
+            merged.append(merged_entry(identifier, username, owner))
+    usernames = {entry["identifier"]: entry["username"] for entry in found + merged}
+    merged = duplicate_entries(duplicates, usernames) + merged
+    return {"found": found, "not_found": not_found, "merged": merged, "disabled": disabled}
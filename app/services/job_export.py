@@ -0,0 +1,95 @@
+"""
+Выгрузка результатов bulk операции из контрольной точки в XLSX или CSV
+
+Итоги читаются из файла контрольных точек страницами, а не целиком.
+XLSX пишется write-only книгой openpyxl (строки сразу уходят во временный
+файл, а не копятся листом в памяти), готовый файл отдаётся кусками. CSV
+формируется и отдаётся построчно по мере чтения.
+"""
+import csv
+import io
+from typing import IO, Any, Dict, Iterable, Iterator, List, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+
+from app.services.checkpoints import PENDING
+
+HEADERS = ["Username", "Email", "Yopass ссылка", "Пароль", "Статус"]
+COLUMN_WIDTHS = {"A": 22, "B": 32, "C": 85, "D": 22, "E": 20}
+CHUNK_SIZE = 64 * 1024
+# Сколько строк CSV собирать в один кусок ответа
+CSV_BATCH_ROWS = 200
+
+
+def _status(outcome: str, entry: Dict[str, Any]) -> str:
+    if outcome == "success":
+        return "Успешно"
+    if outcome == "already":
+        return entry.get("note", "Уже в нужном состоянии")
+    if outcome == "merged":
+        return f"Повтор {entry['merged_into']}"
+    if outcome == PENDING:
+        return "Не завершено"
+    return f"Ошибка: {entry.get('error', '')}"
+
+
+def export_rows(items: Iterable[Tuple[str, Dict[str, Any]]]) -> Iterator[List[str]]:
+    """Строки выгрузки по итогам элементов (outcome, entry), без заголовка"""
+    for outcome, entry in items:
+        # pending массового создания хранит строку плана и итог отдельно
+        if outcome == PENDING and "entry" in entry:
+            entry = entry["entry"]
+        name = entry.get("username") or entry.get("identifier") or f"Строка {entry.get('row', '')}"
+        link = entry.get("yopass_link") or ""
+        # Пароль - только если его не передают ссылкой
+        password = "" if link else entry.get("password") or ""
+        yield [name, entry.get("email") or "", link, password, _status(outcome, entry)]
+
+
+def write_xlsx(rows: Iterable[List[str]], file: IO[bytes], title: str) -> None:
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    for column, width in COLUMN_WIDTHS.items():
+        sheet.column_dimensions[column].width = width
+
+    header = []
+    for value in HEADERS:
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color="2E4057", end_color="2E4057", fill_type="solid")
+        cell.alignment = Alignment(horizontal="center")
+        header.append(cell)
+    sheet.append(header)
+
+    for row in rows:
+        sheet.append(row)
+    workbook.save(file)
+
+
+def iter_file(file: IO[bytes]) -> Iterator[bytes]:
+    """Отдаёт файл кусками и закрывает его (временный файл при этом удаляется)"""
+    try:
+        file.seek(0)
+        while chunk := file.read(CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.close()
+
+
+def iter_csv(rows: Iterable[List[str]]) -> Iterator[bytes]:
+    # BOM - чтобы Excel открыл кириллицу в UTF-8 без мастера импорта
+    buffer = io.StringIO()
+    buffer.write("\ufeff")
+    writer = csv.writer(buffer)
+    writer.writerow(HEADERS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % CSV_BATCH_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
@@ -0,0 +1,94 @@
+"""
+Реестр выполняющихся bulk операций воркера
+
+Нужен для корректной остановки: при завершении воркер дожидается, пока
+все начатые bulk операции дойдут до конца, а не обрывает их на середине
+списка (синхронные обработчики продолжают работать в пуле потоков,
+даже если клиент уже отключился).
+"""
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List
+
+from app.observability.metrics import (
+    BULK_JOB_SECONDS,
+    BULK_JOB_SIZE,
+    BULK_JOBS_ACTIVE,
+    record_bulk_outcomes,
+)
+from app.observability.log import fields
+from app.services.limiter import bulk_context
+
+logger = logging.getLogger("app.jobs")
+
+
+@dataclass
+class BulkJob:
+    kind: str
+    operator: str
+    total: int
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    started: float = field(default_factory=time.monotonic)
+
+
+class JobRegistry:
+    def __init__(self) -> None:
+        self._jobs: dict[str, BulkJob] = {}
+        self._idle = threading.Condition()
+
+    @contextmanager
+    def track(
+        self,
+        kind: str,
+        total: int,
+        operator: str = "unknown",
+        results: Dict[str, Any] | None = None,
+    ) -> Iterator[BulkJob]:
+        """
+        Регистрирует bulk операцию на время выполнения блока
+
+        По завершении пишет в метрики размер и длительность операции, а также
+        итоги по элементам из results (списки success/failed/already), если он передан.
+        Если размер заранее неизвестен (потоковые операции), его дописывают в job.total.
+        """
+        job = BulkJob(kind=kind, operator=operator, total=total)
+        with self._idle:
+            self._jobs[job.id] = job
+        BULK_JOBS_ACTIVE.inc()
+        # Вызовы FreeIPA из операции уступают место одиночным запросам операторов
+        token = bulk_context.set(True)
+        try:
+            yield job
+        finally:
+            bulk_context.reset(token)
+            with self._idle:
+                del self._jobs[job.id]
+                self._idle.notify_all()
+            duration = time.monotonic() - job.started
+            BULK_JOBS_ACTIVE.dec()
+            BULK_JOB_SIZE.labels(route=kind).observe(job.total)
+            BULK_JOB_SECONDS.labels(route=kind).observe(duration)
+            if results is not None:
+                record_bulk_outcomes(kind, results)
+            logger.info(
+                "BULK_JOB %s by %s: %s items in %.1fs %s",
+                kind, operator, job.total, duration,
+                {key: len(value) for key, value in (results or {}).items()},
+                extra=fields(kind, operator, count=job.total, duration=duration),
+            )
+
+    def active(self) -> List[BulkJob]:
+        with self._idle:
+            return list(self._jobs.values())
+
+    def wait_idle(self, timeout: float) -> bool:
+        """Ждёт завершения всех операций, False - если не дождались за timeout секунд"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._jobs, timeout=timeout)
+
+
+jobs = JobRegistry()
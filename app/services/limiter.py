@@ -0,0 +1,176 @@
+"""
+Адаптивное ограничение параллельных вызовов FreeIPA
+
+Число одновременных запросов к FreeIPA с воркера подстраивается по
+задержкам (AIMD):
+
+- пока задержка вызова не больше IPA_LIMIT_LATENCY_TOLERANCE x минимальной
+  задержки той же команды (или выросла меньше чем на RTT_SLACK), лимит
+  растёт примерно на 1 за каждые `limit` успешных вызовов;
+- если задержка выросла или FreeIPA ответил 5xx / соединение оборвалось,
+  лимит умножается на IPA_LIMIT_BACKOFF (не чаще раза за `limit` вызовов,
+  чтобы одна волна медленных ответов не обрушила его до минимума).
+
+Минимальная задержка считается отдельно по каждой команде (user_show и
+user_find --all различаются на порядок). Если FreeIPA стал стабильно
+медленнее и задержка не падает даже на минимальном лимите, база
+пересчитывается по последнему окну замеров.
+
+Вызовы вне bulk операций (одиночные сбросы, поиск) при нехватке мест
+проходят раньше ожидающих вызовов bulk операций.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator
+
+import requests
+from python_freeipa.exceptions import FreeIPAError
+
+from app.config import (
+    IPA_LIMIT_BACKOFF,
+    IPA_LIMIT_ENABLED,
+    IPA_LIMIT_INITIAL,
+    IPA_LIMIT_LATENCY_TOLERANCE,
+    IPA_LIMIT_MAX,
+    IPA_LIMIT_MIN,
+    IPA_LIMIT_WAIT_TIMEOUT_SECONDS,
+)
+from app.observability.metrics import IPA_CONCURRENCY_LIMIT, IPA_INFLIGHT, IPA_LIMITER_WAIT_SECONDS
+
+# Вызовы из bulk операции (выставляется в jobs.track и наследуется потоками конвейера)
+bulk_context: ContextVar[bool] = ContextVar("bulk_context", default=False)
+
+# Сколько вызовов команды составляют окно для минимальной задержки
+RTT_WINDOW = 200
+# Рост задержки меньше этого (секунд) не считается перегрузкой - шум сети на быстрых командах
+RTT_SLACK = 0.05
+
+
+class LimiterTimeout(RuntimeError):
+    pass
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """Ошибки, говорящие о перегрузке FreeIPA, а не о данных запроса (NotFound и т.п.)"""
+    if isinstance(error, requests.RequestException):
+        return True
+    code = getattr(error, "code", None)
+    return type(error) is FreeIPAError and isinstance(code, int) and 500 <= code < 600
+
+
+class _CommandRtt:
+    __slots__ = ("minimum", "window_minimum", "samples")
+
+    def __init__(self) -> None:
+        self.minimum = float("inf")
+        self.window_minimum = float("inf")
+        self.samples = 0
+
+    def update(self, rtt: float, rebase: bool) -> float:
+        """
+        Добавляет замер, возвращает текущую минимальную задержку команды
+
+        rebase - лимит уже на минимуме: если и так задержка не вернулась
+        к прежней, FreeIPA стал медленнее, и минимум окна становится новой базой.
+        Без этого условия база ползла бы вверх вместе с перегрузкой.
+        """
+        self.minimum = min(self.minimum, rtt)
+        self.window_minimum = min(self.window_minimum, rtt)
+        self.samples += 1
+        if self.samples >= RTT_WINDOW:
+            if rebase:
+                self.minimum = self.window_minimum
+            self.window_minimum = float("inf")
+            self.samples = 0
+        return self.minimum
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        tolerance: float,
+        backoff: float,
+        wait_timeout: float,
+    ) -> None:
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.wait_timeout = wait_timeout
+        self.inflight = 0
+        self._priority_waiting = 0
+        self._since_decrease = 0
+        self._rtt: Dict[str, _CommandRtt] = {}
+        self._condition = threading.Condition()
+        IPA_CONCURRENCY_LIMIT.set(initial)
+
+    def _can_start(self, priority: bool) -> bool:
+        if self.inflight >= int(self.limit):
+            return False
+        return priority or not self._priority_waiting
+
+    @contextmanager
+    def acquire(self, method: str) -> Iterator[None]:
+        """Место для одного вызова FreeIPA на время блока; по выходу - корректировка лимита"""
+        priority = not bulk_context.get()
+        started = time.monotonic()
+        with self._condition:
+            if not self._can_start(priority):
+                if priority:
+                    self._priority_waiting += 1
+                try:
+                    if not self._condition.wait_for(lambda: self._can_start(priority), self.wait_timeout):
+                        raise LimiterTimeout("FreeIPA перегружен: нет свободных мест для запроса")
+                finally:
+                    if priority:
+                        self._priority_waiting -= 1
+            self.inflight += 1
+        IPA_LIMITER_WAIT_SECONDS.observe(time.monotonic() - started)
+        IPA_INFLIGHT.inc()
+
+        started = time.monotonic()
+        overloaded = False
+        try:
+            yield
+        except BaseException as e:
+            overloaded = is_overload_error(e)
+            raise
+        finally:
+            IPA_INFLIGHT.dec()
+            self._complete(method, time.monotonic() - started, overloaded)
+
+    def _complete(self, method: str, rtt: float, overloaded: bool) -> None:
+        with self._condition:
+            self.inflight -= 1
+            if not overloaded:
+                minimum = self._rtt.setdefault(method, _CommandRtt()).update(rtt, self.limit <= self.min_limit)
+                overloaded = rtt > max(minimum * self.tolerance, minimum + RTT_SLACK)
+            self._since_decrease += 1
+            if overloaded:
+                if self._since_decrease >= self.limit:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._since_decrease = 0
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            IPA_CONCURRENCY_LIMIT.set(int(self.limit))
+            self._condition.notify_all()
+
+
+ipa_limiter = (
+    AdaptiveLimiter(
+        IPA_LIMIT_INITIAL,
+        IPA_LIMIT_MIN,
+        IPA_LIMIT_MAX,
+        IPA_LIMIT_LATENCY_TOLERANCE,
+        IPA_LIMIT_BACKOFF,
+        IPA_LIMIT_WAIT_TIMEOUT_SECONDS,
+    )
+    if IPA_LIMIT_ENABLED
+    else None
+)
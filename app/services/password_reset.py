@@ -0,0 +1,181 @@
+"""
+Массовый сброс паролей конвейером resolve -> user_mod -> yopass -> smtp
+
+Стадии работают параллельно с независимым числом потоков
+(BULK_PIPELINE_*_WORKERS), поэтому скорость всей операции упирается в самую
+медленную стадию, а не в сумму задержек FreeIPA, Yopass и SMTP.
+"""
+from typing import Any, Dict, List, Tuple
+
+from python_freeipa import Client
+
+from app.config import (
+    BULK_PIPELINE_IPA_WORKERS,
+    BULK_PIPELINE_QUEUE_SIZE,
+    BULK_PIPELINE_SMTP_WORKERS,
+    BULK_PIPELINE_YOPASS_WORKERS,
+)
+from app.models.user import UserRecord
+from app.services.checkpoints import PENDING, Checkpoint
+from app.services.email import send_password_reset_email
+from app.services.freeipa import get_ipa_domain, resolve_username
+from app.services.identifiers import UsernameClaims, duplicate_entries, merged_entry, normalize_identifiers
+from app.services.pipeline import Pipeline, PipelineItem, Stage
+from app.services.yopass import create_yopass_link
+
+
+def reset_passwords(
+    client: Client,
+    identifiers: List[str],
+    route: str,
+    results: Dict[str, List[Dict[str, Any]]],
+    send_email: bool = False,
+    with_links: bool = True,
+    resolved: Dict[str, str] | None = None,
+    checkpoint: Checkpoint | None = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Сбрасывает пароли списку пользователей, дописывает итоги в results
+    (success/failed/merged, при отмене - cancelled)
+
+    Повторы одного пользователя (username и email, разный регистр) сбрасываются
+    один раз - иначе у пользователя оказалось бы два разных пароля.
+
+    with_links - создавать Yopass ссылки и возвращать их в ответе; при send_email
+    ссылка создаётся в любом случае, потому что уходит в письме.
+    resolved - username, уже найденные превью (identifier -> username); такие
+    идентификаторы не резолвятся повторно.
+    checkpoint - итоги прошлых попыток той же операции: готовые элементы не
+    выполняются. Пароль в контрольную точку не пишется: элемент, для которого
+    уже создана ссылка Yopass (pending), идёт к письму без повторного user_mod,
+    а элемент без ссылки сбрасывается заново - прежний пароль никому не выдан.
+    Успех без ссылки в ответе и без отправленного письма остаётся pending:
+    повтор не может вернуть его пароль и выполняет элемент заново.
+    Пользователи элементов прошлых попыток заняты с самого начала, поэтому
+    другой идентификатор того же пользователя не сбрасывается второй раз.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    domain = get_ipa_domain(client)
+    resolved = resolved or {}
+    identifiers, duplicates = normalize_identifiers(identifiers)
+    # Пользователи, обработанные прошлыми попытками, заняты до запуска конвейера
+    claims = UsernameClaims(checkpoint.claimed(identifiers))
+
+    def resolve(item: PipelineItem) -> None:
+        saved = checkpoint.pending(item.identifier)
+        if saved is not None:
+            item.data.update(saved)
+            claims.claim(item.identifier, saved["username"])
+            return
+        username = resolved.get(item.identifier) or resolve_username(client, item.identifier)
+        item.data["username"] = username
+        owner = claims.claim(item.identifier, username)
+        if owner is not None:
+            item.data["merged_into"] = owner
+            item.skipped = True
+
+    def reset(item: PipelineItem) -> None:
+        if item.data.get("yopass_link"):
+            # Сброшен прошлой попыткой операции, ссылка уже создана (pending в контрольной точке)
+            return
+        username = item.data["username"]
+        reset_result = client._request("user_mod", args=[username], params={"random": True})
+        user = UserRecord.from_ipa(reset_result["result"])
+        item.data.update(
+            password=reset_result["result"]["randompassword"],
+            login=f"{username}@{domain}" if domain else username,
+            email=user.email,
+            status=user.status,
+            expiration=user.password_expiration,
+            yopass_link="",
+            email_sent=False,
+            email_error=None,
+        )
+        # Пароль уже изменён: пользователь найден, при повторе резолв не нужен
+        checkpoint.record(item.identifier, PENDING, item.data)
+
+    def yopass(item: PipelineItem) -> None:
+        if item.data["yopass_link"]:
+            return
+        item.data["yopass_link"] = create_yopass_link(item.data["login"], item.data["password"])
+        # Ссылка создана: при повторе операции пароль больше не нужен
+        checkpoint.record(item.identifier, PENDING, item.data)
+
+    def smtp(item: PipelineItem) -> None:
+        # Ошибка письма не отменяет сброс: пользователь остаётся в success с email_error
+        if not item.data["email"]:
+            item.data["email_error"] = "У пользователя не указан email"
+            return
+        try:
+            send_password_reset_email(
+                recipient=item.data["email"],
+                username=item.data["login"],
+                yopass_link=item.data["yopass_link"],
+                expiration=item.data["expiration"],
+            )
+            item.data["email_sent"] = True
+        except Exception as e:
+            item.data["email_error"] = str(e)
+
+    # При отмене элемент снимается до user_mod; со сброшенным паролем доходит до ссылки и письма
+    stages = [
+        Stage("resolve", resolve, BULK_PIPELINE_IPA_WORKERS, cancellable=True),
+        Stage("user_mod", reset, BULK_PIPELINE_IPA_WORKERS, cancellable=True),
+    ]
+    if with_links or send_email:
+        stages.append(Stage("yopass", yopass, BULK_PIPELINE_YOPASS_WORKERS))
+    if send_email:
+        stages.append(Stage("smtp", smtp, BULK_PIPELINE_SMTP_WORKERS))
+
+    def outcome(item: PipelineItem) -> Tuple[str, Dict[str, Any]]:
+        if item.cancelled:
+            return "cancelled", {"identifier": item.identifier}
+        if item.error is not None:
+            return "failed", {"identifier": item.identifier, "error": str(item.error)}
+        if item.skipped:
+            return "merged", merged_entry(item.identifier, item.data["username"], item.data["merged_into"])
+        entry = {
+            "identifier": item.identifier,
+            "username": item.data["username"],
+            "email": item.data["email"],
+            "password": item.data["password"],
+        }
+        if with_links:
+            entry["yopass_link"] = item.data["yopass_link"]
+        entry.update(
+            status=item.data["status"],
+            email_sent=item.data["email_sent"],
+            email_error=item.data["email_error"],
+        )
+        return "success", entry
+
+    def finished(item: PipelineItem) -> None:
+        # Итог пишется, как только элемент сошёл с конвейера, а не в конце операции;
+        # отменённые не пишутся - повтор с тем же ключом их выполнит
+        if item.cancelled:
+            return
+        key, entry = outcome(item)
+        if key == "success" and not (with_links or entry["email_sent"]):
+            # Пароль выдан только в этом ответе и в контрольную точку не пишется:
+            # элемент остаётся pending, повтор сбросит пароль заново (или повторит письмо)
+            return
+        checkpoint.record(item.identifier, key, entry)
+
+    pipeline = Pipeline(route, stages, BULK_PIPELINE_QUEUE_SIZE)
+    items = {
+        item.identifier: item
+        for item in pipeline.run(checkpoint.unfinished(identifiers), on_done=finished, stop=checkpoint.cancelled)
+    }
+    # Итоги прошлых попыток - на своих местах в исходном порядке; не поданные до отмены - в cancelled
+    usernames = {}
+    for identifier in identifiers:
+        item = items.get(identifier)
+        if item is not None:
+            key, entry = outcome(item)
+        else:
+            key, entry = checkpoint.saved(identifier) or ("cancelled", {"identifier": identifier})
+        results.setdefault(key, []).append(entry)
+        if entry.get("username"):
+            usernames[identifier] = entry["username"]
+    results.setdefault("merged", []).extend(duplicate_entries(duplicates, usernames))
+    return results
@@ -0,0 +1,178 @@
+"""
+Конвейер для bulk операций
+
+Каждый элемент проходит стадии по порядку (например resolve -> user_mod ->
+yopass -> smtp), но стадии работают параллельно друг другу: у каждой свой
+набор потоков и ограниченная очередь на входе. Медленная стадия не держит
+остальные, а полная очередь притормаживает предыдущую стадию, поэтому
+в памяти одновременно не больше queue_size элементов на стадию.
+
+Элемент, на котором стадия бросила исключение, дальше не идёт - он
+попадает в результат с ошибкой; так же - если упал сам on_done или
+передача элемента дальше. Стадия может и сама снять элемент с
+конвейера без ошибки (item.skipped = True), например повтор уже
+обработанного пользователя.
+
+При отмене (stop() вернул True) новые элементы в конвейер не подаются,
+а элементы, ещё не прошедшие отменяемые стадии (до изменения в FreeIPA),
+снимаются с cancelled = True. Начатые вызовы и стадии после изменения
+(ссылка, письмо) доделываются.
+"""
+import contextvars
+import logging
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List
+
+from app.observability.metrics import (
+    PIPELINE_QUEUE_DEPTH,
+    PIPELINE_STAGE_BUSY,
+    PIPELINE_STAGE_SECONDS,
+    observe,
+)
+from app.observability.profiling import request_thread
+from app.observability.tracing import hash_username, span
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+@dataclass
+class PipelineItem:
+    index: int
+    identifier: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    error: Exception | None = None
+    failed_stage: str | None = None
+    skipped: bool = False
+    cancelled: bool = False
+
+
+@dataclass
+class Stage:
+    """
+    Стадия конвейера: func(item) дополняет item.data или бросает исключение
+
+    cancellable - при отмене элемент снимается перед этой стадией
+    """
+    name: str
+    func: Callable[[PipelineItem], None]
+    workers: int
+    cancellable: bool = False
+
+
+class Pipeline:
+    def __init__(self, route: str, stages: List[Stage], queue_size: int) -> None:
+        self.route = route
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(
+        self,
+        identifiers: Iterable[str],
+        on_done: Callable[[PipelineItem], None] | None = None,
+        stop: Callable[[], bool] | None = None,
+    ) -> List[PipelineItem]:
+        """
+        Прогоняет элементы через все стадии, результат - в исходном порядке
+
+        on_done вызывается из потока стадии для каждого элемента, сошедшего
+        с конвейера (прошёл все стадии, упал или снят), - не дожидаясь остальных.
+        stop - проверка отмены; элементов, не поданных до отмены, в результате нет
+        """
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+        done: List[PipelineItem] = []
+
+        def forward(position: int, item: PipelineItem) -> None:
+            if item.error is not None or item.skipped or item.cancelled or position + 1 == len(self.stages):
+                if on_done is not None:
+                    on_done(item)
+                done.append(item)
+            else:
+                PIPELINE_QUEUE_DEPTH.labels(stage=self.stages[position + 1].name).inc()
+                queues[position + 1].put(item)
+
+        def worker(position: int) -> None:
+            stage = self.stages[position]
+            try:
+                while True:
+                    item = queues[position].get()
+                    if item is _STOP:
+                        break
+                    try:
+                        PIPELINE_QUEUE_DEPTH.labels(stage=stage.name).dec()
+                        if stage.cancellable and stop is not None and stop():
+                            item.cancelled = True
+                        else:
+                            self._process(stage, item)
+                        forward(position, item)
+                    except Exception as e:
+                        # Сбой on_done или передачи дальше не должен убивать поток:
+                        # иначе следующая стадия не получит _STOP и run() зависнет
+                        logger.exception("Сбой конвейера %s на стадии %s", self.route, stage.name)
+                        if item.error is None:
+                            item.error = e
+                            item.failed_stage = stage.name
+                        done.append(item)
+            finally:
+                # Последний поток стадии закрывает вход следующей
+                with remaining_lock:
+                    remaining[position] -= 1
+                    last = remaining[position] == 0
+                if last and position + 1 < len(self.stages):
+                    for _ in range(self.stages[position + 1].workers):
+                        queues[position + 1].put(_STOP)
+
+        def thread_main(position: int) -> None:
+            # Профиль запроса (если он профилируется) включает и потоки стадий
+            with request_thread():
+                worker(position)
+
+        threads = []
+        for position, stage in enumerate(self.stages):
+            for number in range(stage.workers):
+                # У каждого потока своя копия контекста - span'ы стадий попадают в трассу запроса
+                context = contextvars.copy_context()
+                thread = threading.Thread(
+                    target=context.run,
+                    args=(thread_main, position),
+                    name=f"{self.route}-{stage.name}-{number}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        first = self.stages[0].name
+        try:
+            for index, identifier in enumerate(identifiers):
+                if stop is not None and stop():
+                    break
+                PIPELINE_QUEUE_DEPTH.labels(stage=first).inc()
+                queues[0].put(PipelineItem(index=index, identifier=identifier))
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_STOP)
+            for thread in threads:
+                thread.join()
+
+        done.sort(key=lambda item: item.index)
+        return done
+
+    def _process(self, stage: Stage, item: PipelineItem) -> None:
+        busy = PIPELINE_STAGE_BUSY.labels(stage=stage.name)
+        busy.inc()
+        try:
+            with (
+                span("bulk.stage", route=self.route, stage=stage.name, user=hash_username(item.identifier)),
+                observe(PIPELINE_STAGE_SECONDS, route=self.route, stage=stage.name),
+            ):
+                stage.func(item)
+        except Exception as e:
+            item.error = e
+            item.failed_stage = stage.name
+        finally:
+            busy.dec()
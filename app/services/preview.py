@@ -0,0 +1,80 @@
+"""
+Превью bulk операций и токен превью
+
+Превью (bulk-disable-preview, bulk-disable-preview-list) резолвит каждый
+идентификатор и сохраняет результат в общем хранилище под случайным токеном,
+привязанным к оператору. Выполнение (bulk-disable, bulk-enable, сбросы паролей)
+с этим токеном берёт username из превью и не резолвит список второй раз.
+Идентификаторы, которых не было в превью, резолвятся как обычно.
+
+Вместе с username превью хранит состояние учётной записи (nsaccountlock):
+блокировка и разблокировка с токеном не перечитывают его у всех
+пользователей (см. change_state в app/routers/bulk.py).
+"""
+import uuid
+from typing import Any, Dict, List, Tuple
+
+from app.config import BULK_PREVIEW_TTL_SECONDS, logger
+from app.dependencies import session_store
+
+PREVIEW_NAMESPACE = "bulk_previews"
+
+
+def save_preview(operator: str, entries: List[Dict[str, str]], disabled: Dict[str, bool] | None = None) -> str:
+    """
+    Сохраняет найденных пользователей превью (identifier, username) и их
+    состояние (username -> заблокирован ли), возвращает токен
+    """
+    # Выполнение может прийти и с исходными идентификаторами, и с username из превью
+    resolved = {}
+    for entry in entries:
+        resolved[entry["identifier"]] = entry["username"]
+        resolved[entry["username"]] = entry["username"]
+    token = uuid.uuid4().hex
+    session_store.put(
+        PREVIEW_NAMESPACE,
+        token,
+        {"operator": operator, "resolved": resolved, "disabled": disabled or {}},
+        ttl=BULK_PREVIEW_TTL_SECONDS,
+    )
+    return token
+
+
+def load_preview(token: str | None, operator: str) -> Dict[str, str]:
+    """
+    identifier -> username из превью
+
+    Пустой словарь, если токена нет, он истёк или выдан другому оператору -
+    тогда все идентификаторы резолвятся заново.
+    """
+    return load_preview_state(token, operator)[0]
+
+
+def load_preview_state(token: str | None, operator: str) -> Tuple[Dict[str, str], Dict[str, bool]]:
+    """identifier -> username и username -> заблокирован ли из превью (пустые, как в load_preview)"""
+    if not token:
+        return {}, {}
+    preview = session_store.get(PREVIEW_NAMESPACE, token)
+    if preview is None or preview.get("operator") != operator:
+        logger.warning("Preview token %s not usable for %s, resolving identifiers again", token[:8], operator)
+        return {}, {}
+    return preview["resolved"], preview.get("disabled") or {}
+
+
+def preview_response(operator: str, identifiers: List[str], resolution: Dict[str, List[Dict[str, str]]]) -> Dict[str, Any]:
+    """Ответ превью по результату resolve_unique (app/services/identifiers.py)"""
+    found = resolution["found"]
+    merged = resolution["merged"]
+    known = found + [entry for entry in merged if entry["username"]]
+    token = save_preview(operator, known, resolution["disabled"]) if found else None
+    return {
+        "found": found,
+        "not_found": resolution["not_found"],
+        "merged": merged,
+        "total": len(identifiers),
+        "found_count": len(found),
+        "not_found_count": len(resolution["not_found"]),
+        "merged_count": len(merged),
+        "preview_token": token,
+        "preview_expires_in": BULK_PREVIEW_TTL_SECONDS if token else None,
+    }
@@ -0,0 +1,191 @@
+"""
+Хранилище разделяемого состояния (сессии и т.п.)
+
+Состояние должно быть видно всем воркерам uvicorn, поэтому по умолчанию
+используется SQLite файл на локальном диске. Для одного процесса (разработка)
+подходит MemoryStore. Другой бэкенд (например Redis) реализует тот же
+интерфейс StateStore и подключается в create_store().
+"""
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import orjson
+
+
+class StateStore(ABC):
+    """
+    Key-value хранилище с TTL, разделённое на пространства имён
+
+    Значения - JSON-совместимые словари. Просроченные записи не возвращаются
+    и удаляются при чтении либо через purge_expired().
+    """
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def put(self, namespace: str, key: str, value: Dict[str, Any], ttl: float) -> None:
+        """Сохраняет значение на ttl секунд (перезаписывает существующее)"""
+
+    @abstractmethod
+    def put_if_absent(self, namespace: str, key: str, value: Dict[str, Any], ttl: float) -> bool:
+        """
+        Атомарно сохраняет значение на ttl секунд, только если живой записи нет
+
+        True - запись сохранена; False - ключ уже занят (в том числе другим воркером)
+        """
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """Удаляет просроченные записи, возвращает их количество"""
+
+    @abstractmethod
+    def count(self, namespace: str) -> int:
+        """Количество живых записей в пространстве имён"""
+
+
+class MemoryStore(StateStore):
+    """Хранилище в памяти процесса - только для одного воркера"""
+
+    def __init__(self) -> None:
+        self._data: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._data.get((namespace, key))
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= time.time():
+                del self._data[(namespace, key)]
+                return None
+            return orjson.loads(value)
+
+    def put(self, namespace: str, key: str, value: Dict[str, Any], ttl: float) -> None:
+        # Храним сериализованным, чтобы поведение совпадало с SQLite (без общих ссылок)
+        with self._lock:
+            self._data[(namespace, key)] = (time.time() + ttl, orjson.dumps(value))
+
+    def put_if_absent(self, namespace: str, key: str, value: Dict[str, Any], ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            item = self._data.get((namespace, key))
+            if item is not None and item[0] > now:
+                return False
+            self._data[(namespace, key)] = (now + ttl, orjson.dumps(value))
+            return True
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (expires, _) in self._data.items() if expires <= now]
+            for k in expired:
+                del self._data[k]
+        return len(expired)
+
+    def count(self, namespace: str) -> int:
+        now = time.time()
+        with self._lock:
+            return sum(1 for (ns, _), (expires, _) in self._data.items() if ns == namespace and expires > now)
+
+
+class SQLiteStore(StateStore):
+    """
+    Хранилище в SQLite файле, общее для всех процессов на одном хосте
+
+    WAL режим позволяет читать параллельно с записью, соединение своё у каждого потока.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        # Соединения SQLite нельзя переносить через fork (preload_app в продакшен режиме)
+        os.register_at_fork(after_in_child=self._reset_connections)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value BLOB NOT NULL,"
+            " expires REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS state_expires ON state (expires)")
+        # В файле лежат cookie сессий FreeIPA - доступ только владельцу
+        os.chmod(path, 0o600)
+
+    def _reset_connections(self) -> None:
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=10000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ? AND expires > ?",
+            (namespace, key, time.time()),
+        ).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def put(self, namespace: str, key: str, value: Dict[str, Any], ttl: float) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+            (namespace, key, orjson.dumps(value), time.time() + ttl),
+        )
+
+    def put_if_absent(self, namespace: str, key: str, value: Dict[str, Any], ttl: float) -> bool:
+        # Одна инструкция: просроченная запись перезаписывается, живая - нет (rowcount 0)
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO state (namespace, key, value, expires) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires = excluded.expires"
+            " WHERE state.expires <= ?",
+            (namespace, key, orjson.dumps(value), now + ttl, now),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._conn().execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def purge_expired(self) -> int:
+        cursor = self._conn().execute("DELETE FROM state WHERE expires <= ?", (time.time(),))
+        return cursor.rowcount
+
+    def count(self, namespace: str) -> int:
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM state WHERE namespace = ? AND expires > ?",
+            (namespace, time.time()),
+        ).fetchone()
+        return row[0]
+
+
+def create_store(backend: str, path: str) -> StateStore:
+    """Создаёт хранилище по имени бэкенда из настроек (STATE_BACKEND)"""
+    if backend == "memory":
+        return MemoryStore()
+    if backend == "sqlite":
+        return SQLiteStore(path)
+    raise ValueError(f"Неизвестный STATE_BACKEND: {backend}")
@@ -0,0 +1,491 @@
+"""
+Массовое создание пользователей: проверка строк, план и выполнение
+
+validate-excel проверяет файл и сохраняет план - разобранные и проверенные
+строки - в общем хранилище под случайным токеном (plan_token), привязанным к
+оператору и хешу файла. bulk-create-from-excel с этим токеном и тем же файлом
+не разбирает и не проверяет файл построчно заново: один
+user_find сверяет план с текущим состоянием FreeIPA, и ошибкой становятся
+только строки, у которых что-то изменилось (username или email заняли,
+группу удалили).
+
+bulk-create принимает те же строки JSON массивом или NDJSON потоком и
+проверяет/создаёт их пачками по мере прихода тела запроса (stream_create_users).
+"""
+import hashlib
+import logging
+import secrets
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Set, Tuple
+
+import orjson
+from pydantic import ValidationError
+from python_freeipa import Client
+from starlette.concurrency import run_in_threadpool
+
+from app.config import CREATE_PLAN_TTL_SECONDS, IPA_BATCH_SIZE
+from app.dependencies import session_store
+from app.models.user import UserCreate, decode_users
+from app.observability.log import fields
+from app.services.checkpoints import PENDING, Checkpoint
+from app.services.jobs import jobs
+from app.services.yopass import create_yopass_link
+from app.utils.excel import make_username, parse_excel_row, parse_fio, parse_groups
+from app.utils.validation import is_valid_email
+
+PLAN_NAMESPACE = "create_plans"
+
+# Ошибка group_add_member для пользователя, который уже в группе
+ALREADY_MEMBER = "This entry is already a member"
+
+# Построчные логи bulk операций - отдельный логгер, чтобы их можно было прореживать (LOG_SAMPLING)
+bulk_logger = logging.getLogger("app.bulk")
+
+
+def file_hash(contents: bytes) -> str:
+    return hashlib.sha256(contents).hexdigest()
+
+
+def excel_rows(sheet) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Непустые строки листа (с номером строки Excel), первая строка - заголовок"""
+    for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
+        if row and row[0]:
+            data = parse_excel_row(row)
+            data["groups"] = parse_groups(data.pop("groups_str"))
+            yield row_num, data
+
+
+def directory_snapshot(client: Client) -> Tuple[Set[str], Dict[str, str]]:
+    """Все username и email (email -> username) из FreeIPA одним запросом"""
+    # Нужны только uid и mail - они есть в стандартном наборе атрибутов, all не требуется
+    users = decode_users(
+        client._request("user_find", args=[], params={"all": False, "sizelimit": 0})["result"]
+    )
+    return {u.username for u in users}, {u.email.lower(): u.username for u in users if u.email}
+
+
+class GroupChecker:
+    """Проверка существования групп с кэшем (group_show один раз на группу)"""
+
+    def __init__(self, client: Client) -> None:
+        self.client = client
+        self._exists: Dict[str, bool] = {}
+
+    def missing(self, groups: Iterable[str]) -> List[str]:
+        result = []
+        for group in groups:
+            if group not in self._exists:
+                try:
+                    self.client._request("group_show", args=[group])
+                    self._exists[group] = True
+                except Exception:
+                    self._exists[group] = False
+            if not self._exists[group]:
+                result.append(group)
+        return result
+
+
+class RowChecker:
+    """
+    Проверка строк против FreeIPA и друг друга
+
+    Снимок пользователей FreeIPA делается один раз при создании; потоковое
+    создание проверяет им все пачки и дописывает в него созданных
+    пользователей (remember), чтобы повтор в следующей пачке стал конфликтом.
+    """
+
+    def __init__(self, client: Client) -> None:
+        self.existing_usernames, self.existing_emails = directory_snapshot(client)
+        self.groups = GroupChecker(client)
+        self.emails_in_file: Dict[str, int] = {}  # Для отслеживания дубликатов внутри файла
+
+    def remember(self, row: Dict[str, Any]) -> None:
+        self.existing_usernames.add(row["username"])
+        self.existing_emails[row["email"].lower()] = row["username"]
+
+    def check(self, row_num: int, data: Dict[str, Any]) -> Tuple[Dict[str, Any] | None, Dict[str, Any] | None, List[Dict[str, Any]]]:
+        """
+        Проверяет строку: data - fio, email, phone, title, groups и, если
+        известны отдельно (JSON), first_name и last_name
+
+        Возвращает (строка плана или None, конфликт или None, предупреждения)
+        """
+        fio = data["fio"]
+        email = data["email"]
+        try:
+            if not fio:
+                return None, {"row": row_num, "error": "ФИО не заполнено"}, []
+
+            if not email:
+                return None, {"row": row_num, "fio": fio, "error": "Email не заполнен"}, []
+
+            if not is_valid_email(email):
+                return None, {"row": row_num, "fio": fio, "error": f"Невалидный email: {email}"}, []
+
+            email_lower = email.lower()
+            if email_lower in self.emails_in_file:
+                return None, {
+                    "row": row_num,
+                    "fio": fio,
+                    "error": f"Дубликат email {email} (уже в строке {self.emails_in_file[email_lower]})"
+                }, []
+            self.emails_in_file[email_lower] = row_num
+
+            if data.get("first_name") and data.get("last_name"):
+                last_name, first_name = data["last_name"], data["first_name"]
+                username = make_username(first_name, last_name)
+            else:
+                fio_parsed = parse_fio(fio)
+                if not fio_parsed:
+                    return None, {"row": row_num, "fio": fio, "error": "ФИО должно содержать минимум Фамилию и Имя"}, []
+                last_name, first_name, username = fio_parsed
+
+            row_errors = []
+            if username in self.existing_usernames:
+                row_errors.append(f"Username '{username}' уже существует в FreeIPA")
+            if email_lower in self.existing_emails:
+                row_errors.append(f"Email '{email}' уже существует в FreeIPA")
+            if row_errors:
+                return None, {
+                    "row": row_num,
+                    "fio": fio,
+                    "username": username,
+                    "email": email,
+                    "error": "; ".join(row_errors)
+                }, []
+
+            groups_list = data["groups"]
+            non_existing_groups = self.groups.missing(groups_list)
+            if non_existing_groups:
+                return None, {
+                    "row": row_num,
+                    "fio": fio,
+                    "username": username,
+                    "error": f"Группы не существуют: {', '.join(non_existing_groups)}"
+                }, []
+
+            # Предупреждения (не блокируют создание)
+            warnings = []
+            if not data["phone"]:
+                warnings.append({"row": row_num, "fio": fio, "username": username, "message": "Телефон не заполнен"})
+            if not data["title"]:
+                warnings.append({"row": row_num, "fio": fio, "username": username, "message": "Должность не заполнена"})
+
+            return {
+                "row": row_num,
+                "fio": fio,
+                "first_name": first_name,
+                "last_name": last_name,
+                "username": username,
+                "email": email,
+                "phone": data["phone"],
+                "title": data["title"],
+                "groups": groups_list,
+            }, None, warnings
+
+        except Exception as e:
+            return None, {"row": row_num, "fio": fio or "unknown", "error": f"Неожиданная ошибка: {str(e)}"}, []
+
+
+def check_rows(client: Client, rows: Iterable[Tuple[int, Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Проверяет строки файла против FreeIPA и друг друга
+
+    Возвращает plan (строки, готовые к созданию), conflicts и warnings
+    """
+    plan = []
+    conflicts = []
+    warnings = []
+    checker = RowChecker(client)
+
+    for row_num, data in rows:
+        row, conflict, row_warnings = checker.check(row_num, data)
+        if row is not None:
+            plan.append(row)
+        if conflict is not None:
+            conflicts.append(conflict)
+        warnings.extend(row_warnings)
+
+    return {"plan": plan, "conflicts": conflicts, "warnings": warnings}
+
+
+def save_plan(operator: str, contents: bytes, plan: List[Dict[str, Any]], conflicts: List[Dict[str, Any]]) -> str:
+    """Сохраняет план проверенного файла, возвращает токен"""
+    # Токен случайный: по файлу его не угадать, а два оператора с одним файлом не затирают планы друг друга
+    token = secrets.token_urlsafe(32)
+    session_store.put(
+        PLAN_NAMESPACE,
+        token,
+        {"operator": operator, "file_hash": file_hash(contents), "rows": plan, "conflicts": conflicts},
+        ttl=CREATE_PLAN_TTL_SECONDS,
+    )
+    return token
+
+
+def load_plan(token: str, operator: str, contents: bytes) -> Dict[str, Any] | None:
+    """План по токену, если он не истёк, создан тем же оператором и для того же файла"""
+    plan = session_store.get(PLAN_NAMESPACE, token)
+    if plan is None or plan.get("operator") != operator or plan.get("file_hash") != file_hash(contents):
+        return None
+    return plan
+
+
+def recheck_plan(client: Client, rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Сверяет проверенные при валидации строки с текущим состоянием FreeIPA
+
+    Возвращает (строки для создания, строки, ставшие конфликтными после валидации)
+    """
+    existing_usernames, existing_emails = directory_snapshot(client)
+    groups = GroupChecker(client)
+    ready = []
+    changed = []
+    for row in rows:
+        row_errors = []
+        if row["username"] in existing_usernames:
+            row_errors.append(f"Username '{row['username']}' уже существует в FreeIPA")
+        owner = existing_emails.get(row["email"].lower())
+        if owner:
+            row_errors.append(f"Email '{row['email']}' уже используется пользователем {owner}")
+        non_existing_groups = groups.missing(row["groups"])
+        if non_existing_groups:
+            row_errors.append(f"Группы не существуют: {', '.join(non_existing_groups)}")
+
+        if row_errors:
+            changed.append({
+                "row": row["row"],
+                "fio": row["fio"],
+                "username": row["username"],
+                "email": row["email"],
+                "error": "; ".join(row_errors)
+            })
+        else:
+            ready.append(row)
+    return ready, changed
+
+
+def add_group_members(client: Client, group: str, usernames: List[str]) -> Dict[str, str]:
+    """
+    Добавляет пользователей в группу пачками по IPA_BATCH_SIZE (один
+    group_add_member на пачку), возвращает username -> ошибка для недобавленных
+    """
+    errors: Dict[str, str] = {}
+    for start in range(0, len(usernames), IPA_BATCH_SIZE):
+        chunk = usernames[start:start + IPA_BATCH_SIZE]
+        try:
+            result = client._request("group_add_member", args=[group], params={"user": chunk})
+        except Exception as e:
+            # Ошибка всего вызова (группа удалена, сеть) - не добавлен никто из пачки
+            for username in chunk:
+                errors[username] = str(e)
+            continue
+        failed = ((result.get("failed") or {}).get("member") or {}).get("user") or []
+        for username, error in failed:
+            errors[username] = error
+    return errors
+
+
+def create_users(
+    client: Client,
+    rows: List[Dict[str, Any]],
+    results: Dict[str, List[Dict[str, Any]]],
+    admin: str,
+    checkpoint: Checkpoint | None = None,
+) -> None:
+    """
+    Создаёт проверенные строки плана, дописывает итоги в results (success/failed)
+
+    Сначала создаются пользователи, затем членство в группах пишется одним
+    group_add_member на группу (пачками) и раскладывается обратно по
+    пользователям. Как и раньше, пользователь, которого не удалось добавить
+    в группы, остаётся созданным - ошибки групп возвращаются в его записи.
+
+    Созданный пользователь сразу попадает в контрольную точку (pending): при
+    повторе операции строка не создаётся второй раз, а только получает группы.
+    Пароль в контрольной точке не хранится - если ссылка Yopass не успела
+    создаться, при повторе пароль сбрасывается заново (прежний никому не выдан).
+    После отмены оставшиеся строки попадают в cancelled.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    created = []
+    resumed = set()
+    for row in rows:
+        row_num = row["row"]
+        username = row["username"]
+        saved = checkpoint.pending(str(row_num))
+        if saved is None and checkpoint.cancelled():
+            # Новых пользователей после отмены не создаём; созданные доделываются (ссылка, группы)
+            results.setdefault("cancelled", []).append({"row": row_num, "fio": row["fio"]})
+            continue
+        try:
+            if saved is not None:
+                resumed.add(username)
+                success_entry = saved["entry"]
+                if not success_entry["yopass_link"]:
+                    reset_result = client._request("user_mod", args=[username], params={"random": True})
+                    success_entry["password"] = reset_result["result"]["randompassword"]
+                    success_entry["yopass_link"] = create_yopass_link(username, success_entry["password"])
+                    checkpoint.record(str(row_num), PENDING, {"row": row, "entry": success_entry})
+                created.append((row, success_entry))
+                continue
+
+            result = client._request(
+                "user_add",
+                args=[username],
+                params={
+                    "givenname": row["first_name"],
+                    "sn": row["last_name"],
+                    "cn": row["fio"],
+                    "mail": row["email"],
+                    "title": row["title"],
+                    "telephonenumber": row["phone"],
+                    "random": True,
+                }
+            )
+
+            success_entry = {
+                "row": row_num,
+                "fio": row["fio"],
+                "username": username,
+                "email": row["email"],
+                "password": result['result']['randompassword'],
+                "yopass_link": ""
+            }
+            # Пользователь уже создан: при повторе операции user_add для строки не отправляется
+            checkpoint.record(str(row_num), PENDING, {"row": row, "entry": success_entry})
+            success_entry["yopass_link"] = create_yopass_link(username, success_entry["password"])
+            # Ссылка создана: при повторе пароль больше не нужен
+            checkpoint.record(str(row_num), PENDING, {"row": row, "entry": success_entry})
+            created.append((row, success_entry))
+
+        except Exception as e:
+            checkpoint.add(results, "failed", {"row": row_num, "fio": row["fio"], "error": str(e)})
+            bulk_logger.error("BULK_CREATE_EXCEL: Failed row %s - %s", row_num, e, extra=fields("user_create", admin, f"row {row_num}", outcome="failed"))
+
+    members: Dict[str, List[str]] = {}
+    for row, _ in created:
+        for group in dict.fromkeys(row["groups"]):
+            members.setdefault(group, []).append(row["username"])
+    group_errors = {group: add_group_members(client, group, usernames) for group, usernames in members.items()}
+
+    for row, success_entry in created:
+        username = row["username"]
+        if row["groups"]:
+            added_groups = []
+            failed_groups = []
+            for group in row["groups"]:
+                error = group_errors[group].get(username)
+                # Группу могла успеть назначить прошлая попытка операции
+                if error is None or (error == ALREADY_MEMBER and username in resumed):
+                    added_groups.append(group)
+                else:
+                    failed_groups.append({"group": group, "error": error})
+            success_entry["groups"] = {"added": added_groups, "failed": failed_groups}
+
+        checkpoint.add(results, "success", success_entry)
+        bulk_logger.info("BULK_CREATE_EXCEL: Created %s from row %s", username, row["row"], extra=fields("user_create", admin, username, outcome="success"))
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()
+    )
+
+
+def create_records(
+    client: Client,
+    checker: RowChecker,
+    records: List[Tuple[int, Any]],
+    admin: str,
+) -> List[Dict[str, Any]]:
+    """
+    Проверяет и создаёт пачку записей bulk-create (формата UserCreate)
+
+    Возвращает по строке ответа на каждую запись, в порядке номеров:
+    итог create_users или конфликт проверки со status success/failed
+    """
+    lines: Dict[int, Dict[str, Any]] = {}
+    rows = []
+    for row_num, record in records:
+        if isinstance(record, Exception):
+            lines[row_num] = {"row": row_num, "status": "failed", "error": str(record)}
+            continue
+        try:
+            user = UserCreate.model_validate(record)
+        except ValidationError as e:
+            lines[row_num] = {"row": row_num, "status": "failed", "error": f"Невалидная запись: {_validation_message(e)}"}
+            continue
+        data = {
+            "fio": f"{user.last_name} {user.first_name}".strip(),
+            "first_name": user.first_name.strip(),
+            "last_name": user.last_name.strip(),
+            "email": str(user.email),
+            "phone": user.phone,
+            "title": user.title,
+            "groups": user.groups,
+        }
+        row, conflict, _ = checker.check(row_num, data)
+        if conflict is not None:
+            lines[row_num] = {**conflict, "status": "failed"}
+        else:
+            rows.append(row)
+
+    results = {"success": [], "failed": []}
+    create_users(client, rows, results, admin)
+    for row in rows:
+        checker.remember(row)
+    for status, entries in results.items():
+        for entry in entries:
+            lines[entry["row"]] = {**entry, "status": status}
+    return [lines[row_num] for row_num in sorted(lines)]
+
+
+async def stream_create_users(
+    chunks: AsyncIterator[bytes],
+    decoder: Any,
+    client: Client,
+    checker: RowChecker,
+    admin: str,
+) -> AsyncIterator[bytes]:
+    """
+    Создание пользователей из потока записей, ответ - NDJSON по строке на запись
+
+    Записи, завершившиеся в очередном куске тела, сразу проверяются и
+    создаются (пачками по IPA_BATCH_SIZE), итоги уходят клиенту, не дожидаясь
+    конца тела. Последняя строка - {"status": "summary", ...}; фатальная
+    ошибка разбора тела - строка {"status": "error"} и конец потока.
+    """
+    # Для метрик и лога jobs.track - только номера строк, пароли в памяти не копятся
+    outcomes = {"success": [], "failed": []}
+    next_row = 1
+
+    async def process(records: List[Any]) -> AsyncIterator[bytes]:
+        nonlocal next_row
+        for start in range(0, len(records), IPA_BATCH_SIZE):
+            batch = list(enumerate(records[start:start + IPA_BATCH_SIZE], start=next_row))
+            next_row += len(batch)
+            job.total += len(batch)
+            for line in await run_in_threadpool(create_records, client, checker, batch, admin):
+                outcomes[line["status"]].append(line["row"])
+                yield orjson.dumps(line) + b"\n"
+
+    with jobs.track("bulk-create", 0, admin, results=outcomes) as job:
+        final = False
+        chunk_iterator = chunks.__aiter__()
+        while not final:
+            try:
+                data = await chunk_iterator.__anext__()
+            except StopAsyncIteration:
+                data, final = b"", True
+            async for line in process(decoder.feed(data, final=final)):
+                yield line
+            if decoder.error is not None:
+                bulk_logger.error("BULK_CREATE: Stream aborted at record %s - %s", next_row, decoder.error, extra=fields("bulk_create", admin, outcome="failed"))
+                yield orjson.dumps({"status": "error", "row": next_row, "error": str(decoder.error)}) + b"\n"
+                return
+
+    yield orjson.dumps({
+        "status": "summary",
+        "total": next_row - 1,
+        "success": len(outcomes["success"]),
+        "failed": len(outcomes["failed"]),
+    }) + b"\n"
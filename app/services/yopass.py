@@ -1,15 +1,18 @@
 import subprocess
 from app.config import YOPASS, YOPASS_URL
+from app.observability.metrics import YOPASS_LINK_SECONDS, observe
+from app.observability.tracing import hash_username, span
 
 def create_yopass_link(username: str, password: str) -> str:
     secret_data = f"{username}\n{password}"
 
-    link = subprocess.run(
-        [YOPASS, "--api", YOPASS_URL, "--url", YOPASS_URL, "--expiration=1w", "--one-time=true"],
-        input=secret_data,
-        capture_output=True,
-        text=True
-    )
+    with span("yopass.create_link", user=hash_username(username)), observe(YOPASS_LINK_SECONDS):
+        link = subprocess.run(
+            [YOPASS, "--api", YOPASS_URL, "--url", YOPASS_URL, "--expiration=1w", "--one-time=true"],
+            input=secret_data,
+            capture_output=True,
+            text=True
+        )
 
     yopass_link = link.stdout.strip()
     return yopass_link
\ No newline at end of file
@@ -2,6 +2,7 @@ from typing import Dict, Any, List, Tuple, Optional
 from .transliteration import transliterate
 import openpyxl
 from io import BytesIO
+from app.observability.metrics import EXCEL_PARSE_SECONDS, observe
 
 def parse_excel_row(row) -> Dict[str, Any]:
     """Парсит строку Excel"""
@@ -13,6 +14,10 @@ def parse_excel_row(row) -> Dict[str, Any]:
         "groups_str": str(row[4]).strip() if len(row) > 4 and row[4] else ""
     }
 
+def make_username(first_name: str, last_name: str) -> str:
+    """username вида imya.familiya"""
+    return f"{transliterate(first_name).lower()}.{transliterate(last_name).lower()}"
+
 def parse_fio(fio: str) -> Optional[Tuple[str, str, str]]:
     """Парсит ФИО и генерирует username. Возвращает (last_name, first_name, username) или None"""
     fio_parts = fio.split()
@@ -21,9 +26,7 @@ def parse_fio(fio: str) -> Optional[Tuple[str, str, str]]:
 
     last_name = fio_parts[0]
     first_name = fio_parts[1]
-    last_name_en = transliterate(last_name).lower()
-    first_name_en = transliterate(first_name).lower()
-    username = f"{first_name_en}.{last_name_en}"
+    username = make_username(first_name, last_name)
 
     return last_name, first_name, username
 
@@ -33,14 +36,20 @@ def parse_groups(groups_str: str) -> List[str]:
         return []
     return [g.strip() for g in groups_str.split(',') if g.strip()]
 
+def load_workbook(file_bytes: bytes, kind: str = "users") -> openpyxl.Workbook:
+    """Загружает Excel из байтов, время загрузки пишется в метрики по kind"""
+    with observe(EXCEL_PARSE_SECONDS, kind=kind):
+        return openpyxl.load_workbook(BytesIO(file_bytes))
+
 def parse_identifiers_column(file_bytes: bytes) -> List[str]:
     """Читает колонку A из Excel (с min_row=2), возвращает список непустых строк (username или email)"""
-    workbook = openpyxl.load_workbook(BytesIO(file_bytes))
-    sheet = workbook.active
-    identifiers = []
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        if row and row[0]:
-            value = str(row[0]).strip()
-            if value:
-                identifiers.append(value)
+    with observe(EXCEL_PARSE_SECONDS, kind="identifiers"):
+        workbook = openpyxl.load_workbook(BytesIO(file_bytes))
+        sheet = workbook.active
+        identifiers = []
+        for row in sheet.iter_rows(min_row=2, values_only=True):
+            if row and row[0]:
+                value = str(row[0]).strip()
+                if value:
+                    identifiers.append(value)
     return identifiers
\ No newline at end of file
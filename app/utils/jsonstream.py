@@ -0,0 +1,120 @@
+"""
+Потоковый разбор JSON массива и NDJSON
+
+Тело запроса подаётся кусками по мере прихода (feed), декодер возвращает
+записи, которые в этих кусках завершились. Всё тело в памяти не держится -
+только незавершённая запись.
+
+Если дальше разбирать нельзя (сломан синтаксис массива, слишком длинная
+запись), feed возвращает записи до этого места и выставляет error;
+последующие куски игнорируются.
+"""
+import codecs
+import json
+import re
+from typing import Any, List
+
+import orjson
+
+# Больше этого одна запись быть не может - защита от тела без разделителей
+MAX_RECORD_BYTES = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class NdjsonDecoder:
+    """
+    Одна JSON запись на строку
+
+    Невалидная строка не прерывает поток: вместо записи возвращается ValueError.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = b""
+        self.error: ValueError | None = None
+
+    def feed(self, data: bytes, final: bool = False) -> List[Any]:
+        if self.error is not None:
+            return []
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = b"" if final else lines.pop()
+        if len(self._buffer) > MAX_RECORD_BYTES:
+            self.error = ValueError(f"Строка NDJSON длиннее {MAX_RECORD_BYTES} байт")
+        records = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(orjson.loads(line))
+            except orjson.JSONDecodeError as e:
+                records.append(ValueError(f"Невалидный JSON: {e}"))
+        return records
+
+
+class JsonArrayDecoder:
+    """
+    JSON массив объектов: [{...}, {...}]
+
+    Синтаксическая ошибка в массиве фатальна - дальше границы записей не
+    восстановить.
+    """
+
+    def __init__(self) -> None:
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._text = ""
+        # start -> first (после '[') -> separator / item -> done
+        self._state = "start"
+        self.error: ValueError | None = None
+
+    def feed(self, data: bytes, final: bool = False) -> List[Any]:
+        if self.error is not None:
+            return []
+        records = []
+        try:
+            self._parse(self._text + self._utf8.decode(data, final), final, records)
+        except ValueError as e:
+            # UnicodeDecodeError тоже ValueError
+            self.error = e
+        return records
+
+    def _parse(self, text: str, final: bool, records: List[Any]) -> None:
+        pos = 0
+        while True:
+            pos = _WHITESPACE.match(text, pos).end()
+            if pos >= len(text):
+                break
+            char = text[pos]
+            if self._state == "start":
+                if char != "[":
+                    raise ValueError("Ожидался JSON массив")
+                self._state = "first"
+                pos += 1
+            elif self._state == "separator" or (self._state == "first" and char == "]"):
+                if char == "]":
+                    self._state = "done"
+                elif char == ",":
+                    self._state = "item"
+                else:
+                    raise ValueError(f"Ожидалась ',' или ']' на позиции {pos}")
+                pos += 1
+            elif self._state in ("first", "item"):
+                if char != "{":
+                    raise ValueError("Элемент массива должен быть объектом")
+                try:
+                    record, pos = self._decoder.raw_decode(text, pos)
+                except json.JSONDecodeError as e:
+                    if final:
+                        raise ValueError(f"Невалидный JSON: {e}") from None
+                    # Запись ещё не пришла целиком
+                    break
+                records.append(record)
+                self._state = "separator"
+            else:
+                raise ValueError("Данные после конца JSON массива")
+        self._text = text[pos:]
+        if len(self._text) > MAX_RECORD_BYTES:
+            raise ValueError(f"Запись JSON длиннее {MAX_RECORD_BYTES} байт")
+        if final and self._state != "done":
+            raise ValueError("JSON массив не закрыт")
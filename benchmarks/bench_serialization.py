@@ -0,0 +1,110 @@
+"""
+Бенчмарк сериализации и сжатия ответа `/api/v1/report/full-info`
+
+Сравнивает прежний путь (jsonable_encoder + stdlib json, как в starlette JSONResponse)
+с FastJSONResponse на orjson, а также размер и время сжатия gzip/zstd
+с уровнями из настроек приложения.
+
+Запуск:
+    uv run python -m benchmarks.bench_serialization --users 20000
+    uv run python -m benchmarks.bench_serialization --json > serialization.json
+"""
+import argparse
+import gzip
+import json
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict
+
+import zstandard
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.config import COMPRESSION_GZIP_LEVEL, COMPRESSION_ZSTD_LEVEL
+from app.responses import FastJSONResponse
+from benchmarks.fixtures import make_user_find_response
+
+
+def stdlib_render(content: Any) -> bytes:
+    """То, что делал FastAPI по умолчанию: jsonable_encoder + JSONResponse на stdlib json"""
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def orjson_render(content: Any) -> bytes:
+    return FastJSONResponse(content).body
+
+
+def measure(func: Callable[[], bytes], repeat: int) -> Dict[str, Any]:
+    timings = []
+    result = b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return {
+        "bytes": len(result),
+        "min_ms": round(min(timings) * 1000, 2),
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+    }
+
+
+def run(users: int, repeat: int) -> Dict[str, Any]:
+    payload = make_user_find_response(users)
+
+    encoders = {
+        "stdlib_json": measure(lambda: stdlib_render(payload), repeat),
+        "orjson": measure(lambda: orjson_render(payload), repeat),
+    }
+
+    body = orjson_render(payload)
+    zstd = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL)
+    compression = {
+        "identity": {"bytes": len(body), "min_ms": 0.0, "median_ms": 0.0},
+        f"gzip-{COMPRESSION_GZIP_LEVEL}": measure(
+            lambda: gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL), repeat
+        ),
+        f"zstd-{COMPRESSION_ZSTD_LEVEL}": measure(lambda: zstd.compress(body), repeat),
+    }
+    for stats in compression.values():
+        stats["ratio"] = round(len(body) / stats["bytes"], 2)
+
+    stdlib_ms = encoders["stdlib_json"]["median_ms"]
+    orjson_ms = encoders["orjson"]["median_ms"]
+    return {
+        "users": users,
+        "repeat": repeat,
+        "encode": encoders,
+        "encode_speedup": round(stdlib_ms / orjson_ms, 2) if orjson_ms else None,
+        "compression": compression,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"full-info: {report['users']} пользователей, {report['repeat']} повторов\n")
+    print(f"{'encoder':<16}{'bytes':>14}{'min ms':>12}{'median ms':>12}")
+    for name, stats in report["encode"].items():
+        print(f"{name:<16}{stats['bytes']:>14}{stats['min_ms']:>12}{stats['median_ms']:>12}")
+    print(f"\norjson быстрее в {report['encode_speedup']} раз\n")
+    print(f"{'encoding':<16}{'bytes':>14}{'ratio':>8}{'median ms':>12}")
+    for name, stats in report["compression"].items():
+        print(f"{name:<16}{stats['bytes']:>14}{stats['ratio']:>8}{stats['median_ms']:>12}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000, help="Количество пользователей в ответе")
+    parser.add_argument("--repeat", type=int, default=5, help="Количество повторов каждого замера")
+    parser.add_argument("--json", action="store_true", help="Вывести результат в JSON")
+    args = parser.parse_args()
+
+    report = run(args.users, args.repeat)
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Микробенчмарки горячих путей app/utils и шаблона письма
+
+Каждая функция прогоняется по сгенерированному набору данных (кириллические
+ФИО, email, xlsx на десятки тысяч строк). Для каждого случая меряются
+операции в секунду (лучший из --repeat прогонов) и пиковая память
+(tracemalloc, отдельным прогоном - трассировка памяти сама замедляет код).
+
+Результат можно сохранить как базовый и сравнивать с ним последующие прогоны:
+
+    uv run python -m benchmarks.bench_utils --rows 20000 --save-baseline bench-utils.json
+    uv run python -m benchmarks.bench_utils --rows 20000 --baseline bench-utils.json
+
+В режиме сравнения код возврата 1, если какой-то случай стал медленнее
+больше чем на --threshold процентов.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from app.services.email import render_password_reset_email
+from app.utils.excel import load_workbook, parse_excel_row, parse_fio, parse_groups, parse_identifiers_column
+from app.utils.transliteration import transliterate
+from app.utils.validation import is_valid_email
+from benchmarks.fixtures import make_excel_rows, make_identifiers, make_workbook
+
+USERS_HEADER = ["ФИО", "Email", "Телефон", "Должность", "Группы"]
+
+
+def read_users_workbook(content: bytes) -> int:
+    """Разбор xlsx так же, как в bulk-create-from-excel: загрузка + parse_excel_row по строкам"""
+    sheet = load_workbook(content).active
+    count = 0
+    for row in sheet.iter_rows(min_row=2, values_only=True):
+        if row:
+            parse_excel_row(row)
+            count += 1
+    return count
+
+
+def build_cases(rows: int, xlsx_rows: int, seed: int) -> Dict[str, Dict[str, Any]]:
+    """Случаи бенчмарка: функция над всем набором данных и число операций в одном прогоне"""
+    excel_rows = make_excel_rows(rows, seed)
+    names = [part for row in excel_rows for part in row[0].split()[:2]]
+    fios = [row[0] for row in excel_rows]
+    emails = [row[1] for row in excel_rows]
+    groups = [row[4] or "" for row in excel_rows]
+    usernames = [name.lower() for name in names[::2]]
+
+    users_xlsx = make_workbook(USERS_HEADER, make_excel_rows(xlsx_rows, seed))
+    identifiers_xlsx = make_workbook(["Логин или email"], [(value,) for value in make_identifiers(xlsx_rows, seed)])
+
+    def each(func: Callable[[Any], Any], items: List[Any]) -> Callable[[], None]:
+        def run() -> None:
+            for item in items:
+                func(item)
+        return run
+
+    return {
+        "transliterate": {"func": each(transliterate, names), "ops": len(names)},
+        "parse_fio": {"func": each(parse_fio, fios), "ops": len(fios)},
+        "parse_excel_row": {"func": each(parse_excel_row, excel_rows), "ops": len(excel_rows)},
+        "parse_groups": {"func": each(parse_groups, groups), "ops": len(groups)},
+        "is_valid_email": {"func": each(is_valid_email, emails), "ops": len(emails)},
+        "render_password_reset_email": {
+            "func": each(
+                lambda username: render_password_reset_email(username, "https://yopass.example.com/#/s/abc", "01.01.2027"),
+                usernames,
+            ),
+            "ops": len(usernames),
+        },
+        "read_users_workbook": {
+            "func": lambda: read_users_workbook(users_xlsx),
+            "ops": xlsx_rows,
+            "bytes": len(users_xlsx),
+        },
+        "parse_identifiers_column": {
+            "func": lambda: parse_identifiers_column(identifiers_xlsx),
+            "ops": xlsx_rows,
+            "bytes": len(identifiers_xlsx),
+        },
+    }
+
+
+def measure(func: Callable[[], Any], ops: int, repeat: int) -> Dict[str, Any]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops": ops,
+        "best_ms": round(best * 1000, 2),
+        "ops_per_sec": round(ops / best) if best else None,
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run(rows: int, xlsx_rows: int, repeat: int, seed: int, only: List[str] | None = None) -> Dict[str, Any]:
+    cases = build_cases(rows, xlsx_rows, seed)
+    results = {}
+    for name, case in cases.items():
+        if only and name not in only:
+            continue
+        results[name] = measure(case["func"], case["ops"], repeat)
+        if "bytes" in case:
+            results[name]["file_bytes"] = case["bytes"]
+    return {
+        "rows": rows,
+        "xlsx_rows": xlsx_rows,
+        "repeat": repeat,
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Изменение ops/sec и пиковой памяти относительно базового прогона (в процентах)"""
+    rows = []
+    for name, stats in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("ops_per_sec") or not stats.get("ops_per_sec"):
+            continue
+        speed = (stats["ops_per_sec"] / base["ops_per_sec"] - 1) * 100
+        memory = (stats["peak_kb"] / base["peak_kb"] - 1) * 100 if base["peak_kb"] else 0.0
+        rows.append({
+            "name": name,
+            "ops_per_sec_change": round(speed, 1),
+            "peak_kb_change": round(memory, 1),
+            "regression": speed < -threshold,
+        })
+    return rows
+
+
+def print_report(report: Dict[str, Any], comparison: List[Dict[str, Any]] | None) -> None:
+    print(f"строк: {report['rows']}, строк xlsx: {report['xlsx_rows']}, повторов: {report['repeat']}\n")
+    changes = {row["name"]: row for row in comparison or []}
+    header = f"{'case':<30}{'ops/sec':>14}{'best ms':>12}{'peak KB':>12}"
+    if comparison is not None:
+        header += f"{'Δ ops/sec':>12}{'Δ peak':>10}"
+    print(header)
+    for name, stats in report["results"].items():
+        line = f"{name:<30}{stats['ops_per_sec']:>14}{stats['best_ms']:>12}{stats['peak_kb']:>12}"
+        change = changes.get(name)
+        if change:
+            mark = "  !" if change["regression"] else ""
+            line += f"{change['ops_per_sec_change']:>+11}%{change['peak_kb_change']:>+9}%{mark}"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="Строк для построчных функций")
+    parser.add_argument("--xlsx-rows", type=int, default=20000, help="Строк в сгенерированных xlsx")
+    parser.add_argument("--repeat", type=int, default=5, help="Количество повторов каждого замера")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", action="append", help="Запустить только указанный случай (можно несколько раз)")
+    parser.add_argument("--baseline", help="Сравнить с сохранённым прогоном")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Допустимое замедление, %%")
+    parser.add_argument("--save-baseline", help="Сохранить результат как базовый")
+    parser.add_argument("--json", action="store_true", help="Вывести результат в JSON")
+    args = parser.parse_args()
+
+    report = run(args.rows, args.xlsx_rows, args.repeat, args.seed, args.only)
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            comparison = compare(report, json.load(file), args.threshold)
+        report["comparison"] = comparison
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_report(report, comparison)
+
+    if comparison and any(row["regression"] for row in comparison):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,593 @@
+"""
+Локальная замена FreeIPA для бенчмарков и ручной проверки
+
+Поднимает HTTPS сервер с эндпоинтами /ipa/session/login_password и
+/ipa/session/json и отвечает в формате JSON-RPC FreeIPA (result/error с
+теми же кодами ошибок), так что python_freeipa.Client и весь backend
+работают с ним без изменений. Справочник пользователей генерируется из
+benchmarks.fixtures по seed, поэтому прогоны воспроизводимы.
+
+Поддерживаемые команды: user_show, user_find, user_mod (в том числе
+random), user_add, user_disable, user_enable, user_del, group_find,
+group_show, group_add_member, env, batch.
+
+Задержка и ошибки настраиваются: базовая задержка с разбросом, отдельная
+задержка для команд, доля JSON-RPC ошибок и доля HTTP 503.
+
+Запуск:
+    uv run python -m benchmarks.fakes.freeipa --users 5000 --port 8443 --latency-ms 5
+    IPA_HOST=127.0.0.1:8443 uv run python main.py
+
+Вход: любой пользователь справочника с паролем --password (по умолчанию
+"password"); оператор admin (группы admins, helpdesk) создаётся всегда.
+TLS сертификат самоподписанный, генерируется через openssl CLI, если не
+заданы --certfile/--keyfile.
+"""
+import argparse
+import copy
+import os
+import random
+import secrets
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import orjson
+
+from benchmarks.fixtures import DOMAIN, GROUPS, REALM, make_ipa_users
+
+# Атрибуты, которые FreeIPA возвращает без all=True
+DEFAULT_USER_ATTRS = (
+    "dn", "uid", "givenname", "sn", "homedirectory", "loginshell", "uidnumber",
+    "gidnumber", "mail", "telephonenumber", "title", "nsaccountlock",
+    "krbcanonicalname", "krbprincipalname", "has_password", "has_keytab",
+    "preserved", "memberof_group",
+)
+
+# Коды ошибок FreeIPA (python_freeipa.exceptions.error_codes)
+NOT_FOUND = 4001
+DUPLICATE_ENTRY = 4002
+ALREADY_ACTIVE = 4009
+ALREADY_INACTIVE = 4010
+INTERNAL_ERROR = 903
+
+ERROR_NAMES = {
+    NOT_FOUND: "NotFound",
+    DUPLICATE_ENTRY: "DuplicateEntry",
+    ALREADY_ACTIVE: "AlreadyActive",
+    ALREADY_INACTIVE: "AlreadyInactive",
+    INTERNAL_ERROR: "InternalError",
+}
+
+
+class IPAError(Exception):
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"code": self.code, "message": self.message, "name": ERROR_NAMES.get(self.code, "PublicError"), "data": {}}
+
+
+def _first(params: Dict[str, Any], key: str) -> Any:
+    value = params.get(key)
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+class FakeDirectory:
+    """
+    Справочник пользователей и групп в памяти
+
+    Все команды потокобезопасны (один общий lock), ответы - глубокие копии,
+    чтобы клиент не мог изменить состояние справочника.
+    """
+
+    def __init__(self, users: List[Dict[str, Any]], password: str = "password") -> None:
+        self.password = password
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self.by_mail: Dict[str, str] = {}
+        self.groups: Dict[str, Dict[str, Any]] = {}
+        self._next_uid = 2_000_000
+        self._lock = threading.Lock()
+
+        for name in GROUPS + ["admins"]:
+            self._add_group(name)
+        for user in users:
+            self._store_user(user)
+        if "admin" not in self.users:
+            admin = copy.deepcopy(users[0]) if users else {}
+            admin.update({
+                "uid": ["admin"], "givenname": ["Admin"], "sn": ["Administrator"],
+                "cn": ["Administrator"], "mail": [f"admin@{DOMAIN}"], "nsaccountlock": False,
+                "memberof_group": ["admins", "helpdesk", "ipausers"],
+                "krbprincipalname": [f"admin@{REALM}"], "krbcanonicalname": [f"admin@{REALM}"],
+                "dn": "uid=admin,cn=users,cn=accounts,dc=example,dc=com",
+            })
+            self._store_user(admin)
+
+    @classmethod
+    def seeded(cls, count: int, seed: int = 42, password: str = "password") -> "FakeDirectory":
+        return cls(make_ipa_users(count, seed), password)
+
+    def _add_group(self, name: str) -> Dict[str, Any]:
+        group = {
+            "dn": f"cn={name},cn=groups,cn=accounts,dc=example,dc=com",
+            "cn": [name],
+            "description": [f"Группа {name}"],
+            "gidnumber": [str(500_000 + len(self.groups))],
+            "member_user": [],
+        }
+        self.groups[name] = group
+        return group
+
+    def _store_user(self, user: Dict[str, Any]) -> None:
+        uid = user["uid"][0]
+        self.users[uid] = user
+        for mail in user.get("mail", []):
+            self.by_mail[mail.lower()] = uid
+        for group in user.get("memberof_group", []):
+            target = self.groups.get(group) or self._add_group(group)
+            target["member_user"].append(uid)
+
+    def _get_user(self, uid: str) -> Dict[str, Any]:
+        user = self.users.get(uid)
+        if user is None:
+            raise IPAError(NOT_FOUND, f"{uid}: user not found")
+        return user
+
+    def _get_group(self, name: str) -> Dict[str, Any]:
+        group = self.groups.get(name)
+        if group is None:
+            raise IPAError(NOT_FOUND, f"{name}: group not found")
+        return group
+
+    @staticmethod
+    def _view(user: Dict[str, Any], all_attrs: bool) -> Dict[str, Any]:
+        if all_attrs:
+            return copy.deepcopy(user)
+        return {key: copy.deepcopy(user[key]) for key in DEFAULT_USER_ATTRS if key in user}
+
+    def check_password(self, uid: str, password: str) -> bool:
+        with self._lock:
+            return uid in self.users and password == self.password
+
+    # Команды JSON-RPC: (args, params) -> result
+
+    def env(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        values = {"domain": DOMAIN, "realm": REALM, "version": "4.11.1"}
+        keys = args or list(values)
+        return {"result": {key: values[key] for key in keys if key in values}, "count": len(keys), "total": len(values)}
+
+    def user_show(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        uid = args[0]
+        with self._lock:
+            user = self._view(self._get_user(uid), bool(params.get("all")))
+        return {"result": user, "value": uid, "summary": None}
+
+    def user_find(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        criteria = (args[0] if args else "") or ""
+        criteria = criteria.lower()
+        mail = _first(params, "mail")
+        uid = _first(params, "uid")
+        sizelimit = params.get("sizelimit") or 0
+        with self._lock:
+            if mail is not None:
+                found_uid = self.by_mail.get(str(mail).lower())
+                candidates = [self.users[found_uid]] if found_uid else []
+            elif uid is not None:
+                candidates = [self.users[uid]] if uid in self.users else []
+            else:
+                candidates = self.users.values()
+            matched = []
+            for user in candidates:
+                if criteria and not any(
+                    criteria in value.lower()
+                    for key in ("uid", "givenname", "sn", "cn", "mail")
+                    for value in user.get(key, [])
+                ):
+                    continue
+                matched.append(self._view(user, bool(params.get("all"))))
+                if sizelimit and len(matched) >= sizelimit:
+                    break
+        return {
+            "result": matched,
+            "count": len(matched),
+            "truncated": bool(sizelimit and len(matched) >= sizelimit),
+            "summary": f"{len(matched)} users matched",
+        }
+
+    def user_add(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        uid = args[0]
+        with self._lock:
+            if uid in self.users:
+                raise IPAError(DUPLICATE_ENTRY, f'user with name "{uid}" already exists')
+            self._next_uid += 1
+            user = {
+                "dn": f"uid={uid},cn=users,cn=accounts,dc=example,dc=com",
+                "uid": [uid],
+                "givenname": [_first(params, "givenname") or ""],
+                "sn": [_first(params, "sn") or ""],
+                "cn": [_first(params, "cn") or ""],
+                "mail": [_first(params, "mail") or f"{uid}@{DOMAIN}"],
+                "krbprincipalname": [f"{uid}@{REALM}"],
+                "krbcanonicalname": [f"{uid}@{REALM}"],
+                "homedirectory": [f"/home/{uid}"],
+                "loginshell": ["/bin/sh"],
+                "uidnumber": [str(self._next_uid)],
+                "gidnumber": [str(self._next_uid)],
+                "nsaccountlock": False,
+                "has_password": bool(params.get("random")),
+                "has_keytab": bool(params.get("random")),
+                "preserved": False,
+                "memberof_group": ["ipausers"],
+            }
+            for key in ("title", "telephonenumber"):
+                if _first(params, key):
+                    user[key] = [_first(params, key)]
+            self._store_user(user)
+            result = self._view(user, True)
+        if params.get("random"):
+            result["randompassword"] = secrets.token_urlsafe(12)
+        return {"result": result, "value": uid, "summary": f'Added user "{uid}"'}
+
+    def user_mod(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        uid = args[0]
+        with self._lock:
+            user = self._get_user(uid)
+            for key, value in params.items():
+                if key in ("random", "all", "rights", "version", "no_members", "raw"):
+                    continue
+                user[key] = value if isinstance(value, list) else [value]
+            if params.get("random"):
+                user["krbpasswordexpiration"] = [{"__datetime__": time.strftime("%Y%m%d%H%M%SZ", time.gmtime())}]
+            result = self._view(user, bool(params.get("all")))
+        if params.get("random"):
+            result["randompassword"] = secrets.token_urlsafe(12)
+        return {"result": result, "value": uid, "summary": f'Modified user "{uid}"'}
+
+    def _set_lock(self, uid: str, locked: bool) -> None:
+        with self._lock:
+            user = self._get_user(uid)
+            if bool(user.get("nsaccountlock")) == locked:
+                if locked:
+                    raise IPAError(ALREADY_INACTIVE, "This entry is already disabled")
+                raise IPAError(ALREADY_ACTIVE, "This entry is already enabled")
+            user["nsaccountlock"] = locked
+
+    def user_disable(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        self._set_lock(args[0], True)
+        return {"result": True, "value": args[0], "summary": f'Disabled user account "{args[0]}"'}
+
+    def user_enable(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        self._set_lock(args[0], False)
+        return {"result": True, "value": args[0], "summary": f'Enabled user account "{args[0]}"'}
+
+    def user_del(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        uids = args[0] if isinstance(args[0], list) else [args[0]]
+        with self._lock:
+            for uid in uids:
+                user = self._get_user(uid)
+                del self.users[uid]
+                for mail in user.get("mail", []):
+                    self.by_mail.pop(mail.lower(), None)
+                for group in user.get("memberof_group", []):
+                    members = self.groups.get(group, {}).get("member_user", [])
+                    if uid in members:
+                        members.remove(uid)
+        return {"result": {"failed": []}, "value": uids, "summary": f'Deleted user "{",".join(uids)}"'}
+
+    def group_find(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        criteria = ((args[0] if args else "") or "").lower()
+        with self._lock:
+            groups = [
+                {key: copy.deepcopy(value) for key, value in group.items() if params.get("all") or key != "member_user"}
+                for name, group in self.groups.items()
+                if criteria in name.lower()
+            ]
+        return {"result": groups, "count": len(groups), "truncated": False, "summary": f"{len(groups)} groups matched"}
+
+    def group_show(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            group = copy.deepcopy(self._get_group(args[0]))
+        return {"result": group, "value": args[0], "summary": None}
+
+    def group_add_member(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        users = params.get("user") or []
+        users = users if isinstance(users, list) else [users]
+        failed = []
+        completed = 0
+        with self._lock:
+            group = self._get_group(args[0])
+            for uid in users:
+                user = self.users.get(uid)
+                if user is None:
+                    failed.append([uid, "no such entry"])
+                elif uid in group["member_user"]:
+                    failed.append([uid, "This entry is already a member"])
+                else:
+                    group["member_user"].append(uid)
+                    user.setdefault("memberof_group", []).append(args[0])
+                    completed += 1
+            result = copy.deepcopy(group)
+        return {
+            "result": result,
+            "failed": {"member": {"user": failed, "group": [], "service": [], "idoverrideuser": []}},
+            "completed": completed,
+        }
+
+
+@dataclass
+class FaultConfig:
+    """Задержка и ошибки, добавляемые к каждому JSON-RPC вызову"""
+
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    # Задержка отдельных команд вместо latency_ms, например {"user_mod": 30}
+    command_latency_ms: Dict[str, float] = field(default_factory=dict)
+    # Доля вызовов, завершающихся JSON-RPC ошибкой InternalError
+    error_rate: float = 0.0
+    # Доля вызовов, на которые сервер отвечает HTTP 503
+    http_error_rate: float = 0.0
+    seed: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def delay(self, command: str) -> float:
+        base = self.command_latency_ms.get(command, self.latency_ms)
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, base + jitter) / 1000
+
+    def roll(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < rate
+
+
+class FakeFreeIPA:
+    """
+    HTTPS сервер с JSON-RPC FreeIPA поверх FakeDirectory
+
+    Используется как из CLI, так и из кода бенчмарков:
+
+        with FakeFreeIPA(FakeDirectory.seeded(2000)) as ipa:
+            os.environ["IPA_HOST"] = ipa.host
+    """
+
+    def __init__(
+        self,
+        directory: FakeDirectory,
+        faults: Optional[FaultConfig] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        certfile: Optional[str] = None,
+        keyfile: Optional[str] = None,
+    ) -> None:
+        self.directory = directory
+        self.faults = faults or FaultConfig()
+        self.sessions: set[str] = set()
+        self.calls: Dict[str, int] = {}
+        self._calls_lock = threading.Lock()
+        self._tempdir: Optional[str] = None
+        if certfile is None:
+            certfile, keyfile = self._self_signed_cert()
+
+        handler = type("Handler", (_Handler,), {"fake": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        # Рукопожатие TLS - в потоке обработчика, а не в потоке accept
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True, do_handshake_on_connect=False)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        """host:port для IPA_HOST"""
+        address, port = self.server.server_address[:2]
+        return f"{address}:{port}"
+
+    def _self_signed_cert(self) -> Tuple[str, str]:
+        openssl = shutil.which("openssl")
+        if openssl is None:
+            raise RuntimeError("Не найден openssl: укажите --certfile и --keyfile")
+        self._tempdir = tempfile.mkdtemp(prefix="fake-ipa-")
+        certfile = os.path.join(self._tempdir, "cert.pem")
+        keyfile = os.path.join(self._tempdir, "key.pem")
+        subprocess.run(
+            [
+                openssl, "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                "-keyout", keyfile, "-out", certfile, "-days", "1", "-subj", "/CN=localhost",
+            ],
+            check=True,
+            capture_output=True,
+        )
+        return certfile, keyfile
+
+    def start(self) -> "FakeFreeIPA":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-freeipa", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self._tempdir:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+
+    def __enter__(self) -> "FakeFreeIPA":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def count_call(self, command: str) -> None:
+        with self._calls_lock:
+            self.calls[command] = self.calls.get(command, 0) + 1
+
+    def execute(self, command: str, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        """Выполняет команду: результат JSON-RPC без обёртки или IPAError"""
+        if command == "batch":
+            return self._batch(args, params)
+        handler: Optional[Callable] = getattr(self.directory, command, None)
+        if command.startswith("_") or handler is None or command in ("seeded", "check_password"):
+            raise IPAError(INTERNAL_ERROR, f"unknown command '{command}'")
+        if self.faults.roll(self.faults.error_rate):
+            raise IPAError(INTERNAL_ERROR, "injected internal error")
+        return handler(args, params)
+
+    def _batch(self, args: List[Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        results = []
+        for call in args:
+            method = call["method"]
+            call_params = call.get("params") or []
+            call_args = call_params[0] if call_params else []
+            call_kwargs = call_params[1] if len(call_params) > 1 else {}
+            self.count_call(method)
+            try:
+                result = self.execute(method, call_args or [], call_kwargs or {})
+                result["error"] = None
+                results.append(result)
+            except IPAError as e:
+                results.append({
+                    "error": e.message,
+                    "error_code": e.code,
+                    "error_name": ERROR_NAMES.get(e.code, "PublicError"),
+                    "error_kw": {},
+                })
+        return {"count": len(results), "results": results}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake: FakeFreeIPA
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят отдельными write - без TCP_NODELAY keep-alive упирается в delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _session_id(self) -> Optional[str]:
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        morsel = cookie.get("ipa_session")
+        return morsel.value if morsel else None
+
+    def do_POST(self) -> None:
+        body = self._read_body()
+        if self.path == "/ipa/session/login_password":
+            self._login(body)
+        elif self.path == "/ipa/session/json":
+            self._json_rpc(body)
+        else:
+            self._send(404, b"Not Found", "text/plain")
+
+    def _login(self, body: bytes) -> None:
+        form = parse_qs(body.decode())
+        user = (form.get("user") or [""])[0]
+        password = (form.get("password") or [""])[0]
+        if not self.fake.directory.check_password(user, password):
+            self._send(401, b"Unauthorized", "text/html", {"X-IPA-Rejection-Reason": "invalid-password"})
+            return
+        session_id = f"MagBearerToken={secrets.token_urlsafe(24)}"
+        self.fake.sessions.add(session_id)
+        self._send(200, b"", "text/plain", {"Set-Cookie": f"ipa_session={session_id}; Path=/ipa; Secure; HttpOnly"})
+
+    def _json_rpc(self, body: bytes) -> None:
+        if self._session_id() not in self.fake.sessions:
+            self._send(401, b"Unauthorized", "text/html")
+            return
+
+        request = orjson.loads(body)
+        command = request.get("method", "")
+        args, params = (request.get("params") or [[], {}])[:2]
+        self.fake.count_call(command)
+
+        faults = self.fake.faults
+        delay = faults.delay(command)
+        if delay:
+            time.sleep(delay)
+        if faults.roll(faults.http_error_rate):
+            self._send(503, b"Service Unavailable", "text/html")
+            return
+
+        try:
+            response = {"result": self.fake.execute(command, args or [], params or {}), "error": None, "id": None}
+        except IPAError as e:
+            response = {"result": None, "error": e.to_dict(), "id": None}
+        self._send(200, orjson.dumps(response), "application/json")
+
+
+def parse_command_latency(values: List[str]) -> Dict[str, float]:
+    """['user_mod=30', 'batch=50'] -> {'user_mod': 30.0, 'batch': 50.0}"""
+    result = {}
+    for value in values:
+        command, latency = value.split("=", 1)
+        result[command] = float(latency)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--users", type=int, default=2000, help="Размер справочника")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--password", default="password", help="Пароль любого пользователя")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--command-latency", action="append", default=[], metavar="CMD=MS",
+                        help="Задержка отдельной команды, можно несколько раз")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля JSON-RPC ошибок")
+    parser.add_argument("--http-error-rate", type=float, default=0.0, help="Доля ответов HTTP 503")
+    parser.add_argument("--certfile")
+    parser.add_argument("--keyfile")
+    args = parser.parse_args()
+
+    directory = FakeDirectory.seeded(args.users, args.seed, args.password)
+    faults = FaultConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        command_latency_ms=parse_command_latency(args.command_latency),
+        error_rate=args.error_rate,
+        http_error_rate=args.http_error_rate,
+        seed=args.seed,
+    )
+    fake = FakeFreeIPA(directory, faults, args.host, args.port, args.certfile, args.keyfile)
+    print(f"Fake FreeIPA on https://{fake.host} ({len(directory.users)} users), IPA_HOST={fake.host}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
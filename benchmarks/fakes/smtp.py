@@ -0,0 +1,93 @@
+"""
+SMTP приёмник для бенчмарков: принимает письма и только считает их
+
+Поддерживает минимальный диалог smtplib (EHLO/HELO, MAIL, RCPT, DATA,
+RSET, NOOP, QUIT) без TLS и авторизации - в приложении для прогонов
+задаётся SMTP_USE_TLS=false и пустой SMTP_USERNAME.
+"""
+import socketserver
+import threading
+import time
+from typing import Optional
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    sink: "FakeSMTP"
+    disable_nagle_algorithm = True
+
+    def _reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        self._reply("220 fake-smtp ESMTP ready")
+        recipients = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.wfile.write(b"250-fake-smtp\r\n250 8BITMIME\r\n")
+            elif command.startswith("MAIL FROM"):
+                recipients = 0
+                self._reply("250 OK")
+            elif command.startswith("RCPT TO"):
+                recipients += 1
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                if self.sink.latency:
+                    time.sleep(self.sink.latency)
+                self.sink.count(recipients)
+                self._reply("250 OK queued")
+            elif command in ("RSET", "NOOP"):
+                self._reply("250 OK")
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class FakeSMTP:
+    """Потоковый SMTP сервер на localhost, messages - число принятых писем"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0) -> None:
+        self.latency = latency_ms / 1000
+        self.messages = 0
+        self._lock = threading.Lock()
+        handler = type("Handler", (_SMTPHandler,), {"sink": self})
+        self.server = socketserver.ThreadingTCPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self.server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def count(self, recipients: int) -> None:
+        with self._lock:
+            self.messages += 1
+
+    def start(self) -> "FakeSMTP":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-smtp", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeSMTP":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
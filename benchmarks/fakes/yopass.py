@@ -0,0 +1,26 @@
+"""
+Замена Yopass CLI для бенчмарков
+
+Приложение вызывает бинарник YOPASS через subprocess, поэтому замена -
+это тоже исполняемый файл: shell скрипт, который читает секрет из stdin,
+ждёт заданную задержку (имитация HTTP запроса к Yopass) и печатает ссылку.
+Стоимость запуска процесса при этом остаётся настоящей.
+"""
+import os
+import stat
+from pathlib import Path
+
+SCRIPT = """#!/bin/sh
+cat > /dev/null
+{sleep}
+echo "https://yopass.example.com/#/s/$$-$(od -An -N8 -tx1 /dev/urandom | tr -d ' \\n')"
+"""
+
+
+def write_fake_yopass(directory: str, latency_ms: float = 0.0) -> str:
+    """Создаёт скрипт-замену в directory и возвращает путь для YOPASS"""
+    path = Path(directory) / "yopass"
+    sleep = f"sleep {latency_ms / 1000:.3f}" if latency_ms > 0 else ""
+    path.write_text(SCRIPT.format(sleep=sleep), encoding="utf-8")
+    path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return os.fspath(path)
@@ -0,0 +1,215 @@
+"""
+Генераторы синтетических данных для бенчмарков
+
+Записи пользователей повторяют форму ответа FreeIPA `user_find --all`,
+ФИО - реалистичные кириллические, username строится так же, как в приложении.
+Генерация детерминирована (seed), чтобы прогоны были сравнимы между собой.
+"""
+import io
+import random
+from typing import Any, Dict, List, Optional, Set
+
+import openpyxl
+
+from app.utils.transliteration import transliterate
+
+LAST_NAMES = [
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов",
+    "Михайлов", "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев",
+    "Семёнов", "Егоров", "Павлов", "Козлов", "Степанов", "Николаев", "Орлов",
+    "Андреев", "Макаров", "Никитин", "Захаров", "Зайцев", "Соловьёв", "Борисов",
+    "Яковлев", "Григорьев", "Романов", "Воробьёв", "Сергеев", "Кузьмин", "Фролов",
+    "Александров", "Дмитриев", "Королёв", "Гусев", "Киселёв", "Ильин", "Максимов",
+    "Поляков", "Сорокин", "Виноградов", "Ковалёв", "Белов", "Медведев", "Антонов",
+    "Тарасов", "Жуков", "Баранов", "Филиппов", "Комаров", "Давыдов", "Беляев",
+    "Герасимов", "Богданов", "Осипов", "Сидоров", "Матвеев", "Титов", "Марков",
+    "Миронов", "Крылов", "Куликов", "Карпов", "Власов", "Мельников", "Денисов",
+    "Гаврилов", "Тихонов", "Казаков", "Афанасьев", "Данилов", "Савельев", "Тимофеев",
+    "Фомин", "Чернов", "Абрамов", "Мартынов", "Ефимов", "Федотов", "Щербаков",
+    "Назаров", "Калинин", "Исаев", "Чернышёв", "Быков", "Маслов", "Родионов",
+    "Коновалов", "Лазарев", "Воронин", "Климов", "Филатов", "Пономарёв", "Голубев",
+    "Кудрявцев", "Прохоров", "Наумов", "Потапов", "Журавлёв", "Овчинников", "Трофимов",
+    "Леонов", "Соболев", "Ермаков", "Колесников", "Гончаров", "Емельянов", "Никифоров",
+    "Грачёв", "Котов", "Гришин", "Ефремов", "Архипов", "Громов", "Кириллов",
+    "Малышев", "Панов", "Моисеев", "Румянцев", "Акимов", "Кондратьев", "Бирюков",
+    "Горбунов", "Анисимов", "Еремин", "Тихомиров", "Галкин", "Лукьянов", "Михеев",
+    "Скворцов", "Юдин", "Белоусов", "Нестеров", "Симонов", "Прокофьев", "Харитонов",
+    "Князев", "Цветков", "Левин", "Митрофанов", "Воронов", "Аксёнов", "Софронов",
+    "Мальцев", "Логинов", "Горшков", "Савин", "Краснов", "Майоров", "Демидов",
+    "Елисеев", "Рыбаков", "Сафонов", "Плотников", "Дёмин", "Хохлов", "Жданов",
+    "Щукин", "Шубин", "Субботин", "Щёголев", "Шевченко", "Ющенко", "Чайковский",
+]
+
+FIRST_NAMES = [
+    "Александр", "Алексей", "Андрей", "Антон", "Артём", "Борис", "Вадим",
+    "Валентин", "Василий", "Виктор", "Виталий", "Владимир", "Владислав", "Вячеслав",
+    "Георгий", "Глеб", "Григорий", "Даниил", "Денис", "Дмитрий", "Евгений",
+    "Егор", "Иван", "Игорь", "Илья", "Кирилл", "Константин", "Лев", "Леонид",
+    "Максим", "Матвей", "Михаил", "Никита", "Николай", "Олег", "Павел", "Пётр",
+    "Роман", "Руслан", "Семён", "Сергей", "Станислав", "Степан", "Тимофей",
+    "Фёдор", "Юрий", "Ярослав", "Анна", "Алина", "Алёна", "Анастасия", "Валерия",
+    "Вера", "Виктория", "Галина", "Дарья", "Евгения", "Екатерина", "Елена",
+    "Елизавета", "Жанна", "Зоя", "Ирина", "Карина", "Ксения", "Лариса", "Любовь",
+    "Людмила", "Маргарита", "Марина", "Мария", "Надежда", "Наталья", "Нина",
+    "Оксана", "Ольга", "Полина", "Светлана", "София", "Тамара", "Татьяна",
+    "Ульяна", "Юлия", "Яна",
+]
+
+PATRONYMICS = [
+    "Александрович", "Алексеевич", "Андреевич", "Сергеевич", "Иванович",
+    "Дмитриевич", "Николаевич", "Владимирович", "Петрович", "Михайлович",
+    "Александровна", "Алексеевна", "Андреевна", "Сергеевна", "Ивановна",
+    "Дмитриевна", "Николаевна", "Владимировна", "Петровна", "Михайловна",
+]
+
+TITLES = [
+    "Менеджер", "Инженер", "Ведущий инженер", "Бухгалтер", "Аналитик",
+    "Разработчик", "Системный администратор", "Специалист поддержки",
+    "Руководитель отдела", "Юрист", "Дизайнер", "Тестировщик",
+]
+
+GROUPS = [
+    "ipausers", "developers", "accounting", "support", "helpdesk", "sales",
+    "hr", "vpn", "wifi", "jira-users", "confluence-users", "gitlab-users",
+    "devops", "analytics", "legal", "marketing",
+]
+
+DOMAIN = "example.com"
+REALM = "EXAMPLE.COM"
+
+
+def make_person(rng: random.Random, taken: Optional[Set[str]] = None) -> Dict[str, str]:
+    """
+    ФИО и производные поля одного синтетического сотрудника
+
+    taken - уже занятые username: полным тёзкам добавляется номер, как это делают на практике
+    """
+    last_name = rng.choice(LAST_NAMES)
+    first_name = rng.choice(FIRST_NAMES)
+    patronymic = rng.choice(PATRONYMICS)
+    username = base = f"{transliterate(first_name).lower()}.{transliterate(last_name).lower()}"
+    if taken is not None:
+        suffix = 1
+        while username in taken:
+            suffix += 1
+            username = f"{base}{suffix}"
+        taken.add(username)
+    return {
+        "last_name": last_name,
+        "first_name": first_name,
+        "patronymic": patronymic,
+        "fio": f"{last_name} {first_name} {patronymic}",
+        "username": username,
+        "email": f"{username}@{DOMAIN}",
+        "phone": f"+7 9{rng.randint(10, 99)} {rng.randint(100, 999)} {rng.randint(10, 99)} {rng.randint(10, 99)}",
+        "title": rng.choice(TITLES),
+    }
+
+
+def make_ipa_user(rng: random.Random, index: int, taken: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """Запись пользователя в формате ответа user_find/user_show с all=True"""
+    person = make_person(rng, taken)
+    username = person["username"]
+    uidnumber = str(1_000_000 + index)
+    groups = sorted(rng.sample(GROUPS[1:], rng.randint(1, 5)) + ["ipausers"])
+    return {
+        "dn": f"uid={username},cn=users,cn=accounts,dc=example,dc=com",
+        "uid": [username],
+        "givenname": [person["first_name"]],
+        "sn": [person["last_name"]],
+        "cn": [person["fio"]],
+        "displayname": [f"{person['first_name']} {person['last_name']}"],
+        "initials": [person["first_name"][0] + person["last_name"][0]],
+        "gecos": [person["fio"]],
+        "title": [person["title"]],
+        "telephonenumber": [person["phone"]],
+        "mail": [person["email"]],
+        "krbprincipalname": [f"{username}@{REALM}"],
+        "krbcanonicalname": [f"{username}@{REALM}"],
+        "homedirectory": [f"/home/{username}"],
+        "loginshell": ["/bin/bash"],
+        "uidnumber": [uidnumber],
+        "gidnumber": [uidnumber],
+        "nsaccountlock": rng.random() < 0.05,
+        "has_password": True,
+        "has_keytab": True,
+        "preserved": False,
+        "memberof_group": groups,
+        "krbpasswordexpiration": [{"__datetime__": f"2026{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}093000Z"}],
+        "krblastpwdchange": [{"__datetime__": f"2025{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}093000Z"}],
+        "ipauniqueid": [f"{rng.getrandbits(128):032x}"],
+        "mepmanagedentry": [f"cn={username},cn=groups,cn=accounts,dc=example,dc=com"],
+        "objectclass": [
+            "top", "person", "organizationalperson", "inetorgperson", "inetuser",
+            "posixaccount", "krbprincipalaux", "krbticketpolicyaux", "ipaobject",
+            "ipasshuser", "ipaSshGroupOfPubKeys", "mepOriginEntry",
+        ],
+    }
+
+
+def make_ipa_users(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Детерминированный список из count пользователей"""
+    rng = random.Random(seed)
+    taken: Set[str] = set()
+    return [make_ipa_user(rng, index, taken) for index in range(count)]
+
+
+def make_user_find_response(count: int, seed: int = 42) -> Dict[str, Any]:
+    """Ответ client._request("user_find", params={"all": True}) на count пользователей"""
+    users = make_ipa_users(count, seed)
+    return {
+        "result": users,
+        "count": len(users),
+        "truncated": False,
+        "summary": f"{len(users)} users matched",
+    }
+
+
+def make_excel_rows(count: int, seed: int = 42) -> List[tuple]:
+    """
+    Строки листа массового создания (ФИО, Email, Телефон, Должность, Группы)
+
+    Как в реальных выгрузках из HR: лишние пробелы, пустые ячейки, ~2% строк
+    с одним словом в ФИО и ~2% с некорректным email.
+    """
+    rng = random.Random(seed)
+    taken: Set[str] = set()
+    rows = []
+    for _ in range(count):
+        person = make_person(rng, taken)
+        fio = person["fio"]
+        email = person["email"]
+        roll = rng.random()
+        if roll < 0.02:
+            fio = person["last_name"]
+        elif roll < 0.04:
+            email = email.replace("@", " at ")
+        elif roll < 0.2:
+            fio = f"  {fio} "
+        groups = ", ".join(rng.sample(GROUPS, rng.randint(0, 4)))
+        phone = person["phone"] if rng.random() < 0.8 else None
+        rows.append((fio, email, phone, person["title"], groups or None))
+    return rows
+
+
+def make_identifiers(count: int, seed: int = 42) -> List[str]:
+    """Список для массовых операций: username вперемешку с email"""
+    rng = random.Random(seed)
+    taken: Set[str] = set()
+    identifiers = []
+    for _ in range(count):
+        person = make_person(rng, taken)
+        identifiers.append(person["email"] if rng.random() < 0.5 else person["username"])
+    return identifiers
+
+
+def make_workbook(header: List[str], rows: List[tuple]) -> bytes:
+    """xlsx с заголовком и строками, как его загружает оператор"""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in rows:
+        sheet.append(list(row))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,378 @@
+"""
+Нагрузочные сценарии для API против локальных замен FreeIPA, Yopass и SMTP
+
+Сценарии повторяют реальную работу helpdesk:
+
+- interactive - N операторов (по умолчанию 30) параллельно ищут пользователей
+  и сбрасывают пароль по одному
+- bulk-reset-yopass - один bulk-reset-password-with-yopass на 2000 пользователей
+  с отправкой писем
+- validate-excel - проверка Excel файла на 5000 строк
+
+По умолчанию приложение запускается в этом же процессе (uvicorn в отдельном
+потоке) и ходит в замены, поднятые здесь же. С --url нагрузка идёт на уже
+запущенный сервер: замены поднимаются на --ipa-port/--smtp-port, а переменные
+окружения для сервера печатаются при старте.
+
+Результат - JSON: пропускная способность, p50/p95/p99 по сценарию и по
+эндпоинтам, а также число вызовов FreeIPA по командам (рост этих чисел -
+верный признак N+1 регрессии в app/routers).
+
+Запуск:
+    uv run python -m benchmarks.load_test
+    uv run python -m benchmarks.load_test --scenario bulk-reset-yopass --bulk-size 2000
+    uv run python -m benchmarks.load_test --ipa-latency-ms 5 --output load.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import httpx
+import openpyxl
+
+from benchmarks.fakes.yopass import write_fake_yopass
+
+if TYPE_CHECKING:
+    from benchmarks.fakes.freeipa import FakeDirectory, FakeFreeIPA
+    from benchmarks.fakes.smtp import FakeSMTP
+
+# app.config читает окружение при импорте пакета app, а benchmarks.fixtures
+# и замены импортируют app. Поэтому они импортируются в main() уже после
+# того, как окружение для приложения выставлено.
+
+SCENARIOS = ("interactive", "bulk-reset-yopass", "validate-excel")
+OPERATOR_LOGIN = ("admin", "password")
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return round(ordered[index], 2)
+
+
+def latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    if not latencies_ms:
+        return {}
+    return {
+        "p50": percentile(latencies_ms, 0.50),
+        "p95": percentile(latencies_ms, 0.95),
+        "p99": percentile(latencies_ms, 0.99),
+        "max": round(max(latencies_ms), 2),
+        "mean": round(statistics.fmean(latencies_ms), 2),
+    }
+
+
+class Recorder:
+    """Латентности запросов сценария по эндпоинтам"""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def call(self, endpoint: str, request) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError:
+            self.errors[endpoint] += 1
+            return None
+        finally:
+            self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+        return response
+
+    def summary(self, duration: float, items: int = 0) -> Dict[str, Any]:
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        result = {
+            "requests": len(all_latencies),
+            "errors": sum(self.errors.values()),
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(len(all_latencies) / duration, 2) if duration else 0.0,
+            "latency_ms": latency_summary(all_latencies),
+            "by_endpoint": {
+                endpoint: {
+                    "requests": len(values),
+                    "errors": self.errors[endpoint],
+                    "latency_ms": latency_summary(values),
+                }
+                for endpoint, values in self.latencies.items()
+            },
+        }
+        if items:
+            result["items"] = items
+            result["items_per_s"] = round(items / duration, 2) if duration else 0.0
+        return result
+
+
+async def login(base_url: str) -> httpx.AsyncClient:
+    """Клиент оператора с cookie сессии"""
+    client = httpx.AsyncClient(base_url=base_url, timeout=None)
+    response = await client.post(
+        "/api/v1/session/login",
+        data={"username": OPERATOR_LOGIN[0], "password": OPERATOR_LOGIN[1]},
+    )
+    response.raise_for_status()
+    client.cookies.set("ipa_session", response.json()["session_id"])
+    return client
+
+
+async def scenario_interactive(base_url: str, directory: FakeDirectory, args) -> Dict[str, Any]:
+    usernames = [uid for uid in directory.users if uid != OPERATOR_LOGIN[0]]
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    operators = [await login(base_url) for _ in range(args.operators)]
+
+    async def operator(client: httpx.AsyncClient, seed: int) -> None:
+        local_rng = random.Random(seed)
+        for _ in range(args.iterations):
+            target = local_rng.choice(usernames)
+            query = target.split(".")[-1][:5]
+            await recorder.call("GET /api/v1/users/search", client.get("/api/v1/users/search", params={"q": query}))
+            await recorder.call(
+                "POST /api/v1/users/{username}/reset-password",
+                client.post(f"/api/v1/users/{target}/reset-password"),
+            )
+
+    started = time.perf_counter()
+    await asyncio.gather(*(operator(client, rng.random()) for client in operators))
+    duration = time.perf_counter() - started
+    for client in operators:
+        await client.aclose()
+    return recorder.summary(duration)
+
+
+async def scenario_bulk_reset_yopass(base_url: str, directory: FakeDirectory, args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    users = [user for uid, user in directory.users.items() if uid != OPERATOR_LOGIN[0]]
+    selected = rng.sample(users, min(args.bulk_size, len(users)))
+    # Половина по username, половина по email - как в реальных списках
+    identifiers = [user["mail"][0] if index % 2 else user["uid"][0] for index, user in enumerate(selected)]
+
+    recorder = Recorder()
+    client = await login(base_url)
+    started = time.perf_counter()
+    response = await recorder.call(
+        "POST /api/v1/users/bulk-reset-password-with-yopass",
+        client.post(
+            "/api/v1/users/bulk-reset-password-with-yopass",
+            params={"send_email": "true"},
+            json=identifiers,
+        ),
+    )
+    duration = time.perf_counter() - started
+    await client.aclose()
+
+    result = recorder.summary(duration, items=len(identifiers))
+    if response is not None and response.status_code == 200:
+        body = response.json()
+        result["outcome"] = {key: len(value) for key, value in body.items() if isinstance(value, list)}
+    return result
+
+
+def make_users_workbook(rows: int, directory: FakeDirectory, seed: int) -> bytes:
+    """Excel в формате шаблона массового создания; ~5% строк конфликтуют с существующими"""
+    from benchmarks.fixtures import GROUPS, make_person
+
+    rng = random.Random(seed)
+    existing = list(directory.users.values())
+    taken: set[str] = set()
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["ФИО", "Email", "Телефон", "Должность", "Группы"])
+    for _ in range(rows):
+        if rng.random() < 0.05:
+            user = rng.choice(existing)
+            fio = user.get("cn", [""])[0]
+            email = user["mail"][0]
+        else:
+            person = make_person(rng, taken)
+            fio = person["fio"]
+            email = f"new.{person['email']}"
+        groups = ", ".join(rng.sample(GROUPS, rng.randint(0, 3)))
+        sheet.append([fio, email, f"+7 900 {rng.randint(100, 999)} 00 00", "Инженер", groups])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+async def scenario_validate_excel(base_url: str, directory: FakeDirectory, args) -> Dict[str, Any]:
+    content = make_users_workbook(args.excel_rows, directory, args.seed)
+    recorder = Recorder()
+    client = await login(base_url)
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        await recorder.call(
+            "POST /api/v1/users/validate-excel",
+            client.post(
+                "/api/v1/users/validate-excel",
+                files={"file": ("users.xlsx", content, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+            ),
+        )
+    duration = time.perf_counter() - started
+    await client.aclose()
+    result = recorder.summary(duration, items=args.excel_rows * args.repeat)
+    result["file_bytes"] = len(content)
+    return result
+
+
+SCENARIO_FUNCTIONS = {
+    "interactive": scenario_interactive,
+    "bulk-reset-yopass": scenario_bulk_reset_yopass,
+    "validate-excel": scenario_validate_excel,
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def configure_environment(ipa_port: int, smtp_port: int, yopass: str, state_dir: str) -> Dict[str, str]:
+    """Переменные окружения приложения для работы с заменами"""
+    return {
+        "IPA_HOST": f"127.0.0.1:{ipa_port}",
+        "YOPASS": yopass,
+        "YOPASS_URL": "https://yopass.example.com",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(smtp_port),
+        "SMTP_FROM": "helpdesk@example.com",
+        "SMTP_USE_TLS": "false",
+        "SMTP_USE_SSL": "false",
+        "SMTP_USERNAME": "",
+        "STATE_DB_PATH": os.path.join(state_dir, "conductor.db"),
+        "BULK_JOBS_DB_PATH": os.path.join(state_dir, "bulk_jobs.db"),
+        "LOG_LEVEL": "ERROR",
+        "PROFILING_ENABLED": "false",
+    }
+
+
+class InProcessServer:
+    """Приложение под uvicorn в фоновом потоке этого процесса"""
+
+    def __init__(self, port: int) -> None:
+        import uvicorn
+        from main import app
+
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self.server.run, name="app-under-test", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "InProcessServer":
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.should_exit = True
+        self._thread.join()
+
+
+def run_scenarios(base_url: str, ipa: FakeFreeIPA, smtp: FakeSMTP, args) -> Dict[str, Any]:
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        calls_before = dict(ipa.calls)
+        messages_before = smtp.messages
+        print(f"running {name}...", file=sys.stderr)
+        result = asyncio.run(SCENARIO_FUNCTIONS[name](base_url, ipa.directory, args))
+        result["ipa_calls"] = {
+            command: count - calls_before.get(command, 0)
+            for command, count in sorted(ipa.calls.items())
+            if count - calls_before.get(command, 0)
+        }
+        result["emails_sent"] = smtp.messages - messages_before
+        results[name] = result
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Сценарий, можно несколько раз (по умолчанию все)")
+    parser.add_argument("--url", help="Нагружать уже запущенный сервер вместо приложения в процессе")
+    parser.add_argument("--users", type=int, default=10000, help="Размер справочника FreeIPA")
+    parser.add_argument("--operators", type=int, default=30)
+    parser.add_argument("--iterations", type=int, default=20, help="Поисков и сбросов на оператора")
+    parser.add_argument("--bulk-size", type=int, default=2000)
+    parser.add_argument("--excel-rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=1, help="Повторов validate-excel")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ipa-latency-ms", type=float, default=2.0)
+    parser.add_argument("--ipa-jitter-ms", type=float, default=1.0)
+    parser.add_argument("--ipa-command-latency", action="append", default=[], metavar="CMD=MS")
+    parser.add_argument("--ipa-error-rate", type=float, default=0.0)
+    parser.add_argument("--yopass-latency-ms", type=float, default=20.0)
+    parser.add_argument("--smtp-latency-ms", type=float, default=5.0)
+    parser.add_argument("--ipa-port", type=int, default=0)
+    parser.add_argument("--smtp-port", type=int, default=0)
+    parser.add_argument("--output", help="Файл для JSON результата (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    state_dir = tempfile.mkdtemp(prefix="conductor-load-")
+    ipa_port = args.ipa_port or free_port()
+    smtp_port = args.smtp_port or free_port()
+    environment = configure_environment(ipa_port, smtp_port, write_fake_yopass(state_dir, args.yopass_latency_ms), state_dir)
+    if not args.url:
+        os.environ.update(environment)
+
+    from benchmarks.fakes.freeipa import FakeDirectory, FakeFreeIPA, FaultConfig, parse_command_latency
+    from benchmarks.fakes.smtp import FakeSMTP
+
+    faults = FaultConfig(
+        latency_ms=args.ipa_latency_ms,
+        jitter_ms=args.ipa_jitter_ms,
+        command_latency_ms=parse_command_latency(args.ipa_command_latency),
+        error_rate=args.ipa_error_rate,
+        seed=args.seed,
+    )
+    directory = FakeDirectory.seeded(args.users, args.seed)
+
+    with (
+        FakeFreeIPA(directory, faults, port=ipa_port) as ipa,
+        FakeSMTP(port=smtp_port, latency_ms=args.smtp_latency_ms) as smtp,
+    ):
+        if args.url:
+            print("Start the server with:", file=sys.stderr)
+            print(" ".join(f"{key}={value}" for key, value in environment.items()), file=sys.stderr)
+            input("Press Enter when the server is up...")
+            results = run_scenarios(args.url, ipa, smtp, args)
+        else:
+            with InProcessServer(free_port()) as server:
+                results = run_scenarios(server.url, ipa, smtp, args)
+
+    report = {
+        "config": {
+            key: value for key, value in vars(args).items()
+            if key not in ("output", "scenario")
+        },
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
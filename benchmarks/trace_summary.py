@@ -0,0 +1,87 @@
+"""
+Сводка по файлу трасс (TRACING_EXPORTER=file)
+
+Группирует span'ы по имени (для ipa.request - по команде FreeIPA) и считает
+количество, суммарное время, p50/p95/p99 - видно, какая стадия bulk операции
+занимает больше всего времени.
+
+Запуск:
+    uv run python -m benchmarks.trace_summary data/traces.jsonl
+    uv run python -m benchmarks.trace_summary data/traces.jsonl --trace <trace_id> --json
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List
+
+import orjson
+
+
+def read_spans(path: str, trace_id: str | None = None) -> Iterator[Dict[str, Any]]:
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            span = orjson.loads(line)
+            if trace_id is None or span["trace_id"] == trace_id:
+                yield span
+
+
+def span_key(span: Dict[str, Any]) -> str:
+    command = span["attributes"].get("command")
+    return f"{span['name']}:{command}" if command else span["name"]
+
+
+def percentile(values: List[float], q: float) -> float:
+    index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(spans: Iterator[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    durations: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    for span in spans:
+        key = span_key(span)
+        durations[key].append(span["duration_ms"])
+        if span["attributes"].get("outcome") == "error":
+            errors[key] += 1
+
+    rows = []
+    for key, values in durations.items():
+        values.sort()
+        rows.append({
+            "span": key,
+            "count": len(values),
+            "errors": errors[key],
+            "total_ms": round(sum(values), 3),
+            "p50_ms": percentile(values, 0.50),
+            "p95_ms": percentile(values, 0.95),
+            "p99_ms": percentile(values, 0.99),
+        })
+    return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--trace", help="Только span'ы одной трассы (X-Trace-Id ответа)")
+    parser.add_argument("--json", action="store_true", help="Вывести результат в JSON")
+    args = parser.parse_args()
+
+    rows = summarize(read_spans(args.path, args.trace))
+    if args.json:
+        json.dump(rows, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+
+    print(f"{'span':<40} {'count':>8} {'errors':>7} {'total ms':>12} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for row in rows:
+        print(
+            f"{row['span']:<40} {row['count']:>8} {row['errors']:>7} {row['total_ms']:>12.1f} "
+            f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
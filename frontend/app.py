@@ -1,11 +1,11 @@
 import streamlit as st
 import requests
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
-from io import BytesIO
-from typing import Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, List, Tuple
 from dotenv import load_dotenv
 import os
+import time
+import uuid
 
 load_dotenv()
 API_URL = os.getenv("API_URL")
@@ -29,6 +29,8 @@ for key, default in [
     ("search_results", None),
     ("search_action_result", None),
     ("show_passwords_mode", False),
+    ("bulk_job", None),
+    ("pwd_job_key", None),
 ]:
     if key not in st.session_state:
         st.session_state[key] = default
@@ -74,29 +76,15 @@ def get_cookies() -> dict:
     return {"ipa_session": st.session_state.session_cookie}
 
 
-def bulk_reset_with_yopass(identifiers: List[str], send_email: bool = False) -> Optional[dict]:
-    try:
-        response = requests.post(
-            f"{API_URL}/api/v1/users/bulk-reset-password-with-yopass",
-            json=identifiers,
-            params={"send_email": str(send_email).lower()},
-            cookies=get_cookies()
-        )
-        if response.ok:
-            return response.json()
-        st.error(f"Ошибка: {response.json().get('detail', 'Неизвестная ошибка')}")
-        return None
-    except Exception as e:
-        st.error(f"Ошибка: {e}")
-        return None
-
-
-def bulk_reset_plain(identifiers: List[str], send_email: bool = False) -> Optional[dict]:
+def bulk_reset_plain(identifiers: List[str], send_email: bool = False, preview_token: Optional[str] = None) -> Optional[dict]:
+    params = {"send_email": str(send_email).lower()}
+    if preview_token:
+        params["preview_token"] = preview_token
     try:
         response = requests.post(
             f"{API_URL}/api/v1/users/bulk-reset-password",
             json=identifiers,
-            params={"send_email": str(send_email).lower()},
+            params=params,
             cookies=get_cookies()
         )
         if response.ok:
@@ -157,38 +145,6 @@ def bulk_disable_preview_file(file) -> Optional[dict]:
         return None
 
 
-def bulk_disable_list(usernames: List[str]) -> Optional[dict]:
-    try:
-        response = requests.post(
-            f"{API_URL}/api/v1/users/bulk-disable",
-            json=usernames,
-            cookies=get_cookies()
-        )
-        if response.ok:
-            return response.json()
-        st.error(f"Ошибка: {response.json().get('detail', 'Неизвестная ошибка')}")
-        return None
-    except Exception as e:
-        st.error(f"Ошибка: {e}")
-        return None
-
-
-def bulk_enable_list(usernames: List[str]) -> Optional[dict]:
-    try:
-        response = requests.post(
-            f"{API_URL}/api/v1/users/bulk-enable",
-            json=usernames,
-            cookies=get_cookies()
-        )
-        if response.ok:
-            return response.json()
-        st.error(f"Ошибка: {response.json().get('detail', 'Неизвестная ошибка')}")
-        return None
-    except Exception as e:
-        st.error(f"Ошибка: {e}")
-        return None
-
-
 def get_groups() -> List[str]:
     try:
         response = requests.get(
@@ -273,10 +229,10 @@ def toggle_user_state(username: str, disable: bool) -> Optional[dict]:
         return None
 
 
-def bulk_create_from_excel(file) -> Optional[dict]:
+def validate_excel(file) -> Optional[dict]:
     try:
         response = requests.post(
-            f"{API_URL}/api/v1/users/bulk-create-from-excel",
+            f"{API_URL}/api/v1/users/validate-excel",
             files={"file": file},
             cookies=get_cookies()
         )
@@ -289,6 +245,107 @@ def bulk_create_from_excel(file) -> Optional[dict]:
         return None
 
 
+# === BULK JOBS ===
+# Bulk операция идёт в фоновом потоке: страница не блокируется, и операцию можно отменить
+
+@st.cache_resource
+def bulk_executor() -> ThreadPoolExecutor:
+    # Один пул на процесс Streamlit, а не на каждый перезапуск скрипта
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="bulk-job")
+
+
+def start_bulk_job(page: str, path: str, key: Optional[str] = None, **kwargs):
+    """Запускает bulk запрос в фоне; key - Idempotency-Key, по нему же операция отменяется"""
+    key = key or uuid.uuid4().hex
+    future = bulk_executor().submit(
+        requests.post,
+        f"{API_URL}{path}",
+        headers={"Idempotency-Key": key},
+        cookies=get_cookies(),
+        **kwargs
+    )
+    st.session_state.bulk_job = {"page": page, "key": key, "future": future, "cancelling": False}
+
+
+def bulk_job_running(page: str) -> bool:
+    job = st.session_state.bulk_job
+    return bool(job) and job["page"] == page and not job["future"].done()
+
+
+def take_bulk_result(page: str) -> Tuple[Optional[dict], Optional[str]]:
+    """Результат завершившейся bulk операции страницы и её ключ (забирается один раз)"""
+    job = st.session_state.bulk_job
+    if not job or job["page"] != page or not job["future"].done():
+        return None, None
+    st.session_state.bulk_job = None
+    try:
+        response = job["future"].result()
+        if response.ok:
+            return response.json(), job["key"]
+        st.error(f"Ошибка: {response.json().get('detail', 'Неизвестная ошибка')}")
+        return None, None
+    except Exception as e:
+        st.error(f"Ошибка: {e}")
+        return None, None
+
+
+def bulk_job_export(key: str, export_format: str) -> Callable[[], bytes]:
+    """
+    Загрузка результатов операции с сервера для st.download_button
+
+    Вызывается только по нажатию кнопки (в отдельном потоке), поэтому
+    cookie берутся заранее; файл собирает API, а не каждый перезапуск страницы
+    """
+    cookies = get_cookies()
+
+    def fetch() -> bytes:
+        response = requests.get(
+            f"{API_URL}/api/v1/bulk-jobs/{key}/export",
+            params={"format": export_format},
+            cookies=cookies,
+            timeout=120
+        )
+        response.raise_for_status()
+        return response.content
+
+    return fetch
+
+
+def cancel_bulk_job(key: str) -> bool:
+    try:
+        response = requests.post(
+            f"{API_URL}/api/v1/bulk-jobs/{key}/cancel",
+            cookies=get_cookies()
+        )
+        if response.ok:
+            return True
+        st.warning(f"Не удалось отменить: {response.json().get('detail', 'Неизвестная ошибка')}")
+        return False
+    except Exception as e:
+        st.error(f"Ошибка: {e}")
+        return False
+
+
+@st.fragment(run_every=1)
+def render_bulk_job_progress(page: str, label: str):
+    # Фрагмент перерисовывается раз в секунду сам по себе, остальная страница не перезапускается
+    job = st.session_state.bulk_job
+    if not job or job["page"] != page:
+        return
+    if job["future"].done():
+        # Результат забирает страница (take_bulk_result)
+        st.rerun()
+    if job["cancelling"]:
+        st.info(f"⏳ {label} Отменяем: начатые доделываются, новые не обрабатываются...")
+        return
+    st.info(f"⏳ {label}")
+    if st.button("Отменить", use_container_width=True, key=f"{page}_cancel_btn"):
+        job["cancelling"] = cancel_bulk_job(job["key"])
+        # Дать прочитать предупреждение, если отменить не вышло
+        time.sleep(0 if job["cancelling"] else 2)
+        st.rerun(scope="fragment")
+
+
 # === HELPERS ===
 
 def parse_textarea(text: str) -> List[str]:
@@ -318,6 +375,20 @@ def render_email_delivery_result(email: str, sent: bool, error: Optional[str] =
         st.warning(f"📭 Письмо не отправлено: {error}")
 
 
+def render_merged(merged: List[dict]):
+    for entry in merged:
+        st.info(f"🔁 `{entry['identifier']}` — повтор `{entry['merged_into']}`, выполняется один раз")
+
+
+def render_cancelled(cancelled: List[dict]):
+    if not cancelled:
+        return
+    st.warning(f"⏹ Операция отменена: не выполнено для {len(cancelled)}")
+    with st.expander("Не выполнено"):
+        for entry in cancelled:
+            st.markdown(f"- `{entry['identifier']}`" if "identifier" in entry else f"- Строка {entry['row']}: {entry['fio']}")
+
+
 def render_resolution_preview(preview: dict, action_summary: str):
     col1, col2, col3 = st.columns(3)
     col1.metric("Всего в списке", preview["total"])
@@ -328,67 +399,35 @@ def render_resolution_preview(preview: dict, action_summary: str):
         st.success(f"✅ `{user['identifier']}` → **{user['username']}**")
     for user in preview["not_found"]:
         st.error(f"❌ `{user['identifier']}` — {user['error']}")
+    render_merged(preview.get("merged", []))
 
     if preview["found_count"] > 0:
         st.info(action_summary)
 
 
-def build_reset_excel(result: dict) -> bytes:
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Сброс паролей"
-
-    headers = ["Username", "Email", "Yopass ссылка", "Пароль", "Статус"]
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.fill = PatternFill(start_color="2E4057", end_color="2E4057", fill_type="solid")
-        cell.alignment = Alignment(horizontal="center")
-
-    row = 2
-    for user in result["success"]:
-        yopass_link = user.get("yopass_link", "")
-        ws.cell(row=row, column=1, value=user["username"])
-        ws.cell(row=row, column=2, value=user.get("email", ""))
-        ws.cell(row=row, column=3, value=yopass_link)
-        ws.cell(row=row, column=4, value=user.get("password", "") if not yopass_link else "")
-        ws.cell(row=row, column=5, value="Успешно")
-        row += 1
-
-    for user in result["failed"]:
-        ws.cell(row=row, column=1, value=user["identifier"])
-        ws.cell(row=row, column=2, value="")
-        ws.cell(row=row, column=3, value="")
-        ws.cell(row=row, column=4, value="")
-        ws.cell(row=row, column=5, value=f"Ошибка: {user['error']}")
-        row += 1
-
-    ws.column_dimensions["A"].width = 22
-    ws.column_dimensions["B"].width = 32
-    ws.column_dimensions["C"].width = 85
-    ws.column_dimensions["D"].width = 22
-    ws.column_dimensions["E"].width = 20
-
-    buf = BytesIO()
-    wb.save(buf)
-    return buf.getvalue()
-
-
-def show_reset_results(result: dict):
+def show_reset_results(result: dict, job_key: Optional[str] = None):
     total = len(result["success"]) + len(result["failed"])
     col1, col2, col3 = st.columns(3)
     col1.metric("Всего", total)
     col2.metric("Успешно", len(result["success"]))
     col3.metric("Ошибок", len(result["failed"]))
 
-    if result["success"]:
-        st.download_button(
+    if result["success"] and job_key:
+        col1, col2 = st.columns(2)
+        col1.download_button(
             label="Скачать Excel с результатами",
-            data=build_reset_excel(result),
+            data=bulk_job_export(job_key, "xlsx"),
             file_name="password_reset_results.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             use_container_width=True
         )
+        col2.download_button(
+            label="Скачать CSV",
+            data=bulk_job_export(job_key, "csv"),
+            file_name="password_reset_results.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
 
     st.markdown("---")
     for idx, user in enumerate(result["success"]):
@@ -414,6 +453,8 @@ def show_reset_results(result: dict):
             )
     for fail in result["failed"]:
         st.error(f"❌ **{fail['identifier']}** — {fail['error']}")
+    render_merged(result.get("merged", []))
+    render_cancelled(result.get("cancelled", []))
 
 
 # === PAGES ===
@@ -472,22 +513,32 @@ def page_passwords():
                 help="Если у пользователя указан email и SMTP настроен, письмо уйдет автоматически"
             )
             st.session_state.show_passwords_mode = skip_yopass
-            if st.button("Сбросить пароли", use_container_width=True, key="pwd_reset_btn", type="primary"):
+            if st.button(
+                "Сбросить пароли", use_container_width=True, key="pwd_reset_btn", type="primary",
+                disabled=st.session_state.bulk_job is not None,
+            ):
                 identifiers = [u["identifier"] for u in preview["found"]]
-                with st.spinner("Сбрасываем пароли..."):
-                    if skip_yopass:
-                        result = bulk_reset_plain(identifiers, send_email=send_email)
-                    else:
-                        result = bulk_reset_with_yopass(identifiers, send_email=send_email)
-                if result:
-                    st.session_state.pwd_results = result
-                    st.session_state.pwd_preview = None
-                    st.rerun()
+                params = {"send_email": str(send_email).lower()}
+                # Токен превью: сервер не ищет пользователей второй раз
+                if preview.get("preview_token"):
+                    params["preview_token"] = preview["preview_token"]
+                path = "/api/v1/users/bulk-reset-password" if skip_yopass else "/api/v1/users/bulk-reset-password-with-yopass"
+                start_bulk_job("pwd", path, json=identifiers, params=params)
+                st.rerun()
+
+    if bulk_job_running("pwd"):
+        render_bulk_job_progress("pwd", "Сбрасываем пароли...")
+    result, job_key = take_bulk_result("pwd")
+    if result:
+        st.session_state.pwd_results = result
+        st.session_state.pwd_job_key = job_key
+        st.session_state.pwd_preview = None
+        st.rerun()
 
     # Шаг 2: показываем результаты
     if st.session_state.pwd_results:
         st.markdown("---")
-        show_reset_results(st.session_state.pwd_results)
+        show_reset_results(st.session_state.pwd_results, st.session_state.pwd_job_key)
 
 
 def page_state_management():
@@ -543,16 +594,28 @@ def page_state_management():
         )
 
         if preview["found_count"] > 0:
-            if st.button(btn_label, use_container_width=True, key="state_exec_btn", type="primary"):
+            if st.button(
+                btn_label, use_container_width=True, key="state_exec_btn", type="primary",
+                disabled=st.session_state.bulk_job is not None,
+            ):
                 usernames = [u["username"] for u in preview["found"]]
-                spinner_text = "Блокируем..." if is_disable else "Разблокируем..."
-                with st.spinner(spinner_text):
-                    result = bulk_disable_list(usernames) if is_disable else bulk_enable_list(usernames)
-                if result:
-                    st.session_state.state_results = result
-                    st.session_state.state_mode_used_exec = mode
-                    st.session_state.state_preview = None
-                    st.rerun()
+                preview_token = preview.get("preview_token")
+                start_bulk_job(
+                    "state",
+                    "/api/v1/users/bulk-disable" if is_disable else "/api/v1/users/bulk-enable",
+                    json=usernames,
+                    params={"preview_token": preview_token} if preview_token else None,
+                )
+                st.session_state.state_mode_used_exec = mode
+                st.rerun()
+
+    if bulk_job_running("state"):
+        render_bulk_job_progress("state", "Блокируем..." if is_disable else "Разблокируем...")
+    result, _ = take_bulk_result("state")
+    if result:
+        st.session_state.state_results = result
+        st.session_state.state_preview = None
+        st.rerun()
 
     # Показываем итоговый результат
     if st.session_state.state_results:
@@ -573,6 +636,8 @@ def page_state_management():
             st.warning(f"⚠️ **{u['username']}** — {u['note']}")
         for u in result["failed"]:
             st.error(f"❌ **{u['identifier']}** — {u['error']}")
+        render_merged(result.get("merged", []))
+        render_cancelled(result.get("cancelled", []))
 
 
 def page_create_single():
@@ -631,23 +696,61 @@ def page_create_excel():
     uploaded_file = st.file_uploader("Excel файл", type=["xlsx"], key="create_excel_file")
 
     if uploaded_file is not None:
-        if st.button("Создать пользователей", use_container_width=True, key="create_excel_btn"):
-            with st.spinner("Создаём пользователей..."):
-                result = bulk_create_from_excel(uploaded_file)
-
-            if result:
-                col1, col2 = st.columns(2)
-                col1.metric("Создано", len(result["success"]))
-                col2.metric("Ошибок", len(result["failed"]))
-                st.markdown("---")
-                for idx, user in enumerate(result["success"]):
-                    c1, c2 = st.columns([1, 2])
-                    with c1:
-                        st.success(f"✅ **{user['username']}**\n{user['email']}")
-                    with c2:
-                        render_yopass_result(user["yopass_link"], key=f"create_yopass_{idx}")
-                for fail in result["failed"]:
-                    st.error(f"❌ Строка {fail['row']}: {fail['error']}")
+        # Проверка сохраняет план на сервере: создание по нему не проверяет файл заново
+        if st.button("Проверить файл", use_container_width=True, key="validate_excel_btn"):
+            with st.spinner("Проверяем файл..."):
+                check = validate_excel(uploaded_file)
+            if check:
+                st.session_state.create_plan = {"file_id": uploaded_file.file_id, "token": check.get("plan_token")}
+                st.info(f"Будет создано: {check['would_create']} · Конфликтов: {check['conflicts_count']}")
+                for conflict in check["conflicts"]:
+                    st.warning(f"Строка {conflict['row']}: {conflict['error']}")
+
+        plan = st.session_state.get("create_plan") or {}
+        plan_token = plan.get("token") if plan.get("file_id") == uploaded_file.file_id else None
+
+        # Один ключ на загруженный файл: повторное нажатие после обрыва или отмены
+        # продолжает создание с места остановки, а не создаёт пользователей второй раз
+        job = st.session_state.get("create_job") or {}
+        if job.get("file_id") != uploaded_file.file_id:
+            job = {"file_id": uploaded_file.file_id, "key": uuid.uuid4().hex}
+            st.session_state.create_job = job
+
+        if st.button(
+            "Создать пользователей", use_container_width=True, key="create_excel_btn",
+            disabled=st.session_state.bulk_job is not None,
+        ):
+            st.session_state.create_results = None
+            start_bulk_job(
+                "create",
+                "/api/v1/users/bulk-create-from-excel",
+                key=job["key"],
+                params={"plan_token": plan_token} if plan_token else None,
+                files={"file": (uploaded_file.name, uploaded_file.getvalue())},
+            )
+            st.rerun()
+
+    if bulk_job_running("create"):
+        render_bulk_job_progress("create", "Создаём пользователей...")
+    result, _ = take_bulk_result("create")
+    if result:
+        st.session_state.create_results = result
+
+    result = st.session_state.get("create_results")
+    if result:
+        col1, col2 = st.columns(2)
+        col1.metric("Создано", len(result["success"]))
+        col2.metric("Ошибок", len(result["failed"]))
+        st.markdown("---")
+        for idx, user in enumerate(result["success"]):
+            c1, c2 = st.columns([1, 2])
+            with c1:
+                st.success(f"✅ **{user['username']}**\n{user['email']}")
+            with c2:
+                render_yopass_result(user["yopass_link"], key=f"create_yopass_{idx}")
+        for fail in result["failed"]:
+            st.error(f"❌ Строка {fail['row']}: {fail['error']}")
+        render_cancelled(result.get("cancelled", []))
 
 
 def page_reports():
@@ -4,11 +4,19 @@ from app.routes import setup_routes
 setup_routes(app)
 
 if __name__ == "__main__":
-    import uvicorn
-    
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8080,
-        reload=True
-    )
\ No newline at end of file
+    from app.config import APP_ENV, SERVER_HOST, SERVER_PORT
+
+    if APP_ENV == "development":
+        import uvicorn
+
+        # reload только для разработки: один процесс, перезапуск при изменении кода
+        uvicorn.run(
+            "main:app",
+            host=SERVER_HOST,
+            port=SERVER_PORT,
+            reload=True
+        )
+    else:
+        from app.server import run
+
+        run(app)
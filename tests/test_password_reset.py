@@ -0,0 +1,90 @@
+"""
+Повтор bulk сброса паролей по контрольной точке
+
+Запуск: python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("BULK_JOBS_DB_PATH", os.path.join(tempfile.mkdtemp(), "bulk_jobs.db"))
+
+from app.services import password_reset  # noqa: E402
+from app.services.checkpoints import Checkpoint, CheckpointStore  # noqa: E402
+
+USERS = {"ivan": "ivan", "ivan@example.com": "ivan", "petr": "petr"}
+
+
+class FakeClient:
+    """FreeIPA клиент, который умеет только user_mod --random и считает вызовы"""
+
+    def __init__(self) -> None:
+        self.user_mod = []
+
+    def _request(self, method, args=None, params=None):
+        assert method == "user_mod", method
+        username = args[0]
+        self.user_mod.append(username)
+        return {"result": {
+            "uid": [username],
+            "mail": [f"{username}@example.com"],
+            "randompassword": f"secret-{len(self.user_mod)}",
+        }}
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = CheckpointStore(os.path.join(tempfile.mkdtemp(), "jobs.db"))
+        self.client = FakeClient()
+        patches = [
+            mock.patch.object(password_reset, "get_ipa_domain", return_value=""),
+            mock.patch.object(password_reset, "resolve_username", side_effect=lambda client, i: USERS[i]),
+            mock.patch.object(password_reset, "create_yopass_link", side_effect=lambda login, password: f"link-{password}"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def attempt(self, identifiers, with_links=True):
+        saved = self.store.begin("admin", "key", "bulk-reset-password", "fingerprint")
+        results = {"success": [], "failed": [], "merged": []}
+        with Checkpoint(self.store, "admin", "key", saved) as checkpoint:
+            password_reset.reset_passwords(
+                self.client, identifiers, "test", results, with_links=with_links, checkpoint=checkpoint
+            )
+        return results
+
+    def test_resume_does_not_reset_finished_user_again(self) -> None:
+        # Первая попытка успела закончить только username
+        self.attempt(["ivan"])
+        self.assertEqual(self.client.user_mod, ["ivan"])
+
+        results = self.attempt(["ivan", "ivan@example.com"])
+
+        self.assertEqual(self.client.user_mod, ["ivan"])
+        self.assertEqual([entry["identifier"] for entry in results["success"]], ["ivan"])
+        self.assertEqual(
+            results["merged"], [{"identifier": "ivan@example.com", "username": "ivan", "merged_into": "ivan"}]
+        )
+
+    def test_replay_without_links_resets_again(self) -> None:
+        first = self.attempt(["ivan", "petr"], with_links=False)
+        replay = self.attempt(["ivan", "petr"], with_links=False)
+
+        self.assertEqual(self.client.user_mod, ["ivan", "petr", "ivan", "petr"])
+        self.assertTrue(all(entry["password"] for entry in first["success"] + replay["success"]))
+
+    def test_replay_with_links_does_not_reset_again(self) -> None:
+        first = self.attempt(["ivan", "petr"])
+        replay = self.attempt(["ivan", "petr"])
+
+        self.assertEqual(sorted(self.client.user_mod), ["ivan", "petr"])
+        self.assertEqual(
+            [entry["yopass_link"] for entry in replay["success"]],
+            [entry["yopass_link"] for entry in first["success"]],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()